@@ -1,7 +1,8 @@
 from sympy import Basic, Idx, IndexedBase, Lambda
 from sympy.utilities.lambdify import lambdastr
-from typing import Union, List, Dict
+from typing import Union, List, Dict, ClassVar
 from itertools import count
+from collections import OrderedDict
 import re
 
 from types import FunctionType, LambdaType, CodeType
@@ -15,6 +16,38 @@ import numpy as np
 
 IMPORT_VALS = ["import numpy as np", "from fxpmath import Fxp"]
 flex_param_cnt = count()
+# Functions compiled from FlexParam strings, keyed by their lambda source, i.e., their argument names and body.
+# The least recently used functions are evicted once the cache holds FN_CACHE_SIZE functions.
+FN_CACHE_SIZE = 4096
+_FN_CACHE: 'OrderedDict[str, LambdaType]' = OrderedDict()
+
+
+def compile_lambda(fn_code_str: str) -> LambdaType:
+    if fn_code_str in _FN_CACHE:
+        _FN_CACHE.move_to_end(fn_code_str)
+        FlexParam.fn_cache_hits += 1
+        return _FN_CACHE[fn_code_str]
+    FlexParam.fn_cache_misses += 1
+    fn_code = compile(fn_code_str, "<string>", "exec")
+    assert 'np' in globals()
+    fn = LambdaType(fn_code.co_consts[0], globals())
+    _FN_CACHE[fn_code_str] = fn
+    if len(_FN_CACHE) > FN_CACHE_SIZE:
+        _FN_CACHE.popitem(last=False)
+    return fn
+
+
+def fn_cache_info() -> Dict[str, Union[int, float]]:
+    lookups = FlexParam.fn_cache_hits + FlexParam.fn_cache_misses
+    return {"hits": FlexParam.fn_cache_hits, "misses": FlexParam.fn_cache_misses, "size": len(_FN_CACHE),
+            "hit_rate": FlexParam.fn_cache_hits / lookups if lookups > 0 else 0.0}
+
+
+def clear_fn_cache():
+    _FN_CACHE.clear()
+    FlexParam.fn_cache_hits = 0
+    FlexParam.fn_cache_misses = 0
+
 
 @dataclass
 class FlexParam:
@@ -28,6 +61,10 @@ class FlexParam:
     dtype_cast_func: FunctionType = field(default=int)
     _value: Union[str, int] = field(default=None, init=False)
     flex_id: int = field(default_factory=lambda: next(flex_param_cnt))
+    # Total number of evaluations and function cache lookups in this process, used by the compilation profiler
+    eval_count: ClassVar[int] = 0
+    fn_cache_hits: ClassVar[int] = 0
+    fn_cache_misses: ClassVar[int] = 0
 
     def __post_init__(self):
 
@@ -56,15 +93,13 @@ class FlexParam:
 
     def create_static_from_str(self, fn_body):
         self.fn_code_str = f"lambda: {fn_body}"
-        self.fn_code = compile(self.fn_code_str, "<string>", "exec")
-        assert 'np' in globals()
-        self.fn = LambdaType(self.fn_code.co_consts[0], globals())
+        self.fn = compile_lambda(self.fn_code_str)
+        self.fn_code = self.fn.__code__
 
     def create_function_from_str(self, arg_names, fn_body):
         self.fn_code_str = f"lambda {','.join(arg_names)}: {fn_body}"
-        self.fn_code = compile(self.fn_code_str, "<string>", "exec")
-        assert 'np' in globals()
-        self.fn = LambdaType(self.fn_code.co_consts[0], globals())
+        self.fn = compile_lambda(self.fn_code_str)
+        self.fn_code = self.fn.__code__
 
     @property
     def value(self):
@@ -109,6 +144,7 @@ class FlexParam:
                                f"Input argument types: {[type(ia) for ia in fn_args]}")
 
         # TODO: Important--> this assumes that iter_args are iterated over in the correct order
+        FlexParam.eval_count += 1
         try:
             import numpy as np
             result = self.fn(*(fn_args))
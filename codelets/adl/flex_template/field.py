@@ -107,8 +107,9 @@ class Field(object):
         param_fn_args = tuple(param_fn_args)
 
         result = self.param_fn.evaluate_fn(*param_fn_args)
+        return self.set_value_from_result(result)
 
-
+    def set_value_from_result(self, result):
         if isinstance(result, str) and result in self.value_names:
             self.value = self.value_names[result]
             self.value_str = result
@@ -148,10 +149,13 @@ class Field(object):
             # assert len(bin_rep) == self.bitwidth
             return f"{bin_rep}"
 
-    def copy(self):
-
-
-        flex_param = None if not self.param_fn else self.param_fn.copy()
+    def copy(self, copy_param=True):
+        if not self.param_fn:
+            flex_param = None
+        elif copy_param:
+            flex_param = self.param_fn.copy()
+        else:
+            flex_param = self.param_fn
 
         field = Field(self.field_name, self.bitwidth, field_id=self.field_id, value=self.value, value_names=self.value_names.copy(),
                      value_str=self.value_str, param_fn_type=self.param_fn_type, lazy_eval=self.lazy_eval, param_fn=flex_param)
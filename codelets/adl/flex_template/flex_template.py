@@ -1,17 +1,22 @@
+import re
 from typing import List, Union
 from dataclasses import dataclass, field
 from .instruction import Instruction
+from .instruction_buffer import InstructionBuffer
 from codelets.adl.flex_param import FlexParam
 from .compiler_side_effect import SideEffect
+from .template_compiler import get_compiled_template
 from time import time
 
 DEFAULT_TEMPLATE_ARGS = Instruction.DEFAULT_FN_ARGS + ["template"]
 NUM_OP_FN_ARGS = 6
+# Evaluate templates using generated functions with the FlexParam bodies inlined, instead of interpreting them
+COMPILE_TEMPLATES = True
 
 @dataclass
 class FlexTemplate:
     base_instructions: List[Instruction]
-    instructions: List[Instruction] = field(default_factory=list)
+    instructions: InstructionBuffer = field(default=None)
     conditional: FlexParam = field(default=None)
     side_effect_args: List[str] = field(default_factory=list)
     side_effects: List[SideEffect] = field(default_factory=list)
@@ -27,6 +32,8 @@ class FlexTemplate:
             self.base_instructions = [self.base_instructions]
         assert self.template_type in Instruction.INSTR_TYPE_ARGS
         self.arg_names = Instruction.INSTR_TYPE_ARGS[self.template_type].copy()
+        if self.instructions is None:
+            self.instructions = InstructionBuffer(self.base_instructions)
 
     def add_side_effect_param(self, name: str,  scope: str, init_val: Union[str, int], side_effect_str):
         if scope not in ['codelet', 'program', 'operation']:
@@ -103,7 +110,8 @@ class FlexTemplate:
         return self.base_instructions[index]
 
     def add_instruction(self, instruction: Instruction):
-        self.instructions.append(instruction)
+        base_idx = [bi.opname for bi in self.base_instructions].index(instruction.opname)
+        self.instructions.append(base_idx, instruction)
 
     def add_condition(self, condition_str: str):
         base_args = self.get_flex_arg_names(include_instruction=self.template_type in ["instruction", "codelet"])
@@ -141,21 +149,62 @@ class FlexTemplate:
     def base_instr_str(self):
         return '\n'.join([str(instr) for instr in self.base_instructions])
 
-    def set_instructions(self, instruction_list: List[Instruction]):
+    def set_instructions(self, instructions: InstructionBuffer):
         if len(self.instructions) > 0:
             raise RuntimeError(f"Instructions have already been evaluated!:\n"
                                f"Base instructions: {self.base_instr_str()}")
-        self.instructions = instruction_list
+        self.instructions = instructions
 
     def evaluate(self, program, hag, op_idx, cdlt_id):
 
         fn_args = self.create_fn_args(program, hag, op_idx, cdlt_id)
-        instructions = self.evaluate_iterable_instructions(fn_args, 0, {})
+        compiled_fn = get_compiled_template(self) if COMPILE_TEMPLATES else None
+        if compiled_fn is not None:
+            se_values = [se.value for se in self.side_effects]
+            try:
+                instructions = compiled_fn(fn_args)
+            except Exception as e:
+                # The interpreted evaluation is used to report the failing FlexParam. If it succeeds, the compiled
+                # template does not match the interpreter, and its error is raised instead of being ignored
+                for se, value in zip(self.side_effects, se_values):
+                    se.value = value
+                self.evaluate_iterable_instructions(fn_args, 0, {})
+                raise RuntimeError(f"Compiled template failed, but its interpreted evaluation succeeded:\n"
+                                   f"Base instructions: {self.base_instr_str()}") from e
+        else:
+            instructions = self.evaluate_iterable_instructions(fn_args, 0, {})
         self.set_instructions(instructions)
 
     def lazy_evaluate(self, program, hag, op_idx, cdlt_id):
+        # Only the lazy fields recorded while generating instructions are evaluated, using the iterator and side
+        # effect values captured for each instruction, so iterables and conditions are not evaluated again
+        if len(self.instructions.lazy_fields) == 0:
+            return
         fn_args = self.create_fn_args(program, hag, op_idx, cdlt_id)
-        self.lazy_evaluate_iterable_instructions(fn_args, 0, {}, 0)
+        lazy_fields = {}
+        for row, f_idx, field_args in self.instructions.lazy_fields:
+            base_idx = self.instructions.base_index(row)
+            if (base_idx, f_idx) not in lazy_fields:
+                lazy_fields[(base_idx, f_idx)] = self.create_lazy_field(base_idx, f_idx)
+            f, arg_idx, uses_instruction = lazy_fields[(base_idx, f_idx)]
+            instruction = self.instructions.scratch_instruction(row) if uses_instruction else None
+            param_args = fn_args + (instruction,) + tuple(field_args[i] for i in arg_idx)
+            f.set_value_from_result(f.param_fn.evaluate_fn(*param_args))
+            self.instructions.set_field(row, f_idx, f)
+            base_field = self.base_instructions[base_idx].fields[f_idx]
+            f._value, f.value_str = base_field.value, base_field.value_str
+
+    def create_lazy_field(self, base_idx, f_idx):
+        # Lazy field functions are created once for each base instruction field, with the iterator and side effect
+        # names appended to their arguments as in Field.set_value_from_param_fn
+        f = self.base_instructions[base_idx].fields[f_idx].copy()
+        arg_idx = []
+        for i, name in enumerate(self.iter_args + self.side_effect_args):
+            if name not in f.param_fn.fn_args:
+                f.param_fn.add_fn_arg(name)
+                arg_idx.append(i)
+        uses_instruction = re.search(r"\binstruction\b", f.param_fn.fn_body_str) is not None
+        return f, arg_idx, uses_instruction
 
 
     def set_field_by_name(self, field_name, field_value, instr_name=None):
@@ -227,26 +276,42 @@ class FlexTemplate:
             base_instr = self.get_base_instr_by_index(instr_name)
         base_instr.set_field_value(field_name, value, value_str=value_str)
 
-    def evaluate_instr_len(self, idx, fn_args, instr_size):
-        if len(self.iterables) < idx:
-            iterable = self.iterables[idx].evaluate_fn(*fn_args)
-            for i in iterable:
-                fn_args_i = fn_args + (i,)
-                instr_size += self.evaluate_instr_len(idx + 1, fn_args_i, instr_size)
-        else:
-            instr_size += 1
-
-        return instr_size
+    def count_iterable_instructions(self, fn_args: tuple, iter_idx: int, iter_args: dict) -> int:
+        # Evaluates only the iterables, conditions, and side effects of the template, which determine the number of
+        # instructions generated by `evaluate_iterable_instructions`
+        if iter_idx >= len(self.iterables):
+            num_instructions = 0
+            for bi in self.base_instructions:
+                cond_args = fn_args + (bi,) if self.template_type in ["instruction", "codelet"] else fn_args
+                if self.evaluate_conditional(cond_args, iter_args):
+                    num_instructions += 1
+                    self.evaluate_side_effects(fn_args, iter_args)
+            return num_instructions
+
+        if self.conditional is None and len(self.side_effects) == 0:
+            # Iterables only depend on the template arguments, so the count is the product of their lengths
+            num_instructions = len(self.base_instructions)
+            for iterable_fnc in self.iterables[iter_idx:]:
+                if num_instructions == 0:
+                    break
+                iterable = iterable_fnc.evaluate_fn(*fn_args)
+                num_instructions *= len(iterable) if hasattr(iterable, "__len__") else len(list(iterable))
+            return num_instructions
+
+        num_instructions = 0
+        for i in self.iterables[iter_idx].evaluate_fn(*fn_args):
+            iter_args[self.iter_args[iter_idx]] = i
+            num_instructions += self.count_iterable_instructions(fn_args, iter_idx + 1, iter_args)
+        return num_instructions
 
     def set_instruction_length(self, program, hag, op_idx, cdlt_id):
-        instr_size = 0
         fn_args = self.create_fn_args(program, hag, op_idx, cdlt_id)
-
-        for idx in range(len(self.iterables)):
-            iterable = self.iterables[idx].evaluate_fn(*fn_args)
-            instr_size *= len(iterable)
-        self.num_instructions = instr_size
-        # self.num_instructions = self.evaluate_instr_len(0, fn_args, instr_size)
+        # Side effects are restored after counting, so that they have their initial values during evaluation
+        se_values = [se.value for se in self.side_effects]
+        self.num_instructions = self.count_iterable_instructions(fn_args, 0, {})
+        for se, value in zip(self.side_effects, se_values):
+            se.value = value
+        return self.num_instructions
 
     def evaluate_conditional(self, fn_args, iter_args):
 
@@ -272,11 +337,13 @@ class FlexTemplate:
     def current_sideeffects(self):
         return {se.name: se.value for se in self.side_effects}
 
-    def evaluate_iterable_instructions(self, fn_args: tuple, iter_idx: int, iter_args: dict):
-        instructions = []
+    def evaluate_iterable_instructions(self, fn_args: tuple, iter_idx: int, iter_args: dict,
+                                       instructions: InstructionBuffer = None):
+        if instructions is None:
+            instructions = InstructionBuffer(self.base_instructions)
 
         if iter_idx >= len(self.iterables):
-            for bi in self.base_instructions:
+            for bi_idx, bi in enumerate(self.base_instructions):
                 instruction = bi.instruction_copy()
                 if self.template_type in ["instruction", "codelet"]:
                     cond_args = fn_args + (instruction,)
@@ -288,7 +355,10 @@ class FlexTemplate:
                     instruction.evaluate_fields(fn_args, field_args)
                     num_tabs = self.evaluate_tabs(fn_args, iter_args)
                     instruction.set_tabs(num_tabs)
-                    instructions.append(instruction)
+                    instructions.append(bi_idx, instruction)
+                    for f_idx, f in enumerate(instruction.fields):
+                        if f.lazy_eval:
+                            instructions.add_lazy_field(len(instructions) - 1, f_idx, tuple(field_args.values()))
                     self.evaluate_side_effects(fn_args, iter_args)
         else:
             iter_arg_name = self.iter_args[iter_idx]
@@ -299,37 +369,10 @@ class FlexTemplate:
 
             for i in iterable:
                 iter_args[iter_arg_name] = i
-                instructions += self.evaluate_iterable_instructions(fn_args, iter_idx, iter_args)
+                self.evaluate_iterable_instructions(fn_args, iter_idx, iter_args, instructions)
 
         return instructions
 
-    def lazy_evaluate_iterable_instructions(self, fn_args: tuple, iter_idx: int, iter_args: dict, instr_idx: int):
-
-        if len(self.instructions) <= instr_idx:
-            return instr_idx
-        elif iter_idx >= len(self.iterables):
-            for bi_idx in range(len(self.base_instructions)):
-                bi_instr = self.base_instructions[bi_idx]
-                condition = self.evaluate_conditional(fn_args + (bi_instr,), iter_args)
-
-                if condition:
-                    instruction = self.instructions[instr_idx]
-                    field_args = dict(list(iter_args.items()) + list(self.current_sideeffects().items()))
-                    instruction.evaluate_lazy_fields(fn_args, field_args)
-                    self.evaluate_side_effects(fn_args, iter_args)
-                    instr_idx += 1
-        else:
-            iter_arg_name = self.iter_args[iter_idx]
-            iterable_fnc = self.iterables[iter_idx]
-            # TODO: Add checks for validation here
-            iterable = iterable_fnc.evaluate_fn(*fn_args)
-            iter_idx += 1
-
-            for i in iterable:
-                iter_args[iter_arg_name] = i
-                instr_idx = self.lazy_evaluate_iterable_instructions(fn_args, iter_idx, iter_args, instr_idx)
-        return instr_idx
-
     def template_copy(self):
         return FlexTemplate([bi.instruction_copy() for bi in self.base_instructions],
                             side_effects=[v.copy() for v in self.side_effects],
@@ -359,13 +402,7 @@ class FlexTemplate:
             return []
 
         assert len(self.instructions) > 0
-        instr_strings = []
-        for i in self.instructions:
-            instr = i.emit(output_type)
-
-            instr_strings.append(instr)
-
-        return instr_strings
+        return self.instructions.emit(output_type)
 
     def update_template_type(self, tmplt_type):
         if tmplt_type != self.template_type:
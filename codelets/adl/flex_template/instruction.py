@@ -133,14 +133,27 @@ class Instruction(object):
     def opname(self):
         return self._opname
 
-    def instruction_copy(self):
-        fields = [f.copy() for f in self.fields]
-        instr = Instruction(self.opname, self.opcode, self.opcode_width, fields,
-                            target=self.target,
-                            field_values=self.field_values,
-                            latency=self.latency,
-                            format_str_fn=self.format_str_fn
-                            )
+    def instruction_copy(self, copy_params=True):
+        # Compiled templates share the FlexParams of eagerly evaluated fields with the base instruction, as they are
+        # only read. Lazily evaluated fields add arguments to their FlexParam, so they are always copied.
+        fields = [f.copy(copy_param=copy_params or f.lazy_eval) for f in self.fields]
+        # The base instruction has already been validated, so the copy skips the checks in __init__
+        instr = Instruction.__new__(Instruction)
+        instr._str_output_supported = True
+        instr._num_output_supported = True
+        instr._instr_type = "instruction"
+        instr._format_str_fn = self.format_str_fn
+        instr._opname = self.opname
+        instr._opcode = self.opcode
+        instr._opcode_width = self.opcode_width
+        instr._extra_params = {}
+        instr._latency = self.latency
+        instr._target = self.target
+        instr._fields = fields
+        instr._field_values = self.field_values or {}
+        instr._field_map = {f.field_name: f for f in fields}
+        instr._instr_length = self.instr_length
+        instr._tabs = None
         return instr
 
     def __str__(self):
@@ -0,0 +1,164 @@
+from array import array
+from typing import List
+import numpy as np
+from .instruction import Instruction
+
+# Field values are non-negative, so -1 marks fields which have not been evaluated
+UNSET_VALUE = -1
+NO_VALUE_STR = -1
+MAX_WORD_BITS = 64
+
+
+class InstructionBuffer(object):
+    """
+    Columnar storage for the instructions generated by a FlexTemplate. Each row stores the index of its base
+    instruction, its tabs, and one value per field, with value names stored as indices into the value names of the
+    base instruction's field. Instruction objects are only created when rows are indexed or iterated over.
+    """
+
+    def __init__(self, base_instructions: List[Instruction]):
+        self.base_instructions = base_instructions
+        self._base_idx = array('H')
+        self._tabs = array('H')
+        self._values = []
+        self._value_strs = []
+        self._value_name_lists = []
+        self._scratch = {}
+        # Lazily evaluated fields, stored as (row, field index, iterator and side effect values) when rows are added
+        self.lazy_fields = []
+
+    def init_columns(self):
+        # Columns are created for the first instruction, as base instructions can be added to a template after
+        # it is created
+        num_fields = max([len(bi.fields) for bi in self.base_instructions], default=0)
+        self._values = [array('q') for _ in range(num_fields)]
+        self._value_strs = [array('h') for _ in range(num_fields)]
+        self._value_name_lists = [[f.value_name_list for f in bi.fields] for bi in self.base_instructions]
+
+    def __len__(self):
+        return len(self._base_idx)
+
+    def __getitem__(self, idx: int) -> Instruction:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Instruction index {idx} out of range for buffer with {len(self)} instructions")
+        return self.materialize(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.materialize(idx)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_scratch'] = {}
+        return state
+
+    @property
+    def opcodes(self) -> np.ndarray:
+        base_opcodes = np.asarray([bi.opcode for bi in self.base_instructions], dtype=np.int64)
+        return base_opcodes[np.frombuffer(self._base_idx, dtype=np.uint16)]
+
+    def field_values(self, field_idx: int) -> np.ndarray:
+        return np.frombuffer(self._values[field_idx], dtype=np.int64)
+
+    def append(self, base_idx: int, instruction: Instruction):
+        if len(self) == 0:
+            self.init_columns()
+        self._base_idx.append(base_idx)
+        self._tabs.append(instruction.tabs)
+        for f_idx in range(len(self._values)):
+            self._values[f_idx].append(UNSET_VALUE)
+            self._value_strs[f_idx].append(NO_VALUE_STR)
+        for f_idx, f in enumerate(instruction.fields):
+            self.set_field(len(self) - 1, f_idx, f)
+
+    def add_lazy_field(self, row: int, f_idx: int, field_args: tuple):
+        self.lazy_fields.append((row, f_idx, field_args))
+
+    def base_index(self, row: int) -> int:
+        return self._base_idx[row]
+
+    def set_field(self, row: int, f_idx: int, field):
+        self._values[f_idx][row] = UNSET_VALUE if field.value is None else field.value
+        names = self._value_name_lists[self._base_idx[row]][f_idx]
+        self._value_strs[f_idx][row] = names.index(field.value_str) if field.value_str in names else NO_VALUE_STR
+
+    def update(self, row: int, instruction: Instruction):
+        # Stores the field values of a materialized instruction, e.g., after evaluating its lazy fields
+        for f_idx, f in enumerate(instruction.fields):
+            self.set_field(row, f_idx, f)
+
+    def load_row(self, row: int, instruction: Instruction):
+        base_instr = self.base_instructions[self._base_idx[row]]
+        names = self._value_name_lists[self._base_idx[row]]
+        for f_idx, f in enumerate(instruction.fields):
+            value = self._values[f_idx][row]
+            name_idx = self._value_strs[f_idx][row]
+            # Values are validated when they are evaluated, so the field's setter is bypassed
+            f._value = None if value == UNSET_VALUE else value
+            if name_idx != NO_VALUE_STR:
+                f.value_str = names[f_idx][name_idx]
+            else:
+                f.value_str = base_instr.fields[f_idx].value_str
+        instruction._tabs = self._tabs[row]
+        return instruction
+
+    def materialize(self, row: int) -> Instruction:
+        instruction = self.base_instructions[self._base_idx[row]].instruction_copy(copy_params=False)
+        return self.load_row(row, instruction)
+
+    def scratch_instruction(self, row: int) -> Instruction:
+        # A single instruction for each base instruction is reused when emitting strings
+        base_idx = self._base_idx[row]
+        if base_idx not in self._scratch:
+            self._scratch[base_idx] = self.base_instructions[base_idx].instruction_copy(copy_params=False)
+        return self.load_row(row, self._scratch[base_idx])
+
+    def instr_lengths(self) -> np.ndarray:
+        base_lengths = np.asarray([bi.instr_length for bi in self.base_instructions], dtype=np.int64)
+        return base_lengths[np.frombuffer(self._base_idx, dtype=np.uint16)]
+
+    def words(self) -> np.ndarray:
+        # Packs each instruction into an integer word, with the opcode in the most significant bits followed by the
+        # fields in order
+        words = np.zeros(len(self), dtype=np.uint64)
+        base_idx = np.frombuffer(self._base_idx, dtype=np.uint16)
+        for b, bi in enumerate(self.base_instructions):
+            rows = base_idx == b
+            if not rows.any():
+                continue
+            assert bi.num_output_supported
+            if bi.instr_length > MAX_WORD_BITS:
+                raise RuntimeError(f"Unable to pack instruction {bi.opname} with length {bi.instr_length}:\n"
+                                   f"Packed instructions must be at most {MAX_WORD_BITS} bits")
+            shift = bi.instr_length - bi.opcode_width
+            instr_words = np.full(np.count_nonzero(rows), bi.opcode, dtype=np.uint64) << np.uint64(shift)
+            for f_idx, f in enumerate(bi.fields):
+                shift -= f.bitwidth
+                values = self.field_values(f_idx)[rows]
+                if np.any(values == UNSET_VALUE):
+                    raise RuntimeError(f"Unable to pack instruction {bi.opname} because field {f.field_name} "
+                                       f"has not been evaluated")
+                instr_words |= values.astype(np.uint64) << np.uint64(shift)
+            words[rows] = instr_words
+        return words
+
+    def emit(self, output_type) -> List[str]:
+        if output_type not in ["binary", "decimal"]:
+            return [self.scratch_instruction(row).emit(output_type) for row in range(len(self))]
+        return format_words(self.words(), self.instr_lengths(), output_type)
+
+
+def format_words(words: np.ndarray, instr_lengths: np.ndarray, output_type: str) -> List[str]:
+    # Text representations of packed instruction words, as emitted by Instruction.emit
+    if output_type == "decimal":
+        return [str(w) for w in words.tolist()]
+    assert output_type == "binary"
+    return [format(w, f"0{l}b") for w, l in zip(words.tolist(), instr_lengths.tolist())]
+
+
+def pack_words(words: np.ndarray, instr_lengths: np.ndarray) -> bytes:
+    # Instructions are stored as little-endian words, using 32 bits per instruction if they all fit
+    dtype = "<u4" if len(instr_lengths) == 0 or instr_lengths.max() <= 32 else "<u8"
+    return words.astype(dtype).tobytes()
@@ -0,0 +1,186 @@
+import hashlib
+from numbers import Number
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+from codelets.adl import flex_param as flex_param_module
+from codelets.adl.flex_param import FlexParam
+from .instruction import Instruction
+from .instruction_buffer import InstructionBuffer
+
+if TYPE_CHECKING:
+    from .flex_template import FlexTemplate
+
+# Compiled evaluation functions, keyed by the structure of the templates which use them
+_COMPILED_TEMPLATES: Dict[Tuple, Callable] = {}
+
+FN_NAME = "_evaluate_template"
+# Names used by the generated code, which cannot be used as iterator or side effect names
+RESERVED_NAMES = ["fn_args", "instruction"]
+
+
+def is_string_param(param: FlexParam) -> bool:
+    # Only parameters created from a string have a body which can be inlined
+    return param.fn_body_str is not None and \
+        param.fn_code_str == f"lambda {','.join(param.fn_args)}: {param.fn_body_str}"
+
+
+def param_key(param: FlexParam):
+    if param is None:
+        return None
+    return (tuple(param.fn_args), param.fn_body_str, is_string_param(param), param.dtype_cast_func is int)
+
+
+def template_key(template: 'FlexTemplate') -> Tuple:
+    instr_keys = []
+    for bi in template.base_instructions:
+        instr_keys.append(tuple((f.isset, f.lazy_eval, f.param_fn_type, param_key(f.param_fn)) for f in bi.fields))
+    return (template.template_type,
+            tuple(template.iter_args),
+            tuple(param_key(p) for p in template.iterables),
+            param_key(template.conditional),
+            param_key(template.flex_tabs),
+            tuple((se.name, param_key(se.side_effect_fp)) for se in template.side_effects),
+            tuple(instr_keys))
+
+
+class TemplateCompilationError(Exception):
+    # Raised for templates which are evaluated with the interpreter, e.g., with mismatched FlexParam arguments
+    pass
+
+
+class _TemplateCodeWriter(object):
+
+    def __init__(self, template: 'FlexTemplate'):
+        self.template = template
+        self.lines = []
+        self.helpers = {}
+        self.indent = 1
+
+    def add(self, line: str):
+        self.lines.append("    "*self.indent + line)
+
+    def param_call(self, param: FlexParam, param_path: str, arg_names: List[str], value_names: List[str],
+                   from_body=False) -> str:
+        # 'arg_names' are the names of the parameter's arguments, and 'value_names' are the local variables passed
+        # to them, in the same order used by FlexTemplate.evaluate_iterable_instructions
+        if from_body or is_string_param(param):
+            if arg_names == value_names:
+                return f"({param.fn_body_str})"
+            helper = f"_param_fn{len(self.helpers)}"
+            self.helpers[helper] = f"lambda {','.join(arg_names)}: {param.fn_body_str}"
+            return f"{helper}({', '.join(value_names)})"
+        return f"{param_path}.fn({', '.join(value_names)})"
+
+    def add_evaluation(self, target: str, param: FlexParam, param_path: str, arg_names: List[str],
+                       value_names: List[str], from_body=False):
+        if len(arg_names) != len(value_names):
+            raise TemplateCompilationError
+        self.add(f"{target} = {self.param_call(param, param_path, arg_names, value_names, from_body=from_body)}")
+        cast = "int" if from_body or param.dtype_cast_func is int else f"{param_path}.dtype_cast_func"
+        self.add(f"if isinstance({target}, _Number):")
+        self.add(f"    {target} = {cast}({target})")
+        self.add(f"_n_evals += 1")
+
+    def write(self) -> str:
+        t = self.template
+        fn_arg_names = Instruction.INSTR_TYPE_ARGS[t.template_type]
+        local_names = fn_arg_names + t.iter_args + t.side_effect_args + RESERVED_NAMES
+        if len(set(local_names)) != len(local_names) or not all(n.isidentifier() for n in local_names):
+            raise TemplateCompilationError
+        template_params = t.iterables + [se.side_effect_fp for se in t.side_effects] + \
+                          [p for p in [t.conditional, t.flex_tabs] if p is not None]
+        if any(p.fn is None for p in template_params):
+            raise TemplateCompilationError
+        with_instr = t.template_type in ["instruction", "codelet"]
+        iter_se_args = t.iter_args + t.side_effect_args
+
+        self.add(f"{', '.join(fn_arg_names)}, = fn_args")
+        self.add("_instructions = _InstructionBuffer(template.base_instructions)")
+        self.add("_n_evals = 0")
+        for i, name in enumerate(t.side_effect_args):
+            self.add(f"{name} = template.side_effects[{i}].value")
+
+        for i, name in enumerate(t.iter_args):
+            self.add_evaluation(f"_iterable{i}", t.iterables[i], f"template.iterables[{i}]",
+                                t.iterables[i].fn_args, fn_arg_names)
+            self.add(f"for {name} in _iterable{i}:")
+            self.indent += 1
+
+        for b, bi in enumerate(t.base_instructions):
+            base_path = f"template.base_instructions[{b}]"
+            self.add(f"instruction = {base_path}.instruction_copy(copy_params=False)")
+            if t.conditional is not None:
+                cond_args = fn_arg_names + (["instruction"] if with_instr else []) + iter_se_args
+                self.add_evaluation("_condition", t.conditional, "template.conditional", t.conditional.fn_args,
+                                    cond_args)
+                self.add("if _condition:")
+                self.indent += 1
+
+            for f_idx, f in enumerate(bi.fields):
+                if f.isset or f.lazy_eval:
+                    continue
+                if f.param_fn is None or f.param_fn.fn_body_str is None or \
+                        f.param_fn.fn_args != fn_arg_names + ["instruction"]:
+                    raise TemplateCompilationError
+                # Instruction copies recreate field functions from their body, and append the iterator and side
+                # effect values to their arguments
+                field_args = f.param_fn.fn_args + iter_se_args
+                self.add_evaluation("_result", f.param_fn, None, field_args, field_args, from_body=True)
+                self.add(f"_error = instruction.fields[{f_idx}].set_value_from_result(_result)")
+                self.add("if _error is not None:")
+                self.add(f"    raise RuntimeError(_error)")
+
+            if t.flex_tabs is not None:
+                self.add_evaluation("_tabs", t.flex_tabs, "template.flex_tabs", t.flex_tabs.fn_args,
+                                    fn_arg_names + iter_se_args)
+                self.add("instruction.set_tabs(_tabs)")
+            elif len(fn_arg_names) == 6:
+                self.add("instruction.set_tabs(op.loop_level)")
+            else:
+                self.add("instruction.set_tabs(0)")
+            self.add(f"_instructions.append({b}, instruction)")
+            lazy_args = "".join([f"{name}, " for name in iter_se_args])
+            for f_idx, f in enumerate(bi.fields):
+                if f.lazy_eval:
+                    self.add(f"_instructions.add_lazy_field(len(_instructions) - 1, {f_idx}, ({lazy_args}))")
+
+            # All side effects are evaluated using the values from before any of them were updated
+            for i, se in enumerate(t.side_effects):
+                self.add_evaluation(f"_side_effect{i}", se.side_effect_fp, f"template.side_effects[{i}].side_effect_fp",
+                                    se.side_effect_fp.fn_args, fn_arg_names + iter_se_args)
+            for i, name in enumerate(t.side_effect_args):
+                self.add(f"{name} = template.side_effects[{i}].value = _side_effect{i}")
+
+            if t.conditional is not None:
+                self.indent -= 1
+
+        self.indent = 1
+        self.add("_FlexParam.eval_count += _n_evals")
+        self.add("return _instructions")
+        header = [f"{name} = {helper}" for name, helper in self.helpers.items()]
+        return "\n".join(header + [f"def {FN_NAME}(fn_args):"] + self.lines)
+
+
+def compile_template(template: 'FlexTemplate') -> Callable:
+    try:
+        source = _TemplateCodeWriter(template).write()
+    except TemplateCompilationError:
+        source = None
+    if source is None:
+        return None
+    # FlexParam functions are evaluated with the globals of the flex_param module
+    fn_globals = dict(vars(flex_param_module))
+    fn_globals.update({"_Number": Number, "_FlexParam": FlexParam, "_InstructionBuffer": InstructionBuffer})
+    filename = f"<flex_template {hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]}>"
+    exec(compile(source, filename, "exec"), fn_globals)
+    return fn_globals[FN_NAME]
+
+
+def get_compiled_template(template: 'FlexTemplate') -> Callable:
+    key = template_key(template)
+    if key not in _COMPILED_TEMPLATES:
+        _COMPILED_TEMPLATES[key] = compile_template(template)
+    return _COMPILED_TEMPLATES[key]
+
+
+def clear_compiled_templates():
+    _COMPILED_TEMPLATES.clear()
@@ -34,6 +34,33 @@ class Offset:
     def __str__(self):
         return f"DIM:{self.dim},LOOPID:{self.loop_id},OFFSET:{self.offset}"
 
+@dataclass
+class AffineIndexMap:
+    # Integer affine form of an offset expression: sum(coeffs[i]*indices[i]) + const
+    indices: Tuple[Basic, ...]
+    coeffs: np.ndarray
+    const: int
+    terms: List[Tuple[Basic, int]] = field(init=False)
+
+    def __post_init__(self):
+        self.terms = list(zip(self.indices, self.coeffs.tolist()))
+
+    def evaluate(self, values: Dict[Basic, Any]):
+        # Values can be integers or integer arrays, e.g. for batched tiling evaluation
+        res = self.const
+        for idx, coeff in self.terms:
+            res = res + coeff*values[idx]
+        return res
+
+    @staticmethod
+    def from_expr(expr: Basic, indices: List[Basic], param_values: Dict[Basic, int]):
+        expr = expr.subs(param_values) if len(param_values) > 0 else expr
+        const, coeffs, nonlinear = util.split(expr, list(indices))
+        if nonlinear != 0 or not all(isinstance(c, (Integer, Integral)) for c in coeffs + [const]):
+            return None
+        return AffineIndexMap(tuple(indices), np.asarray([int(c) for c in coeffs], dtype=np.int64), int(const))
+
+
 @dataclass
 class DataMovement:
     src_node: str
@@ -48,17 +75,22 @@ class DataMovement:
     lambdified_expr: Dict[str, Any] = field(default_factory=dict)
     symbol_str_map: Dict[Basic, str] = field(default_factory=dict)
     symbol_atoms_map: Dict[Basic, str] = field(default_factory=dict)
+    symbol_params_map: Dict[Basic, List[Basic]] = field(default_factory=dict)
+    affine_maps: Dict[Tuple, Optional[AffineIndexMap]] = field(default_factory=dict)
     derived_sizes: Dict[str, int] = field(default_factory=dict)
 
     def __post_init__(self):
         self.set_symbol_maps()
 
     def set_symbol_maps(self):
+        # Affine maps are lowered with the parameters of the previous offsets
+        self.affine_maps.clear()
         for o in self.offset_map.values():
             if isinstance(o, Basic):
                 self.symbol_str_map[o] = str(o)
                 self.symbol_atoms_map[o] = list(o.atoms(Idx))
                 others = [i for i in list(o.free_symbols) if i not in self.symbol_atoms_map[o]]
+                self.symbol_params_map[o] = others
 
                 for idx in self.symbol_atoms_map[o]:
                     self.symbol_str_map[idx] = str(idx)
@@ -73,6 +105,9 @@ class DataMovement:
     def get_symbol_atoms(self, obj):
         return self.symbol_atoms_map[obj]
 
+    def get_symbol_params(self, obj):
+        return self.symbol_params_map[obj]
+
     def __str__(self):
         path = f"PATH: {self.src_node}->{self.dst_node}"
         op = f"OP: {self.op_name}"
@@ -155,7 +190,7 @@ class DataMovement:
         for name, o in self.offset_map.items():
             if isinstance(o, Basic):
                 indices = self.get_symbol_atoms(o)
-                others = [i for i in list(o.free_symbols) if i not in indices]
+                others = self.get_symbol_params(o)
                 max_vals = {}
                 rel_splits = []
                 for idx, i in enumerate(indices):
@@ -184,6 +219,45 @@ class DataMovement:
 
         return sizes
 
+    def get_size_from_splits_batch(self, cdlt, splits, n_perms):
+        # Same as `get_size_from_splits`, but each split is an array with one value per permutation.
+        # Permutations which do not evenly divide a loop are marked as invalid instead of failing an assertion.
+        sizes = {}
+        valid = np.ones(n_perms, dtype=bool)
+
+        src_level = cdlt.get_tile_level(self.src_node)
+        dst_level = cdlt.get_tile_level(self.dst_node)
+        level = min(src_level, dst_level)
+
+        for name, o in self.offset_map.items():
+            if isinstance(o, Basic):
+                indices = self.get_symbol_atoms(o)
+                others = self.get_symbol_params(o)
+                max_vals = {}
+                rel_splits = np.ones(n_perms, dtype=np.int64)
+                for i in indices:
+                    i_as_str = self.get_symbol_str(i)
+                    rel_splits = rel_splits * splits[i_as_str]
+
+                    if i_as_str in self.derived_sizes:
+                        max_vals[i] = self.derived_sizes[i_as_str]
+                    else:
+                        loop_end = cdlt.op_map[i_as_str].end
+                        valid &= (loop_end % splits[i_as_str]) == 0
+                        max_vals[i] = loop_end // splits[i_as_str] - 1
+
+                max_vals.update({i: cdlt.required_params[self.get_symbol_str(i)].value for i in others})
+
+                size = self.resolve_offset_batch(o, max_vals, n_perms) + 1
+                if level == 0:
+                    full_size = cdlt.get_operand(self.operand_name).shape_symbols[name]
+                    size = np.where((rel_splits == 1) & (size < full_size), full_size, size)
+            else:
+                size = np.full(n_perms, o, dtype=np.int64)
+            sizes[name] = size
+
+        return sizes, valid
+
     def get_size_from_splits_derived(self, cdlt, splits, derived_sizes):
         sizes = {}
 
@@ -197,7 +271,7 @@ class DataMovement:
         for name, o in self.offset_map.items():
             if isinstance(o, Basic):
                 indices = self.get_symbol_atoms(o)
-                others = [i for i in list(o.free_symbols) if i not in indices]
+                others = self.get_symbol_params(o)
                 max_vals = {}
                 rel_splits = []
                 for idx, i in enumerate(indices):
@@ -230,7 +304,7 @@ class DataMovement:
         for name, o in self.offset_map.items():
             if isinstance(o, Basic):
                 indices = self.get_symbol_atoms(o)
-                others = [i for i in list(o.free_symbols) if i not in indices]
+                others = self.get_symbol_params(o)
                 max_vals = {}
                 for idx, i in enumerate(indices):
                     i_as_str = self.get_symbol_str(i)
@@ -270,7 +344,7 @@ class DataMovement:
         for idx, (name, o) in enumerate(self.offset_map.items()):
             idx_offset = int(np.prod(self.shape_list[idx + 1:]))
             if isinstance(o, Basic):
-                indices = list(o.atoms(Idx))
+                indices = self.get_symbol_atoms(o)
                 dom_offsets = self.resolve_domain_offset(cdlt, o, indices, idx, loop_shapes, dep_map)
             else:
                 dom_offsets = [Offset(idx, -1, idx_offset, int(self.shape_list[idx]), o)]
@@ -278,10 +352,13 @@ class DataMovement:
 
     def resolve_domain_offset(self, cdlt, expr, indices, dim, loop_shapes, dep_map):
         offsets = []
-        for f_sym in list(expr.free_symbols):
-            if str(f_sym) in cdlt.required_params:
-                expr = expr.subs(f_sym, cdlt.required_params[str(f_sym)].value)
-        offset, coeffs, nonlin = util.split(expr, indices)
+        params = {p: cdlt.required_params[str(p)].value for p in self.get_expr_params(expr, indices)
+                  if str(p) in cdlt.required_params}
+        affine = self.get_affine_map(expr, indices, params)
+        if affine is not None:
+            offset, coeffs = affine.const, affine.coeffs.tolist()
+        else:
+            offset, coeffs, nonlin = util.split(expr.subs(params), indices)
         dim_size = self.shape_list[dim]
         base_offset = int(np.prod(self.shape_list[dim + 1:]))
 
@@ -303,8 +380,8 @@ class DataMovement:
     def resolve_offsets(self, cdlt):
         for idx, (name, o) in enumerate(self.offset_map.items()):
             if isinstance(o, Basic):
-                indices = list(o.atoms(Idx))
-                others = [i for i in list(o.free_symbols) if i not in indices]
+                indices = self.get_symbol_atoms(o)
+                others = self.get_symbol_params(o)
                 max_vals = {i: cdlt.op_map[str(i)].end - 1 for i in indices}
                 max_vals.update({i: cdlt.required_params[str(i)].value for i in others})
                 size = self.resolve_offset(o, max_vals) + 1
@@ -312,14 +389,41 @@ class DataMovement:
                 size = o
             self.evaluated_offsets[name] = size
 
-    def resolve_offset(self, expr: Basic, values: Dict[str, int]):
+    def get_offset_fn(self, expr: Basic):
         if expr in self.lambdified_expr:
             f = self.lambdified_expr[expr]
         else:
             free_symbs = list(expr.free_symbols)
             f = lambdify(free_symbs, expr, "numpy")
             self.lambdified_expr[expr] = f
+        return f
+
+    def get_expr_params(self, expr: Basic, indices: List[Basic]):
+        if expr in self.symbol_params_map:
+            return self.symbol_params_map[expr]
+        return [i for i in list(expr.free_symbols) if i not in indices]
+
+    def get_affine_map(self, expr: Basic, indices: List[Basic], param_values: Dict[Basic, int]):
+        # Offsets are lowered once for each set of parameter values, and are None if the expression is not affine
+        key = (expr, tuple(param_values.items()))
+        if key not in self.affine_maps:
+            self.affine_maps[key] = AffineIndexMap.from_expr(expr, indices, param_values)
+        return self.affine_maps[key]
+
+    def get_offset_affine_map(self, expr: Basic, values: Dict[Basic, Any]):
+        if expr in self.symbol_atoms_map:
+            indices = self.symbol_atoms_map[expr]
+        else:
+            indices = list(expr.atoms(Idx))
+        params = {p: values[p] for p in self.get_expr_params(expr, indices) if p in values}
+        return self.get_affine_map(expr, indices, params)
+
+    def resolve_offset(self, expr: Basic, values: Dict[str, int]):
+        affine = self.get_offset_affine_map(expr, values)
+        if affine is not None:
+            return int(affine.evaluate(values))
 
+        f = self.get_offset_fn(expr)
         args = tuple([values[f] for f in list(expr.free_symbols) if f in values])
         res = f(*args)
 
@@ -329,6 +433,21 @@ class DataMovement:
 
         return int(res)
 
+    def resolve_offset_batch(self, expr: Basic, values: Dict[str, Any], n_perms: int):
+        affine = self.get_offset_affine_map(expr, values)
+        if affine is not None:
+            return np.broadcast_to(np.asarray(affine.evaluate(values), dtype=np.int64), (n_perms,))
+
+        f = self.get_offset_fn(expr)
+        args = tuple([values[f] for f in list(expr.free_symbols) if f in values])
+        res = np.broadcast_to(np.asarray(f(*args)), (n_perms,))
+
+        if not np.issubdtype(res.dtype, np.integer):
+            raise TypeError(f"Unable to compute domain domain_offsets because offset is not an integer:"
+                            f"Offset: {expr}\tType: {type(expr)}")
+
+        return res.astype(np.int64)
+
 
 
 @dataclass
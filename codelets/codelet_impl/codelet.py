@@ -38,6 +38,7 @@ class Codelet(object):
         self._domain_tiling = {}
         self._tile_levels = defaultdict(list)
         self._domain_loop_map = {}
+        self._tiling_search_stats = {}
 
         self._id_counter = 0
         self._loop_ctxt_level = 0
@@ -229,6 +230,10 @@ class Codelet(object):
     def domain_loop_map(self):
         return self._domain_loop_map
 
+    @property
+    def tiling_search_stats(self):
+        return self._tiling_search_stats
+
     @property
     def tile_levels(self):
         return self._tile_levels
@@ -524,6 +529,7 @@ class Codelet(object):
         obj._domain_tiling = deepcopy(self._domain_tiling)
         obj._tile_levels = deepcopy(self._tile_levels)
         obj._domain_loop_map = deepcopy(self._domain_loop_map)
+        obj._tiling_search_stats = self._tiling_search_stats.copy()
         obj._derived_fps = deepcopy(self._derived_fps)
         obj._op_id_counters = deepcopy(self._op_id_counters)
         obj._id_counter = self._id_counter
@@ -534,6 +540,15 @@ class Codelet(object):
             obj.add_op(o.copy(obj))
         return obj
 
+    def copy_as_instance(self, cdlt: 'Codelet'):
+        # Full copy of this codelet which takes the place of 'cdlt', an instance with an identical signature
+        obj = deepcopy(self, {id(self.hag): self.hag})
+        obj._instance_id = cdlt.instance_id
+        for src, dst in zip(cdlt.inputs + cdlt.outputs, obj.inputs + obj.outputs):
+            assert src.name == dst.name
+            dst.node_name = src.node_name
+        return obj
+
     def copy_required_params(self):
         params = {}
         for k, v in self.required_params.items():
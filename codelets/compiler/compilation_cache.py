@@ -0,0 +1,117 @@
+import json
+import hashlib
+from typing import TYPE_CHECKING, Dict, List, Tuple
+from codelets.adl.flex_param import FlexParam
+from codelets.codelet_impl import Codelet
+from codelets.templates.codelet_template import CodeletTemplate
+
+if TYPE_CHECKING:
+    from codelets.adl.graph import ArchitectureNode
+    from .program import CompilationStage
+
+
+# Config values which only set the capacity of storage nodes
+STORAGE_CFG_SUFFIX = "_DEPTH"
+
+
+def storage_config(hag: 'ArchitectureNode') -> Dict[str, Dict]:
+    # Storage attributes are read from the nodes, which can be updated after the HAG is created
+    config = {}
+    for name, node in hag.all_subgraph_nodes.items():
+        if node.node_type == "storage":
+            config[name] = {attr: getattr(node, attr) for attr in node.attribute_names}
+    return config
+
+
+def arch_config_hash(hag: 'ArchitectureNode', storage=True) -> str:
+    # Stages which do not depend on storage capacities use a hash without them, so that resizing a buffer only
+    # invalidates the stages which do
+    cfg = {k: v for k, v in hag.meta_cfg.items() if storage or not k.endswith(STORAGE_CFG_SUFFIX)}
+    if storage:
+        cfg['storage_nodes'] = storage_config(hag)
+    cfg = json.dumps(cfg, sort_keys=True, default=str)
+    return hashlib.sha256(cfg.encode("utf-8")).hexdigest()
+
+
+def template_signature(template: CodeletTemplate, arch_hash: str, stages: List['CompilationStage']) -> str:
+    params = {k: v.value if isinstance(v, FlexParam) else v for k, v in template.required_params.items()}
+    stage_info = [[s.name, s.fn_kwargs] for s in stages]
+    sig = json.dumps([template.op_name, template.emit("operations"), params, template.compilation_params,
+                      stage_info, arch_hash], sort_keys=True, default=str)
+    return hashlib.sha256(sig.encode("utf-8")).hexdigest()
+
+
+def codelet_signature(cdlt: Codelet, arch_hash: str, stages: List['CompilationStage'] = None) -> str:
+    operands = []
+    for o in (cdlt.inputs + cdlt.outputs + cdlt.temps):
+        operands.append([o.name, o.shape_list, o.shape_symbols, str(o.dtype), o.data_path,
+                         o.static_padding, o.dynamic_padding])
+    params = {k: v.value if isinstance(v, FlexParam) else v for k, v in cdlt.required_params.items()}
+    ops = [[o.op_str, o.target, o.loop_level, o.dependencies] for o in cdlt.ops]
+    stage_info = [[s.name, s.fn_kwargs] for s in (stages or [])]
+    sig = json.dumps([cdlt.op_name, operands, params, cdlt.compilation_params, ops, cdlt.domain_tiling,
+                      stage_info, arch_hash], sort_keys=True, default=str)
+    return hashlib.sha256(sig.encode("utf-8")).hexdigest()
+
+
+class CompilationCache(object):
+
+    def __init__(self, hag: 'ArchitectureNode'):
+        self._hag = hag
+        self._entries: Dict[str, Codelet] = {}
+        self._templates: Dict[str, Tuple[CodeletTemplate, Tuple[str, str], CodeletTemplate]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def arch_hash(self) -> str:
+        # Recomputed so that changes to the HAG config invalidate previously cached codelets
+        return arch_config_hash(self._hag)
+
+    def stage_arch_hash(self, stages: List['CompilationStage']) -> str:
+        return arch_config_hash(self._hag, storage=any(s.storage_dependent for s in stages))
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def signature(self, cdlt: Codelet, stages: List['CompilationStage'], arch_hash: str = None) -> str:
+        return codelet_signature(cdlt, arch_hash or self.arch_hash, stages)
+
+    def add(self, key: str, cdlt: Codelet):
+        # Store a copy so that later, non-cached stages do not modify the cached codelet
+        self._entries[key] = cdlt.copy_as_instance(cdlt)
+
+    def get(self, key: str, cdlt: Codelet) -> Codelet:
+        if key not in self._entries:
+            raise KeyError(f"Unable to find cached codelet for {cdlt.op_name}{cdlt.instance_id}")
+        self.hits += 1
+        return self._entries[key].copy_as_instance(cdlt)
+
+    def get_template(self, name: str, template: CodeletTemplate, stages: List['CompilationStage']):
+        # Template stages can modify the HAG's templates in place, so a processed template is only reused for the
+        # same template object, either unmodified or in the state the stages left it in
+        key = template_signature(template, self.stage_arch_hash(stages), stages)
+        if name in self._templates:
+            src, keys, processed = self._templates[name]
+            if src is template and key in keys:
+                self.hits += 1
+                return key, processed
+        self.misses += 1
+        return key, None
+
+    def add_template(self, name: str, key: str, template: CodeletTemplate, processed: CodeletTemplate,
+                     stages: List['CompilationStage']):
+        processed_key = template_signature(template, self.stage_arch_hash(stages), stages)
+        self._templates[name] = (template, (key, processed_key), processed)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._entries = {}
+        self._templates = {}
+        self.reset_stats()
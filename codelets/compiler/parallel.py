@@ -0,0 +1,112 @@
+import io
+import multiprocessing as mp
+from typing import TYPE_CHECKING, Dict, List, Any
+import dill
+from codelets.adl.operation import Operation
+from codelets.codelet_impl import Codelet
+
+if TYPE_CHECKING:
+    from .program import CodeletProgram, CompilationStage
+
+# Populated immediately before the worker pool is forked so that workers inherit the program,
+# node sequence, and codelets without having to pickle them.
+_WORKER_STATE = {}
+
+
+class _SharedRefPickler(dill.Pickler):
+
+    def __init__(self, file, shared_refs: Dict[str, Any]):
+        super().__init__(file)
+        self._shared_keys = {id(v): k for k, v in shared_refs.items()}
+
+    def persistent_id(self, obj):
+        return self._shared_keys.get(id(obj), None)
+
+
+class _SharedRefUnpickler(dill.Unpickler):
+
+    def __init__(self, file, shared_refs: Dict[str, Any]):
+        super().__init__(file)
+        self._shared_refs = shared_refs
+
+    def persistent_load(self, pid):
+        return self._shared_refs[pid]
+
+
+def shared_refs(program: 'CodeletProgram', node) -> Dict[str, Any]:
+    # Objects which exist in both the parent and the workers and must not be copied
+    # when a codelet is sent back to the parent
+    return {"program": program, "hag": program.hag, "graph": program.graph, "node": node}
+
+
+def dumps_codelet(cdlt: Codelet, refs: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    _SharedRefPickler(buffer, refs).dump(cdlt)
+    return buffer.getvalue()
+
+
+def loads_codelet(payload: bytes, refs: Dict[str, Any]) -> Codelet:
+    return _SharedRefUnpickler(io.BytesIO(payload), refs).load()
+
+
+def counter_state():
+    return (Operation.id_counter, dict(Operation.op_id_counters),
+            Codelet.codelet_instance_id, Codelet.codelet_id)
+
+
+def counter_delta(start, end):
+    op_deltas = {k: v - start[1].get(k, 0) for k, v in end[1].items() if v != start[1].get(k, 0)}
+    return (end[0] - start[0], op_deltas, end[2] - start[2], end[3] - start[3])
+
+
+def _run_codelet_worker(node_idx: int):
+    program = _WORKER_STATE['program']
+    n = _WORKER_STATE['node_sequence'][node_idx]
+    cdlt = _WORKER_STATE['codelets'][n.name]
+    start = counter_state()
+    n_events = 0 if program.profiler is None else len(program.profiler)
+    cdlt = program.run_codelet_stages(n, cdlt, _WORKER_STATE['fns'], verbose=_WORKER_STATE['verbose'])
+    # Profile events recorded in the worker are returned to the parent's profiler
+    events = [] if program.profiler is None else program.profiler.events[n_events:]
+    return dumps_codelet(cdlt, shared_refs(program, n)), counter_delta(start, counter_state()), events
+
+
+def run_parallel_stages(program: 'CodeletProgram', node_sequence, codelets: Dict[str, Codelet],
+                        fns: List['CompilationStage'], workers: int, verbose=False) -> Dict[str, Codelet]:
+    if "fork" not in mp.get_all_start_methods():
+        raise RuntimeError(f"Parallel compilation requires the 'fork' start method, which is not available"
+                           f" on this platform. Compile with workers=1 instead.")
+
+    # Daemonic processes, e.g. the per-benchmark pool in tools/benchmark_compilation.py, cannot fork workers
+    if mp.current_process().daemon:
+        for n in node_sequence:
+            codelets[n.name] = program.run_codelet_stages(n, codelets[n.name], fns, verbose=verbose)
+        return codelets
+
+    dispatch_idx = [i for i, n in enumerate(node_sequence)
+                    if not (codelets[n.name].is_noop() and all([fn.skip_noops for fn in fns]))]
+
+    _WORKER_STATE.update({'program': program, 'node_sequence': node_sequence, 'codelets': codelets,
+                          'fns': fns, 'verbose': verbose})
+    try:
+        with mp.get_context("fork").Pool(min(workers, max(len(dispatch_idx), 1))) as pool:
+            # imap preserves the node order, so results are merged exactly as a serial compile would produce them
+            results = pool.imap(_run_codelet_worker, dispatch_idx, chunksize=1)
+            for idx, (payload, delta, events) in zip(dispatch_idx, results):
+                n = node_sequence[idx]
+                cdlt = loads_codelet(payload, shared_refs(program, n))
+                if delta[2] != 0 or delta[3] != 0:
+                    raise RuntimeError(f"Stages {[fn.name for fn in fns]} created new codelets while compiling"
+                                       f" {cdlt.op_name}{cdlt.instance_id} and cannot be run in parallel.\n"
+                                       f"Remove 'parallel' from these compilation stages.")
+                if program.profiler is not None:
+                    program.profiler.add_events(events)
+                Operation.id_counter += delta[0]
+                for op_type, count in delta[1].items():
+                    Operation.op_id_counters[op_type] += count
+                program.replace_codelet(cdlt)
+                codelets[n.name] = cdlt
+    finally:
+        _WORKER_STATE.clear()
+
+    return codelets
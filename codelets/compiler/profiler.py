@@ -0,0 +1,153 @@
+import os
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from functools import wraps
+from time import perf_counter
+from typing import TYPE_CHECKING, List
+from codelets.adl.flex_param import FlexParam, fn_cache_info
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+if TYPE_CHECKING:
+    from codelets.codelet_impl import Codelet
+
+PHASE_CATEGORY = "phase"
+STAGE_CATEGORY = "stage"
+
+
+def peak_rss_kb() -> int:
+    # Peak resident set size of the current process, which is reported in kilobytes on Linux
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@dataclass
+class ProfileEvent:
+    name: str
+    category: str
+    start_us: float
+    pid: int
+    codelet: str = field(default=None)
+    dur_us: float = field(default=0)
+    permutations: int = field(default=0)
+    flex_param_evals: int = field(default=0)
+    flex_param_compiles: int = field(default=0)
+    flex_param_cache_hits: int = field(default=0)
+    peak_rss_kb: int = field(default=0)
+    rss_growth_kb: int = field(default=0)
+
+    def to_trace_event(self):
+        args = {k: v for k, v in asdict(self).items() if k not in ["name", "category", "start_us", "dur_us", "pid"]}
+        name = self.name if self.codelet is None else f"{self.name}:{self.codelet}"
+        return {"name": name, "cat": self.category, "ph": "X", "ts": self.start_us, "dur": self.dur_us,
+                "pid": self.pid, "tid": self.pid, "args": args}
+
+
+class CompilationProfiler(object):
+    """
+    Records the wall time, tiling permutations, FlexParam evaluations, and peak RSS of each compilation phase,
+    and of each stage applied to a codelet. Events recorded in forked workers use the same clock as the parent.
+    """
+
+    def __init__(self):
+        self._pid = os.getpid()
+        self._origin = perf_counter()
+        self.events: List[ProfileEvent] = []
+
+    def __len__(self):
+        return len(self.events)
+
+    @contextmanager
+    def record(self, name: str, category: str, cdlt: 'Codelet' = None):
+        cdlt_name = None if cdlt is None else f"{cdlt.op_name}{cdlt.instance_id}"
+        event = ProfileEvent(name, category, (perf_counter() - self._origin)*1e6, os.getpid(), codelet=cdlt_name)
+        flex_evals = FlexParam.eval_count
+        fn_cache_hits, fn_cache_misses = FlexParam.fn_cache_hits, FlexParam.fn_cache_misses
+        start_rss = peak_rss_kb()
+        try:
+            yield event
+        finally:
+            event.dur_us = (perf_counter() - self._origin)*1e6 - event.start_us
+            event.flex_param_evals = FlexParam.eval_count - flex_evals
+            event.flex_param_compiles = FlexParam.fn_cache_misses - fn_cache_misses
+            event.flex_param_cache_hits = FlexParam.fn_cache_hits - fn_cache_hits
+            event.peak_rss_kb = peak_rss_kb()
+            event.rss_growth_kb = event.peak_rss_kb - start_rss
+            self.events.append(event)
+
+    def add_events(self, events: List[ProfileEvent]):
+        self.events += events
+
+    def to_chrome_trace(self):
+        trace_events = [e.to_trace_event() for e in sorted(self.events, key=lambda e: e.start_us)]
+        for pid in sorted(set(e.pid for e in self.events)):
+            name = "compiler" if pid == self._pid else f"worker {pid}"
+            trace_events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": pid,
+                                 "args": {"name": name}})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path: str):
+        # The trace can be opened in chrome://tracing or https://ui.perfetto.dev
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+    def stage_totals(self):
+        totals = defaultdict(lambda: {"calls": 0, "time_s": 0.0, "max_s": 0.0, "max_codelet": None,
+                                      "permutations": 0, "flex_param_evals": 0, "flex_param_compiles": 0,
+                                      "flex_param_cache_hits": 0, "peak_rss_kb": 0})
+        for e in self.events:
+            t = totals[(e.category, e.name)]
+            t["calls"] += 1
+            t["time_s"] += e.dur_us / 1e6
+            if e.dur_us / 1e6 > t["max_s"]:
+                t["max_s"] = e.dur_us / 1e6
+                t["max_codelet"] = e.codelet
+            t["permutations"] += e.permutations
+            t["flex_param_evals"] += e.flex_param_evals
+            t["flex_param_compiles"] += e.flex_param_compiles
+            t["flex_param_cache_hits"] += e.flex_param_cache_hits
+            t["peak_rss_kb"] = max(t["peak_rss_kb"], e.peak_rss_kb)
+        return dict(totals)
+
+    def summary(self, top_n=10) -> str:
+        header = f"{'Stage':<32}{'Calls':>8}{'Total (s)':>12}{'Max (s)':>10}  {'Slowest codelet':<28}" \
+                 f"{'Perms':>10}{'FlexParams':>12}{'FP compiles':>13}{'Peak RSS (MB)':>15}"
+        lines = [header, "-"*len(header)]
+        totals = sorted(self.stage_totals().items(), key=lambda kv: (kv[0][0] != PHASE_CATEGORY, -kv[1]["time_s"]))
+        for (category, name), t in totals:
+            label = name if category == PHASE_CATEGORY else f"  {name}"
+            lines.append(f"{label:<32}{t['calls']:>8}{t['time_s']:>12.3f}{t['max_s']:>10.3f}  "
+                         f"{str(t['max_codelet'] or ''):<28}{t['permutations']:>10}{t['flex_param_evals']:>12}"
+                         f"{t['flex_param_compiles']:>13}"
+                         f"{t['peak_rss_kb'] / 1024:>15.1f}")
+
+        fn_cache = fn_cache_info()
+        lines += ["", f"FlexParam function cache: {fn_cache['hits']} hits, {fn_cache['misses']} compiles "
+                      f"({100*fn_cache['hit_rate']:.1f}% hit rate), {fn_cache['size']} cached functions"]
+
+        codelet_events = sorted([e for e in self.events if e.codelet is not None], key=lambda e: -e.dur_us)
+        if len(codelet_events) > 0:
+            lines += ["", f"Slowest (stage, codelet) pairs:"]
+            for e in codelet_events[:top_n]:
+                lines.append(f"  {e.name:<30}{e.codelet:<28}{e.dur_us / 1e6:>10.3f}s"
+                             f"{e.permutations:>10} perms{e.flex_param_evals:>10} FlexParams")
+        return "\n".join(lines)
+
+
+def profile_phase(name: str):
+    # Records a CodeletProgram method as a compilation phase when the program is being profiled
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(program, *args, **kwargs):
+            if program.profiler is None:
+                return fn(program, *args, **kwargs)
+            with program.profiler.record(name, PHASE_CATEGORY):
+                return fn(program, *args, **kwargs)
+        return wrapper
+    return decorator
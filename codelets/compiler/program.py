@@ -1,9 +1,13 @@
 import json
-from typing import List, Callable, Dict, List, Any, Union
+import hashlib
+from typing import List, Callable, Dict, List, Any, Tuple, Union
 from collections import defaultdict
+from itertools import groupby
 from time import time
+from contextlib import nullcontext
 from codelets.adl.flex_param import FlexParam
 from codelets.adl.flex_template import FlexTemplate
+from codelets.adl.flex_template.instruction_buffer import format_words, pack_words
 from codelets.templates.codelet_template import CodeletTemplate
 from codelets.adl.operation import Operand, Loop, Compute, Transfer, Configure, Operation
 from codelets.adl.graph import ArchitectureNode
@@ -13,14 +17,24 @@ from dataclasses import dataclass, field
 import numpy as np
 import polymath as pm
 from sympy import Basic
-from .relocation_table import RelocationTable, EndToEndRelocationTable, DebugRelocationTable
+from .relocation_table import RelocationTable, EndToEndRelocationTable, DebugRelocationTable, DEFAULT_DRAM_ALLOCATOR
+from .parallel import run_parallel_stages
+from .compilation_cache import CompilationCache
+from .profiler import CompilationProfiler, profile_phase, STAGE_CATEGORY
 import networkx as nx
 
 EMIT_OPTIONS = ["decimal", "operations", "string_final", "string_placeholders", "binary"]
+PACKED_EMIT_TYPES = ["decimal", "binary", "packed"]
 
 # TODO: Move to config
 RELOCATION_MODE = "end_to_end"
 
+# NOOP codelets whose output is a view of their first input
+VIEW_OP_PREFIXES = ("tensor_reshape", "coarse_flatten", "tensor_squeeze")
+# Element-wise codelets which can write their output over an input of the same size
+INPLACE_OP_PREFIXES = ("elem_add", "elem_sub", "elem_mul", "elem_div", "relu", "leaky_relu", "elem_clip", "elem_tanh",
+                       "elem_sigmoid", "elem_sqrt", "elem_exp", "elem_ceil")
+
 @dataclass
 class CompilationStage:
     name: str
@@ -29,6 +43,10 @@ class CompilationStage:
     dependencies: List[str]
     fn_kwargs: Dict[str, Any] = field(default_factory=dict)
     skip_noops: bool = field(default=True)
+    # Parallel stages only read and write the codelet they are applied to, and can be run in a process pool
+    parallel: bool = field(default=False)
+    # Stages which do not read storage capacities are not invalidated when a buffer is resized
+    storage_dependent: bool = field(default=True)
 
     def __post_init__(self):
         # TODO: Check function signature
@@ -54,6 +72,17 @@ class OperandDataflow:
         self.write_operand_names.append(operand.name)
         self.cdlt_write.append(cdlt.instance_id)
 
+def instantiate_codelet_operations(program: 'CodeletProgram', node: pm.Node, cdlt: Codelet) -> Codelet:
+    cdlt.instantiate_operations(node, program.hag)
+    return cdlt
+
+
+# Applied as a stage when the compilation cache is used, so that instantiated codelets can be reused. Operation
+# instantiation uses global operation ids, so the stage is never run in a process pool.
+INSTANTIATE_OPERATIONS_STAGE = CompilationStage("instantiate_operations", "codelet", instantiate_codelet_operations, [],
+                                                parallel=False, storage_dependent=False)
+
+
 class CodeletProgram(object):
 
     def __init__(self, graph: pm.Node, hag: ArchitectureNode, program_mode: str="inference", metadata=None):
@@ -77,7 +106,7 @@ class CodeletProgram(object):
         self._program_flex_templates = {"start": [], "end": []}
         self._cdlt_flex_templates = {"start": {}, "end": {}}
         self._codelet_templates = {}
-        self._relocatables = EndToEndRelocationTable(hag.get_off_chip_storage(), addr_alignment=hag.meta_cfg['ADDR_ALIGNMENT']) if RELOCATION_MODE == "end_to_end" else DebugRelocationTable(hag.get_off_chip_storage(), addr_alignment=hag.meta_cfg['ADDR_ALIGNMENT'])
+        self._relocatables = EndToEndRelocationTable(hag.get_off_chip_storage(), addr_alignment=hag.meta_cfg['ADDR_ALIGNMENT'], allocator=hag.meta_cfg.get('DRAM_ALLOCATOR', DEFAULT_DRAM_ALLOCATOR)) if RELOCATION_MODE == "end_to_end" else DebugRelocationTable(hag.get_off_chip_storage(), addr_alignment=hag.meta_cfg['ADDR_ALIGNMENT'])
         self._compilation_pipeline = defaultdict(list)
         self._preproc_stages = defaultdict(list)
         self._template_stages = defaultdict(list)
@@ -85,8 +114,15 @@ class CodeletProgram(object):
         self._program_mode = program_mode
         self._side_effect_params = {'program': {}, 'codelet': {}, 'op': {}}
         self._operand_mapping = {}
-
-    def reset_compilation_state(self):
+        self._compilation_cache = CompilationCache(hag)
+        self._use_compilation_cache = False
+        self._relocation_ns_offsets = None
+        self._weight_storage_names = {}
+        self._profiler = None
+
+    def reset_compilation_state(self, keep_pipeline=False):
+        # Keeping the pipeline retains the compilation stages and relocation offsets, so that the program can be
+        # recompiled incrementally using the compilation cache
         Operation.reset()
         Codelet.reset()
         self._compilation_state = {
@@ -104,13 +140,18 @@ class CodeletProgram(object):
         self._program_flex_templates = {"start": [], "end": []}
         self._cdlt_flex_templates = {"start": {}, "end": {}}
         self._codelet_templates = {}
-        self._relocatables = EndToEndRelocationTable(self.hag.get_off_chip_storage(), addr_alignment=self.hag.meta_cfg['ADDR_ALIGNMENT']) if RELOCATION_MODE == "end_to_end" else DebugRelocationTable(self.hag.get_off_chip_storage(), addr_alignment=self.hag.meta_cfg['ADDR_ALIGNMENT'])
+        self._relocatables = EndToEndRelocationTable(self.hag.get_off_chip_storage(), addr_alignment=self.hag.meta_cfg['ADDR_ALIGNMENT'], allocator=self.hag.meta_cfg.get('DRAM_ALLOCATOR', DEFAULT_DRAM_ALLOCATOR)) if RELOCATION_MODE == "end_to_end" else DebugRelocationTable(self.hag.get_off_chip_storage(), addr_alignment=self.hag.meta_cfg['ADDR_ALIGNMENT'])
+        self._side_effect_params = {'program': {}, 'codelet': {}, 'op': {}}
+        self._operand_mapping = {}
+        if keep_pipeline:
+            if self._relocation_ns_offsets is not None:
+                self.set_relocation_ns_offsets(*self._relocation_ns_offsets)
+            return
+        self._relocation_ns_offsets = None
         self._compilation_pipeline = defaultdict(list)
         self._preproc_stages = defaultdict(list)
         self._template_stages = defaultdict(list)
         self._instruction_stages = defaultdict(list)
-        self._side_effect_params = {'program': {}, 'codelet': {}, 'op': {}}
-        self._operand_mapping = {}
 
     @property
     def metadata(self):
@@ -184,6 +225,19 @@ class CodeletProgram(object):
     def codelet_templates(self):
         return self._codelet_templates
 
+    @property
+    def compilation_cache(self) -> CompilationCache:
+        return self._compilation_cache
+
+    @property
+    def profiler(self) -> CompilationProfiler:
+        return self._profiler
+
+    def profile(self, name: str, cdlt: Codelet = None):
+        if self._profiler is None:
+            return nullcontext()
+        return self._profiler.record(name, STAGE_CATEGORY, cdlt)
+
     def add_side_effect_param(self, name, scope, init_val):
         if scope == 'program':
             self._side_effect_params[scope][name] = init_val
@@ -196,20 +250,73 @@ class CodeletProgram(object):
 
     def set_relocation_ns_offsets(self, offsets: Dict[str, int], offset_type="address"):
         assert self.relocatables.is_empty
+        self._relocation_ns_offsets = (offsets, offset_type)
         mem_layout = list(offsets.keys())
-        assert offset_type in ["address", "bits"]
-        if offset_type == "address":
-            nbanks = self.relocatables.storage_node.banks
-            width = self.relocatables.storage_node.width
-            offsets = {k: v*nbanks*width for k, v in offsets.items()}
+        offsets = self.ns_offsets_to_bits(offsets, offset_type)
         self._relocatables = EndToEndRelocationTable(self.hag.get_off_chip_storage(),
                                              mem_layout=mem_layout,
                                              offsets=offsets,
-                                             addr_alignment=self.hag.meta_cfg['ADDR_ALIGNMENT']) if RELOCATION_MODE == "end_to_end" else DebugRelocationTable(self.hag.get_off_chip_storage(),
+                                             addr_alignment=self.hag.meta_cfg['ADDR_ALIGNMENT'],
+                                             allocator=self.hag.meta_cfg.get('DRAM_ALLOCATOR', DEFAULT_DRAM_ALLOCATOR)) if RELOCATION_MODE == "end_to_end" else DebugRelocationTable(self.hag.get_off_chip_storage(),
                                                                                                                                                 mem_layout=mem_layout,
                                                                                                                                                 offsets=offsets,
                                                                                                                                                 addr_alignment=self.hag.meta_cfg['ADDR_ALIGNMENT'])
 
+    def deduplicate_weights(self, initializers: Dict[str, np.ndarray]) -> Dict[str, str]:
+        # Initializers with identical contents are mapped to the first initializer with the same data. Duplicates
+        # only share DRAM storage with weights stored in the same layout, see EndToEndRelocationTable.weight_layout
+        storage_names = {}
+        for name, data in initializers.items():
+            data = np.ascontiguousarray(data)
+            digest = (hashlib.sha256(data.tobytes()).hexdigest(), data.shape, str(data.dtype))
+            storage_name = storage_names.setdefault(digest, name)
+            if storage_name != name:
+                self._weight_storage_names[name] = storage_name
+        return self._weight_storage_names
+
+    def weight_storage_name(self, name: str) -> str:
+        return self._weight_storage_names.get(name, name)
+
+    def ns_offsets_to_bits(self, offsets: Dict[str, int], offset_type="address") -> Dict[str, int]:
+        assert offset_type in ["address", "bits"]
+        if offset_type == "address":
+            nbanks = self.relocatables.storage_node.banks
+            width = self.relocatables.storage_node.width
+            offsets = {k: v*nbanks*width for k, v in offsets.items()}
+        return offsets
+
+    def relocate(self, offsets: Dict[str, int], offset_type="address", verbose=False):
+        # Applies a new memory layout to a finalized program by moving the relocation namespaces and patching the
+        # lazily evaluated instruction fields, which hold all relocation-dependent values, without recompiling
+        if not self.compilation_state['finalized']:
+            raise RuntimeError(f"Unable to relocate program {self.name} before it is finalized")
+        for ns, start in self.ns_offsets_to_bits(offsets, offset_type).items():
+            if ns not in self.relocatables.mem_layout:
+                raise KeyError(f"Unable to relocate unknown namespace {ns}:\n"
+                               f"Namespaces: {self.relocatables.mem_layout}")
+            self.relocatables.relocate_namespace(ns, start)
+        self.relocatables.check_namespace_overlaps()
+
+        for cdlt in self.codelets:
+            if cdlt.is_noop():
+                continue
+            if verbose:
+                print(f"Patching relocated fields for {cdlt.op_name}{cdlt.instance_id}")
+            with self.profile("relocate", cdlt):
+                self.evaluate_lazy_instruction_templates(cdlt)
+
+    def relocation_patches(self) -> List[Tuple[int, str, int, str, str]]:
+        # The instruction fields updated by `relocate`, as (codelet id, instruction name, index of the instruction
+        # in its template, field name, field expression)
+        patches = []
+        for cdlt in self.codelets:
+            for ft, _ in self.codelet_flex_templates(cdlt):
+                for row, f_idx, _ in ft.instructions.lazy_fields:
+                    base_instr = ft.base_instructions[ft.instructions.base_index(row)]
+                    f = base_instr.fields[f_idx]
+                    patches.append((cdlt.instance_id, base_instr.opname, row, f.field_name, f.param_fn.fn_body_str))
+        return patches
+
     def update_side_effect_param(self, name, scope, value, codelet_id=None, operation_id=None):
         if scope == 'program':
             self._side_effect_params[scope][name] = value
@@ -226,6 +333,13 @@ class CodeletProgram(object):
     def add_codelet(self, cdlt: Codelet):
         self._codelets.append(cdlt)
 
+    def replace_codelet(self, cdlt: Codelet):
+        for i, c in enumerate(self.codelets):
+            if c.instance_id == cdlt.instance_id:
+                self._codelets[i] = cdlt
+                return
+        raise KeyError(f"Unable to replace codelet with id {cdlt.instance_id} in codelet list")
+
     def get_codelet(self, cdlt_id: int):
         for cdlt in self.codelets:
             if cdlt.instance_id == cdlt_id:
@@ -303,7 +417,9 @@ class CodeletProgram(object):
                              insert_idx=-1,
                              preproc=False,
                              template=False,
-                             instruction=False
+                             instruction=False,
+                             parallel=False,
+                             storage_dependent=True
                              ):
         if not callable(compilation_fn):
             raise TypeError(f"Compilation step must be a callable function:\n"
@@ -318,7 +434,8 @@ class CodeletProgram(object):
         # for d in dependencies:
         #     assert d in level_names
 
-        fn_obj = CompilationStage(name, level, compilation_fn, dependencies, fn_kwargs=stage_kwargs, skip_noops=skip_noops)
+        fn_obj = CompilationStage(name, level, compilation_fn, dependencies, fn_kwargs=stage_kwargs, skip_noops=skip_noops,
+                                  parallel=parallel, storage_dependent=storage_dependent)
         assert not (preproc and template)
         if preproc:
             if insert_idx >= 0:
@@ -619,6 +736,127 @@ class CodeletProgram(object):
 
 
 
+    def instruction_templates(self):
+        # FlexTemplates in the order in which their instructions are emitted
+        yield from self.program_flex_templates['start']
+        for c in self.codelets:
+            if c.is_noop():
+                continue
+            yield from self.cdlt_flex_templates['start'].get(c.instance_id, [])
+            for o in c.ops:
+                yield from o.instructions
+            yield from self.cdlt_flex_templates['end'].get(c.instance_id, [])
+        yield from self.program_flex_templates['end']
+
+    def packed_program(self):
+        # Returns the packed instruction words of the program, and the length in bits of each instruction
+        buffers = [ft.instructions for ft in self.instruction_templates() if len(ft.instructions) > 0]
+        if len(buffers) == 0:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+        words = np.concatenate([b.words() for b in buffers])
+        instr_lengths = np.concatenate([b.instr_lengths() for b in buffers])
+        return words, instr_lengths
+
+    def save_packed_program(self, path, words=None, instr_lengths=None):
+        if words is None:
+            words, instr_lengths = self.packed_program()
+        with open(path, "wb") as f:
+            f.write(pack_words(words, instr_lengths))
+        return words
+
+    def emit_template_outputs(self, ft: FlexTemplate, output_types: List[str]) -> Dict[str, Any]:
+        # Binary and decimal instructions are formatted from the same packed words
+        outputs = {}
+        if len(ft.instructions) > 0 and any([o in PACKED_EMIT_TYPES for o in output_types]):
+            words, instr_lengths = ft.instructions.words(), ft.instructions.instr_lengths()
+            outputs['packed'] = (words, instr_lengths)
+            for o in set(output_types) & {"decimal", "binary"}:
+                outputs[o] = format_words(words, instr_lengths, o)
+        for o in output_types:
+            if o not in outputs and o != "packed":
+                outputs[o] = ft.emit(o)
+        return outputs
+
+    def emit_to_streams(self, streams: Dict[str, Any], cdlt_id=None, json_indent=2):
+        """
+        Writes each output type to its stream in a single traversal of the program, producing the same output as
+        `emit`, or `emit_codelet_as_program` if `cdlt_id` is given. JSON outputs are serialized one codelet at a
+        time using `json_indent`, or in compact form if it is None. The "packed" stream is written with the
+        instruction words of the program, as in `save_packed_program`.
+        """
+        output_types = [o for o in streams if o != "packed"]
+        packed = ["packed"] if "packed" in streams else []
+        json_outputs = {o: StreamingJSONWriter(streams[o], self.program_mode, indent=json_indent)
+                        for o in output_types if o in ["json", "json_no_ops"]}
+        # Text outputs are the program strings joined by newlines, which are written as they are emitted
+        needs_separator = {o: False for o in output_types}
+        packed_words = []
+
+        def write_strings(output_type, strings):
+            if output_type in json_outputs:
+                for string in strings:
+                    json_outputs[output_type].write(string)
+                return
+            for string in strings:
+                if needs_separator[output_type]:
+                    streams[output_type].write("\n")
+                streams[output_type].write(string)
+                needs_separator[output_type] = True
+
+        def template_outputs(ft, types):
+            outputs = self.emit_template_outputs(ft, types + packed)
+            if "packed" in outputs:
+                packed_words.append(outputs["packed"])
+            return outputs
+
+        def write_templates(templates, types):
+            for ft in templates:
+                outputs = template_outputs(ft, types)
+                for o in types:
+                    write_strings(o, outputs[o])
+
+        cdlt_types = [o for o in output_types if o not in ['operations', 'operations_idx']]
+        write_templates(self.program_flex_templates['start'], output_types)
+        codelets = self.codelets if cdlt_id is None else [self.get_codelet(cdlt_id)]
+        for c in codelets:
+            if cdlt_id is None and c.is_noop():
+                continue
+            if len(cdlt_types + packed) > 0:
+                write_templates(self.cdlt_flex_templates['start'][c.instance_id], cdlt_types)
+
+            # The instructions of each operation are emitted once for all output types
+            Operation.current_codelet = c
+            cdlt_strings = {o: [] for o in output_types if o in ["string_final", "decimal", "binary"]}
+            for o in c.ops:
+                for ft in o.instructions:
+                    outputs = template_outputs(ft, list(cdlt_strings.keys()))
+                    for otype, strings in cdlt_strings.items():
+                        strings += outputs[otype]
+            for o in output_types:
+                if o in cdlt_strings:
+                    write_strings(o, ["\n".join(cdlt_strings[o])])
+                else:
+                    write_strings(o, [self.emit_single_codelet(c, o)])
+
+            if len(cdlt_types + packed) > 0:
+                write_templates(self.cdlt_flex_templates['end'][c.instance_id], cdlt_types)
+        write_templates(self.program_flex_templates['end'], output_types)
+
+        for writer in json_outputs.values():
+            writer.close()
+
+        if len(packed) > 0:
+            if len(packed_words) > 0:
+                words = np.concatenate([w for w, _ in packed_words])
+                instr_lengths = np.concatenate([l for _, l in packed_words])
+            else:
+                words, instr_lengths = np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+            streams["packed"].write(pack_words(words, instr_lengths))
+
+    def emit_json(self, stream, output_type="json", indent=None, cdlt_id=None):
+        assert output_type in ["json", "json_no_ops"]
+        self.emit_to_streams({output_type: stream}, cdlt_id=cdlt_id, json_indent=indent)
+
     def emit_codelet_as_program(self, cdlt_id, output_type: str):
         program_strings = []
         # Emit program start
@@ -659,29 +897,54 @@ class CodeletProgram(object):
             res = json.loads(json.dumps(res, cls=CodeletJSONEncoder))
             return res
 
-    def instantiate_instructions_templates(self, node, cdlt, verbose=False):
+    def instantiate_instructions_templates(self, node, cdlt, verbose=False, evaluate=True):
         self.set_instruction_templates(cdlt)
 
         self.relocatables.add_data_relocation(node, cdlt)
 
-        self.instantiate_instructions(cdlt, verbose=verbose)
-
         if self.hag.has_op_template("codelet", "start"):
-            cdlt_start = self.hag.get_cdlt_op_template_copy("start")
-            args = (self, self.hag, -1, cdlt.instance_id)
-            for ft in cdlt_start:
-                assert ft.template_type == "codelet"
-                ft.evaluate(*args)
-            self._cdlt_flex_templates['start'][cdlt.instance_id] = cdlt_start
+            self._cdlt_flex_templates['start'][cdlt.instance_id] = self.hag.get_cdlt_op_template_copy("start")
 
         if self.hag.has_op_template("codelet", "end"):
-            cdlt_end = self.hag.get_cdlt_op_template_copy("end")
+            self._cdlt_flex_templates['end'][cdlt.instance_id] = self.hag.get_cdlt_op_template_copy("end")
+
+        if evaluate:
+            self.evaluate_instruction_templates(cdlt, verbose=verbose)
+
+    def codelet_flex_templates(self, cdlt):
+        # All instruction templates for a codelet, with the arguments used to evaluate them
+        for o in cdlt.ops:
+            for ft in o.instructions:
+                yield ft, (self, self.hag, o.global_op_id, cdlt.instance_id)
+
+        for position in ["start", "end"]:
+            for ft in self._cdlt_flex_templates[position].get(cdlt.instance_id, []):
+                yield ft, (self, self.hag, -1, cdlt.instance_id)
+
+    def evaluate_instruction_templates(self, cdlt, verbose=False, predicted=False):
+        self.instantiate_instructions(cdlt, verbose=verbose)
+
+        for position in ["start", "end"]:
             args = (self, self.hag, -1, cdlt.instance_id)
-            for ft in cdlt_end:
+            for ft in self._cdlt_flex_templates[position].get(cdlt.instance_id, []):
                 assert ft.template_type == "codelet"
                 ft.evaluate(*args)
-            self._cdlt_flex_templates['end'][cdlt.instance_id] = cdlt_end
 
+        # Predicted counts have already been used for the instruction memory layout, so they must be exact
+        if predicted:
+            for ft, _ in self.codelet_flex_templates(cdlt):
+                if len(ft.instructions) != ft.num_instructions:
+                    raise RuntimeError(f"Predicted instruction count does not match the number of generated "
+                                       f"instructions for {cdlt.op_name}{cdlt.instance_id}:\n"
+                                       f"Predicted: {ft.num_instructions}\n"
+                                       f"Generated: {len(ft.instructions)}\n"
+                                       f"Base instructions: {ft.base_instr_str()}")
+
+    def predict_cdlt_num_instr(self, cdlt) -> int:
+        # Counts the instructions of the codelet's instantiated templates without generating them, by evaluating
+        # only their iterables, conditions, and side effects
+        cdlt = self.get_codelet(cdlt.instance_id)
+        return sum([ft.set_instruction_length(*args) for ft, args in self.codelet_flex_templates(cdlt)])
 
     def evaluate_lazy_instruction_templates(self, cdlt):
         if self.hag.has_op_template("codelet", "start"):
@@ -764,6 +1027,7 @@ class CodeletProgram(object):
         with open(full_path, 'w') as outfile:
             outfile.write(instructions)
 
+    @profile_phase("sequence_nodes")
     def sequence_nodes(self, sequence_algorithm, validate_lowered=True, verbose=False, **sequence_kwargs):
         # TODO: Add support for different sequencing algos
 
@@ -844,14 +1108,30 @@ class CodeletProgram(object):
         # cdlt_templates = {name: self.hag.get_codelet_template(name) for name in node_ops}
         return cdlt_templates
 
+    @profile_phase("template_stages")
     def run_template_stages(self, node_sequence, verbose=False):
 
         if verbose and len(self.template_stages.keys()) > 0:
             print(f"Running template stages")
 
         self._codelet_templates = self.get_required_templates(node_sequence)
-        for level, fns in self.template_stages.items():
+        all_fns = [fn for fns in self.template_stages.values() for fn in fns]
+        template_keys = {}
+        if self._use_compilation_cache:
             for template_name in list(self.codelet_templates.keys()):
+                key, cached = self.compilation_cache.get_template(template_name, self.codelet_templates[template_name],
+                                                                  all_fns)
+                if cached is not None:
+                    if verbose:
+                        print(f"Using cached template stages for {template_name}")
+                    self.codelet_templates[template_name] = cached
+                else:
+                    template_keys[template_name] = (key, self.codelet_templates[template_name])
+        else:
+            template_keys = {name: (None, None) for name in self.codelet_templates.keys()}
+
+        for level, fns in self.template_stages.items():
+            for template_name in template_keys:
                 cdlt_tmplt = self.codelet_templates[template_name]
                 for fn in fns:
                     cdlt_tmplt = fn.run(self, cdlt_tmplt)
@@ -860,34 +1140,113 @@ class CodeletProgram(object):
                                         f" does not return codelet template.")
                 self.codelet_templates[template_name] = cdlt_tmplt
 
-    def run_preprocessing_stages(self, node_sequence, codelets, verbose=False):
-        if verbose:
-            print(f"\nRunning Preprocessing functions")
+        if self._use_compilation_cache:
+            for template_name, (key, template) in template_keys.items():
+                self.compilation_cache.add_template(template_name, key, template,
+                                                    self.codelet_templates[template_name], all_fns)
 
-        stage_start = time()
-        for level, fns in self.preproc_stages.items():
+    def run_codelet_stages(self, node, cdlt, fns, verbose=False):
+        for fn in fns:
+            if cdlt.is_noop() and fn.skip_noops:
+                if verbose:
+                    print(f"Skipping NOOP codelet {cdlt.op_name}{cdlt.instance_id}")
+                continue
+            if verbose:
+                print(f"Applying stage {fn.name} on codelet {cdlt.op_name}{cdlt.instance_id}")
+            cdlt = self.run_codelet_stage(fn, node, cdlt)
+        return cdlt
+
+    def run_codelet_stage(self, fn: CompilationStage, node, cdlt):
+        if self._profiler is None:
+            return fn.run(self, node, cdlt)
+        search_stats = cdlt.tiling_search_stats
+        with self._profiler.record(fn.name, STAGE_CATEGORY, cdlt) as event:
+            cdlt = fn.run(self, node, cdlt)
+        # Tiling stores new search statistics on the codelet
+        if cdlt.tiling_search_stats is not search_stats:
+            event.permutations = cdlt.tiling_search_stats.get('visited', 0)
+        return cdlt
+
+    def run_stage_level(self, node_sequence, codelets, fns, verbose=False, workers=1):
+        # Consecutive parallel stages are applied to every codelet, in a process pool or using the compilation
+        # cache, before moving on to the next group of stages. Otherwise, stages are applied codelet-by-codelet.
+        batch_parallel = workers > 1 or self._use_compilation_cache
+        for run_parallel, stage_group in groupby(fns, key=lambda fn: fn.parallel and batch_parallel):
+            stage_group = list(stage_group)
+            if run_parallel:
+                codelets = self.run_parallel_stage_group(node_sequence, codelets, stage_group, verbose=verbose,
+                                                         workers=workers)
+            else:
+                for n in node_sequence:
+                    codelets[n.name] = self.run_codelet_stages(n, codelets[n.name], stage_group, verbose=verbose)
+        return codelets
+
+    def run_parallel_stage_group(self, node_sequence, codelets, fns, verbose=False, workers=1):
+        assert workers == 1 or all([fn.parallel for fn in fns]), \
+            f"Stages {[fn.name for fn in fns if not fn.parallel]} cannot be run in a process pool"
+        if not self._use_compilation_cache:
+            if workers > 1:
+                return run_parallel_stages(self, node_sequence, codelets, fns, workers, verbose=verbose)
             for n in node_sequence:
-                cdlt = codelets[n.name]
+                codelets[n.name] = self.run_codelet_stages(n, codelets[n.name], fns, verbose=verbose)
+            return codelets
+
+        # Only the first codelet with a given signature is compiled, the others are copied from it
+        cache = self.compilation_cache
+        compiled_nodes = []
+        cached_nodes = []
+        signatures = {}
+        compiled_keys = set()
+        arch_hash = cache.stage_arch_hash(fns)
+        for n in node_sequence:
+            cdlt = codelets[n.name]
+            if cdlt.is_noop() and all([fn.skip_noops for fn in fns]):
+                continue
+            key = cache.signature(cdlt, fns, arch_hash=arch_hash)
+            if key in cache or key in compiled_keys:
+                cached_nodes.append(n)
+            else:
+                cache.misses += 1
+                compiled_nodes.append(n)
+                compiled_keys.add(key)
+            signatures[n.name] = key
 
-                for fn in fns:
-                    if cdlt.is_noop() and fn.skip_noops:
-                        if verbose:
-                            print(f"Skipping NOOP {cdlt.op_name}")
-                        continue
-                    if verbose:
-                        print(f"Preprocessing with {fn.name} on codelet {cdlt.op_name}{cdlt.instance_id}")
+        if workers > 1 and len(compiled_nodes) > 1:
+            codelets = run_parallel_stages(self, compiled_nodes, codelets, fns, workers, verbose=verbose)
+        else:
+            for n in compiled_nodes:
+                codelets[n.name] = self.run_codelet_stages(n, codelets[n.name], fns, verbose=verbose)
+
+        for n in compiled_nodes:
+            cache.add(signatures[n.name], codelets[n.name])
 
-                    cdlt = fn.run(self, n, cdlt)
+        for n in cached_nodes:
+            cdlt = cache.get(signatures[n.name], codelets[n.name])
+            if verbose:
+                print(f"Using cached compilation for codelet {cdlt.op_name}{cdlt.instance_id}")
+            self.replace_codelet(cdlt)
+            codelets[n.name] = cdlt
 
-                assert n.name in codelets and codelets[n.name].instance_id == cdlt.instance_id
-                codelets[n.name] = cdlt
+        return codelets
+
+    @profile_phase("preprocessing")
+    def run_preprocessing_stages(self, node_sequence, codelets, verbose=False, workers=1):
+        if verbose:
+            print(f"\nRunning Preprocessing functions")
+
+        stage_start = time()
+        instance_ids = {name: cdlt.instance_id for name, cdlt in codelets.items()}
+        for level, fns in self.preproc_stages.items():
+            codelets = self.run_stage_level(node_sequence, codelets, fns, verbose=verbose, workers=workers)
 
+        assert all([codelets[n.name].instance_id == instance_ids[n.name] for n in node_sequence])
 
         if verbose:
             print(f"\nPreprocessing took {time() - stage_start} seconds")
 
         return codelets
 
+    @profile_phase("codelet_instantiation")
     def instantiate_all_codelets(self, node_sequence, verbose=False):
         codelets = {}
 
@@ -906,11 +1265,20 @@ class CodeletProgram(object):
 
         return codelets
 
+    @profile_phase("operation_instantiation")
     def instantiate_all_operations(self, node_sequence, codelets, verbose=False):
         if verbose:
             print(f"\nInstantiating Codelet Operations")
 
         stage_start = time()
+        if self._use_compilation_cache:
+            # Operation instantiation uses global operation ids, so it is never run in a process pool
+            codelets = self.run_parallel_stage_group(node_sequence, codelets, [INSTANTIATE_OPERATIONS_STAGE],
+                                                     verbose=verbose)
+            if verbose:
+                print(f"\nCodelet instantiation took {time() - stage_start}")
+            return codelets
+
         for n in node_sequence:
             cdlt = codelets[n.name]
             if cdlt.is_noop():
@@ -928,34 +1296,23 @@ class CodeletProgram(object):
             print(f"\nCodelet instantiation took {time() - stage_start}")
         return codelets
 
-    def run_compilation_stages(self, node_sequence, codelets, verbose=False):
+    @profile_phase("compilation_stages")
+    def run_compilation_stages(self, node_sequence, codelets, verbose=False, workers=1):
         if verbose:
             print(f"\nRunning compilation stages")
+            if workers > 1:
+                print(f"Using {workers} workers for parallel stages")
 
         stage_start = time()
         for level, fns in self.compilation_pipeline.items():
-            for n in node_sequence:
-                cdlt = codelets[n.name]
-
-                for fn in fns:
-
-
-                    if cdlt.is_noop() and fn.skip_noops:
-                        if verbose:
-                            print(f"Skipping NOOP codelet {cdlt.op_name}{cdlt.instance_id}")
-                        continue
-                    if verbose:
-                        print(f"Applying stage {fn.name} on codelet {cdlt.op_name}{cdlt.instance_id}")
-                    cdlt = fn.run(self, n, cdlt)
-
-
-                codelets[n.name] = cdlt
+            codelets = self.run_stage_level(node_sequence, codelets, fns, verbose=verbose, workers=workers)
 
         if verbose:
             print(f"\nCompilation stages took {time() - stage_start} seconds")
 
         return codelets
 
+    @profile_phase("finalize_memory")
     def finalize_memory(self, node_sequence, codelets: List[Codelet], verbose=False):
 
         for n in node_sequence:
@@ -990,7 +1347,8 @@ class CodeletProgram(object):
                                            f"Mem node size: {mem_node.size_bytes}"))
 
 
-    def finalize_instructions(self, node_sequence, codelets, verbose=False):
+    @profile_phase("finalize_instructions")
+    def finalize_instructions(self, node_sequence, codelets, verbose=False, evaluate=True):
         if verbose:
             print(f"\nFinalizing instruction templates")
 
@@ -1011,8 +1369,24 @@ class CodeletProgram(object):
                 continue
             if verbose:
                 print(f"Instantiating template for {cdlt.op_name}{cdlt.instance_id}")
-            self.instantiate_instructions_templates(n, codelets[n.name], verbose=verbose)
+            with self.profile("instantiate_instructions", cdlt):
+                self.instantiate_instructions_templates(n, codelets[n.name], verbose=verbose, evaluate=evaluate)
+
+        if evaluate:
+            self.finalize_program_end_instructions()
+
+    @profile_phase("evaluate_instructions")
+    def evaluate_all_instruction_templates(self, node_sequence, codelets, verbose=False):
+        # Generates the instructions of templates instantiated by `finalize_instructions` with 'evaluate=False'
+        for n in node_sequence:
+            cdlt = codelets[n.name]
+            if cdlt.is_noop():
+                continue
+            with self.profile("instantiate_instructions", cdlt):
+                self.evaluate_instruction_templates(cdlt, verbose=verbose, predicted=True)
+        self.finalize_program_end_instructions()
 
+    def finalize_program_end_instructions(self):
         # Generate program end, if it exists
         if self.hag.has_op_template("program", "end"):
             end_instrs = self.hag.get_program_template_copy("end")
@@ -1046,7 +1420,8 @@ class CodeletProgram(object):
         return base + start_instr + end_instr
 
 
-    def finalize_instruction_memory(self, node_sequence, codelets, verbose=False):
+    @profile_phase("finalize_instruction_memory")
+    def finalize_instruction_memory(self, node_sequence, codelets, verbose=False, predicted=False):
         if verbose:
             print(f"Finalizing Instruction memory")
 
@@ -1056,11 +1431,14 @@ class CodeletProgram(object):
                 if verbose:
                     print(f"Skipping NOOP codelet {cdlt.op_name}{cdlt.instance_id}")
                 continue
-            num_instr = self.cdlt_num_instr(cdlt)
+            num_instr = self.predict_cdlt_num_instr(cdlt) if predicted else self.cdlt_num_instr(cdlt)
             end_instr_addr = num_instr * self.hag.instr_length
             self.relocatables.update_relocation_offset('INSTR_MEM', cdlt.cdlt_uid, end_instr_addr)
         self.relocatables.finalize_memory()
+        if verbose and isinstance(self.relocatables, EndToEndRelocationTable):
+            self.relocatables.print_memory_footprint()
 
+    @profile_phase("finalize_flex_params")
     def finalize_flex_params(self, node_sequence, codelets, verbose=False):
         if verbose:
             print(f"\nEvaluating post-processed FlexParams")
@@ -1074,8 +1452,10 @@ class CodeletProgram(object):
 
             if verbose:
                 print(f"Evaluating lazy FlexParams for {cdlt.op_name}{cdlt.instance_id}")
-            self.evaluate_lazy_instruction_templates(codelets[n.name])
+            with self.profile("evaluate_lazy_flex_params", cdlt):
+                self.evaluate_lazy_instruction_templates(codelets[n.name])
 
+    @profile_phase("instruction_stages")
     def run_instruction_stages(self, codelets, verbose=False):
         if verbose and len(self.instruction_stages.keys()) > 0:
             print(f"Running instruction stages")
@@ -1091,7 +1471,8 @@ class CodeletProgram(object):
                         continue
                     if verbose:
                         print(f"Preprocessing with {fn.name} on codelet {cdlt.op_name}{cdlt.instance_id}")
-                    cdlt = fn.run(self, cdlt)
+                    with self.profile(fn.name, cdlt):
+                        cdlt = fn.run(self, cdlt)
 
                 finalized_codelets[name] = cdlt
 
@@ -1100,10 +1481,60 @@ class CodeletProgram(object):
 
         return codelets
 
-    def finalize_program(self, node_sequence, codelets, verbose=False):
+    @profile_phase("alias_activations")
+    def alias_activations(self, node_sequence, codelets, verbose=False):
+        # Outputs of view-only and element-wise codelets are stored in the DRAM buffer of an input. Element-wise
+        # outputs only reuse inputs which are not read by any later node.
+        last_reads = {}
+        for i, n in enumerate(node_sequence):
+            for inpt in n.inputs:
+                last_reads[inpt.name] = i
+
+        group_last_reads = {}
+        for i, n in enumerate(node_sequence):
+            cdlt = codelets[n.name]
+            if len(n.outputs) != 1 or len(cdlt.outputs) != 1:
+                continue
+            if cdlt.is_noop() and cdlt.op_name.startswith(VIEW_OP_PREFIXES):
+                input_idxs = [0]
+            elif not cdlt.is_noop() and cdlt.op_name.startswith(INPLACE_OP_PREFIXES):
+                input_idxs = list(range(len(n.inputs)))
+            else:
+                continue
+
+            out_name = n.outputs[0].name
+            out_size = np.prod(cdlt.outputs[0].shape) * cdlt.outputs[0].dtype.bits()
+            for idx in input_idxs:
+                inpt = n.inputs[idx]
+                if not isinstance(inpt, pm.output) or inpt.name == out_name or \
+                        np.prod(cdlt.inputs[idx].shape) * cdlt.inputs[idx].dtype.bits() != out_size:
+                    continue
+                root_name = self.relocatables.tensor_aliases.get(inpt.name, inpt.name)
+                group_last_read = group_last_reads.get(root_name, last_reads.get(root_name, i))
+                if not cdlt.is_noop() and group_last_read > i:
+                    continue
+                self.relocatables.add_tensor_alias(out_name, inpt.name)
+                group_last_reads[root_name] = max(group_last_read, last_reads.get(out_name, i))
+                if verbose:
+                    print(f"Aliasing {out_name} to {root_name} for {cdlt.op_name}{cdlt.instance_id}")
+                break
+
+    def finalize_program(self, node_sequence, codelets, verbose=False, predict_instr_counts=False):
+        if isinstance(self.relocatables, EndToEndRelocationTable):
+            for name, storage_name in self._weight_storage_names.items():
+                self.relocatables.add_weight_duplicate(name, storage_name)
+            if self.hag.meta_cfg.get('ALIAS_ACTIVATIONS', True):
+                self.alias_activations(node_sequence, codelets, verbose=verbose)
         self.finalize_memory(node_sequence, codelets, verbose=verbose)
-        self.finalize_instructions(node_sequence, codelets, verbose=verbose)
-        self.finalize_instruction_memory(node_sequence, codelets, verbose=verbose)
+        if predict_instr_counts:
+            # The instruction memory is laid out using the predicted number of instructions for each codelet,
+            # before any of the instructions are generated
+            self.finalize_instructions(node_sequence, codelets, verbose=verbose, evaluate=False)
+            self.finalize_instruction_memory(node_sequence, codelets, verbose=verbose, predicted=True)
+            self.evaluate_all_instruction_templates(node_sequence, codelets, verbose=verbose)
+        else:
+            self.finalize_instructions(node_sequence, codelets, verbose=verbose)
+            self.finalize_instruction_memory(node_sequence, codelets, verbose=verbose)
         self.finalize_flex_params(node_sequence, codelets, verbose=verbose)
 
 
@@ -1112,6 +1543,11 @@ class CodeletProgram(object):
                 finalize=True, force_recompile=False,
                          filter_op_types=None,
                          skip_op_types=None,
+                         workers=1,
+                         cache_codelets=False,
+                         incremental=False,
+                         profile=False,
+                         predict_instr_counts=False,
                 **compile_kwargs):
         # This function performs breadth-first compilation, with coarsest abstractions first:
         # 1. Generate codelets from nodes
@@ -1119,7 +1555,14 @@ class CodeletProgram(object):
         # 3. Generate instruction templates within operations
         if force_recompile:
             self.reset_compilation_state()
+        elif incremental:
+            self.reset_compilation_state(keep_pipeline=True)
+        cache_codelets = cache_codelets or incremental
+        # A new profile is recorded for each compilation, and is available through 'program.profiler'
+        self._profiler = CompilationProfiler() if profile else None
         start = time()
+        self._use_compilation_cache = cache_codelets
+        self.compilation_cache.reset_stats()
 
         unfiltered_sequence = self.sequence_nodes(sequence_algorithm, verbose=verbose, **compile_kwargs)
         if cdlt_uids is not None:
@@ -1149,38 +1592,57 @@ class CodeletProgram(object):
                 print(f"\nLoading predefined tiling at {tiling_path}")
             self.load_tiling(tiling_path)
 
-        codelets = self.run_preprocessing_stages(node_sequence, codelets, verbose=verbose)
+        codelets = self.run_preprocessing_stages(node_sequence, codelets, verbose=verbose, workers=workers)
         self.update_compilation_state('preprocessed')
 
         codelets = self.instantiate_all_operations(node_sequence, codelets, verbose=verbose)
         self.update_compilation_state('operation_instantiation')
 
-        codelets = self.run_compilation_stages(node_sequence, codelets, verbose=verbose)
+        codelets = self.run_compilation_stages(node_sequence, codelets, verbose=verbose, workers=workers)
         self.update_compilation_state('compilation_stages')
 
         if finalize and self.hag.meta_cfg['GENERATE_INSTRUCTIONS']:
             # print(f"Finalizing instructions")
-            self.finalize_program(node_sequence, codelets, verbose=verbose)
+            self.finalize_program(node_sequence, codelets, verbose=verbose, predict_instr_counts=predict_instr_counts)
             self.update_compilation_state('finalized')
             self.run_instruction_stages(codelets, verbose=verbose)
             self.update_compilation_state('instruction_stages')
 
         if verbose:
+            if cache_codelets:
+                print(f"\nCompilation cache: {self.compilation_cache.hits} hits, "
+                      f"{self.compilation_cache.misses} misses")
+            if profile:
+                print(f"\n{self.profiler.summary()}")
             print(f"\nTotal compilation time was {time() - start} seconds")
 
     def compile(self, verbose=False, sequence_algorithm="default", tiling_path=None,
                 finalize=True,
                 force_recompile=False,
                 stop_stage=None,
+                workers=1,
+                cache_codelets=False,
+                incremental=False,
+                profile=False,
+                predict_instr_counts=False,
                 **compile_kwargs):
         # This function performs breadth-first compilation, with coarsest abstractions first:
         # 1. Generate codelets from nodes
         # 2. Generate operands/operations within codelets
         # 3. Generate instruction templates within operations
+        # With 'incremental', a previously compiled program is recompiled with the same stages, and only the
+        # stages whose codelets, arguments, or HAG configuration have changed since the last compilation are re-run
         stop_stage = stop_stage or 'instruction_stages'
         if force_recompile:
             self.reset_compilation_state()
+        elif incremental:
+            self.reset_compilation_state(keep_pipeline=True)
+        cache_codelets = cache_codelets or incremental
+        # A new profile is recorded for each compilation, and is available through 'program.profiler'
+        self._profiler = CompilationProfiler() if profile else None
         start = time()
+        self._use_compilation_cache = cache_codelets
+        self.compilation_cache.reset_stats()
 
         node_sequence = self.sequence_nodes(sequence_algorithm, verbose=verbose, **compile_kwargs)
         self.update_compilation_state('sequenced_nodes')
@@ -1203,7 +1665,7 @@ class CodeletProgram(object):
                 print(f"\nLoading predefined tiling at {tiling_path}")
             self.load_tiling(tiling_path)
 
-        codelets = self.run_preprocessing_stages(node_sequence, codelets, verbose=verbose)
+        codelets = self.run_preprocessing_stages(node_sequence, codelets, verbose=verbose, workers=workers)
         self.update_compilation_state('preprocessed')
         if stop_stage == 'preprocessed':
             return
@@ -1212,14 +1674,14 @@ class CodeletProgram(object):
         if stop_stage == 'operation_instantiation':
             return
 
-        codelets = self.run_compilation_stages(node_sequence, codelets, verbose=verbose)
+        codelets = self.run_compilation_stages(node_sequence, codelets, verbose=verbose, workers=workers)
         self.update_compilation_state('compilation_stages')
         if stop_stage == 'compilation_stages':
             return
         # print(f"Finalizing instructions")
 
         if finalize and self.hag.meta_cfg['GENERATE_INSTRUCTIONS']:
-            self.finalize_program(node_sequence, codelets, verbose=verbose)
+            self.finalize_program(node_sequence, codelets, verbose=verbose, predict_instr_counts=predict_instr_counts)
             self.update_compilation_state('finalized')
 
             if stop_stage == 'finalize':
@@ -1230,6 +1692,11 @@ class CodeletProgram(object):
 
 
         if verbose:
+            if cache_codelets:
+                print(f"\nCompilation cache: {self.compilation_cache.hits} hits, "
+                      f"{self.compilation_cache.misses} misses")
+            if profile:
+                print(f"\n{self.profiler.summary()}")
             print(f"\nTotal compilation time was {time() - start} seconds")
 
 
@@ -1254,4 +1721,40 @@ class CodeletJSONEncoder(json.JSONEncoder):
             return float(o)
         elif isinstance(o, Basic):
             return str(o)
-        return json.JSONEncoder.default(self, o)
\ No newline at end of file
+        return json.JSONEncoder.default(self, o)
+
+
+class StreamingJSONWriter(object):
+    """
+    Incrementally writes the JSON output of a program, {"mode": ..., "program": [...]}, so that only a single
+    codelet is serialized at a time. The written text is identical to `json.dump` of the complete output.
+    """
+
+    def __init__(self, stream, mode: str, indent: int = None):
+        self.stream = stream
+        self.indent = indent
+        self.num_items = 0
+        if indent is None:
+            self.stream.write(f'{{"mode": {json.dumps(mode)}, "program": [')
+        else:
+            self.stream.write(f'{{\n{" "*indent}"mode": {json.dumps(mode)},\n{" "*indent}"program": [')
+
+    def write(self, item):
+        item_str = json.dumps(item, cls=CodeletJSONEncoder, indent=self.indent)
+        if self.indent is None:
+            self.stream.write(item_str if self.num_items == 0 else f", {item_str}")
+        else:
+            # Items are nested two levels deep, within the output dict and the program list
+            item_indent = " "*(2*self.indent)
+            item_str = item_str.replace("\n", f"\n{item_indent}")
+            self.stream.write(f"{',' if self.num_items > 0 else ''}\n{item_indent}{item_str}")
+        self.num_items += 1
+
+    def close(self):
+        if self.indent is None:
+            self.stream.write("]}")
+        elif self.num_items == 0:
+            self.stream.write("]\n}")
+        else:
+            self.stream.write(f"\n{' '*self.indent}]\n}}")
+
@@ -1,7 +1,7 @@
 import abc
 from typing import Any, Callable, Dict, Final, Optional, Union
 from dataclasses import dataclass, field
-from collections import deque
+from collections import defaultdict, deque
 import polymath as pm
 import numpy as np
 from codelets.adl.graph import StorageNode
@@ -134,6 +134,33 @@ class RelocationTable(abc.ABC):
         reloc: Relocation = self.relocatables[namespace]
         return reloc.total_length()
     
+    def get_namespace_start(self, namespace: str) -> int:
+        reloc: Relocation = self.relocatables[namespace]
+        if len(reloc.bases) == 0:
+            return 0
+        return min([v.start for v in reloc.bases.values()])
+
+    def relocate_namespace(self, namespace: str, start: int) -> None:
+        # Moves all fragments in the namespace so that it begins at 'start', keeping their relative offsets
+        if self.get_aligned_sized(start, as_bytes=False) != start:
+            raise RuntimeError(f"Invalid start for namespace {namespace}:\n"
+                               f"Start: {start}\n"
+                               f"Alignment: {self.addr_alignment}")
+        shift: int = start - self.get_namespace_start(namespace)
+        for fragment in self.relocatables[namespace].bases.values():
+            fragment.start += shift
+            fragment.end += shift
+
+    def check_namespace_overlaps(self) -> None:
+        ranges = [(self.get_namespace_start(ns), self.get_namespace_size(ns), ns) for ns in self.mem_layout
+                  if len(self.relocatables[ns].bases) > 0]
+        ranges = sorted(ranges)
+        for (_, prev_end, prev_ns), (start, _, ns) in zip(ranges[:-1], ranges[1:]):
+            if prev_end > start:
+                raise RuntimeError(f"Overlapping memory namespaces:\n"
+                                   f"{prev_ns} ends at {prev_end}\n"
+                                   f"{ns} starts at {start}")
+
     @abc.abstractmethod
     def get_operand_namespace(self, operand: Operand) -> str:
         ...
@@ -530,31 +557,60 @@ class _DataflowGraph:
         return ret
 
 
-class _MemoryAllocator(abc.ABC):
-    @abc.abstractmethod
-    def generate_tensor_offsets(self) -> dict[str, int]:
-        ...
+class _LiveTensorOffsets:
+    # Allocated tensors as (start offset, end offset), with the indices of the tensors live at each layer, so that
+    # only tensors with overlapping lifetimes are compared
+    def __init__(self) -> None:
+        self._tensors: list[tuple[int, int]] = []
+        self._layer_tensors: dict[int, list[int]] = defaultdict(list)
+
+    def allocate(self, offset: int, size: int, start_layer_index: int, end_layer_index: int) -> None:
+        self._tensors.append((offset, offset + size))
+        for layer_index in range(start_layer_index, end_layer_index + 1):
+            self._layer_tensors[layer_index].append(len(self._tensors) - 1)
+
+    def overlapping_tensors(self, start_layer_index: int, end_layer_index: int) -> list[tuple[int, int]]:
+        overlapping_tensors: set[int] = set()
+        for layer_index in range(start_layer_index, end_layer_index + 1):
+            overlapping_tensors.update(self._layer_tensors[layer_index])
+        return sorted([self._tensors[i] for i in overlapping_tensors])
+
+    def best_fit_offset(self, size: int, start_layer_index: int, end_layer_index: int) -> int:
+        # Uses the smallest gap between tensors with overlapping lifetimes, measured between neighbouring tensors in
+        # offset order, or the end of the last tensor if no gap fits
+        previous_offset: int = 0
+        best_offset: Optional[int] = None
+        smallest_gap: Optional[int] = None
+        for offset, end_offset in self.overlapping_tensors(start_layer_index, end_layer_index):
+            gap: int = offset - previous_offset
+            if gap >= size and (smallest_gap is None or gap < smallest_gap):
+                smallest_gap = gap
+                best_offset = previous_offset
+            previous_offset = max(previous_offset, end_offset)
+        return previous_offset if best_offset is None else best_offset
 
 
-# Greedy algorithm for DNN intermediate tensor allocation taken from "EFFICIENT MEMORY MANAGEMENT FOR DEEP NEURAL NET INFERENCE"
-class _GreedyBySizeMemoryAllocator(_MemoryAllocator):
+class _MemoryAllocator(abc.ABC):
     _dataflow_graph: _DataflowGraph
     _operand_name_to_operand_map: dict[str, Operand]
     _get_operand_namespace: Callable[[Operand], str]
     _get_aligned_size: Callable[[int], int]
+    _tensor_aliases: dict[str, str]
 
-    def __init__(self, dataflow_graph: _DataflowGraph, operand_name_to_operand_map: dict[str, Operand], get_operand_namespace_func: Callable[[Operand], str], get_aligned_size_func: Callable[[int], int]) -> None:
+    def __init__(self, dataflow_graph: _DataflowGraph, operand_name_to_operand_map: dict[str, Operand], get_operand_namespace_func: Callable[[Operand], str], get_aligned_size_func: Callable[[int], int], tensor_aliases: Optional[dict[str, str]] = None) -> None:
         super().__init__()
         self._dataflow_graph = dataflow_graph
         self._operand_name_to_operand_map = operand_name_to_operand_map
         self._get_operand_namespace = get_operand_namespace_func
         self._get_aligned_size = get_aligned_size_func
-    
+        self._tensor_aliases = tensor_aliases or {}
+        self.usage_records: dict[str, tuple[int, int, int]] = {}
+
     def generate_tensor_offsets(self) -> dict[str, int]:
         input_tensors: list[str] = [e.operand_name for e in self._dataflow_graph.get_input_edges()]
         intermediate_tensor_usage_records: dict[str, tuple[int, int, int]] = self._generate_intermediate_tensor_usage_records()
+        merged_tensor_names: dict[str, str] = self._merge_aliased_usage_records(intermediate_tensor_usage_records)
         assigned_intermediate_tensor_offsets: dict[str, Optional[int]] = {k: None for k in intermediate_tensor_usage_records.keys()}
-        ordered_allocated_tensor_names: list[str] = [] 
 
         # Assign input tensors to the beginning of the activation memory
         current_input_offset: int = 0
@@ -562,40 +618,53 @@ class _GreedyBySizeMemoryAllocator(_MemoryAllocator):
             input_operand: Operand = self._operand_name_to_operand_map[tensor_name]
             if self._get_operand_namespace(input_operand) != "ACTIVATION":
                 continue
-            ordered_allocated_tensor_names.append(tensor_name)
             aligned_size: int = self._get_aligned_size(np.prod(input_operand.shape) * input_operand.dtype.bits(), as_bytes=False) 
             intermediate_tensor_usage_records[tensor_name] = (0, 0, aligned_size)
             assigned_intermediate_tensor_offsets[tensor_name] = current_input_offset
             current_input_offset += aligned_size
-        
-        # Assign intermediate tensors greedily
-        total_memory_consumption: int = 0
-        for tensor_name, (start_layer_index, end_layer_index, size) in sorted(intermediate_tensor_usage_records.items(), key=lambda x: x[1][2], reverse=True):
-            previous_offset: int = 0
-            best_offset: Optional[int] = None
-            smallest_gap: Optional[int] = None
-            for allocated_tensor_name in ordered_allocated_tensor_names:
-                max_first_node_index: int = max(intermediate_tensor_usage_records[allocated_tensor_name][0], start_layer_index)
-                min_last_node_index: int = min(intermediate_tensor_usage_records[allocated_tensor_name][1], end_layer_index)
-                if max_first_node_index <= min_last_node_index:
-                    gap: int = assigned_intermediate_tensor_offsets[allocated_tensor_name] - previous_offset
-                    if gap >= size:
-                        if smallest_gap is None or gap < smallest_gap:
-                            smallest_gap = gap
-                            best_offset = previous_offset
-                    previous_offset = max(previous_offset, assigned_intermediate_tensor_offsets[allocated_tensor_name] + intermediate_tensor_usage_records[allocated_tensor_name][2])
-            if best_offset is None:
-                best_offset = previous_offset
-            
-            assigned_intermediate_tensor_offsets[tensor_name] = best_offset
-            total_memory_consumption = max(total_memory_consumption, best_offset + size)
-            ordered_allocated_tensor_names.append(tensor_name)
+
+        self._allocate_intermediate_tensors(intermediate_tensor_usage_records, assigned_intermediate_tensor_offsets)
 
         if any(offset is None for offset in assigned_intermediate_tensor_offsets.values()):
             raise RuntimeError("Unable to allocate all intermediate tensors")
-     
+
+        for tensor_name, group_tensor_name in merged_tensor_names.items():
+            assigned_intermediate_tensor_offsets[tensor_name] = assigned_intermediate_tensor_offsets[group_tensor_name]
+
+        self.usage_records = intermediate_tensor_usage_records
         return {k: v for k, v in assigned_intermediate_tensor_offsets.items() if v is not None}
 
+    @abc.abstractmethod
+    def _allocate_intermediate_tensors(self, intermediate_tensor_usage_records: dict[str, tuple[int, int, int]], assigned_intermediate_tensor_offsets: dict[str, Optional[int]]) -> None:
+        # Assigns offsets in place for all tensors which do not have one
+        ...
+
+    def _merge_aliased_usage_records(self, intermediate_tensor_usage_records: dict[str, tuple[int, int, int]]) -> dict[str, str]:
+        # Tensors aliasing the same root share a single usage record, live for the union of their lifetimes.
+        # Returns the name of the record each merged tensor was folded into.
+        group_tensor_names: dict[str, str] = {}
+        merged_tensor_names: dict[str, str] = {}
+        for tensor_name in list(intermediate_tensor_usage_records.keys()):
+            root_name: str = self._tensor_aliases.get(tensor_name, tensor_name)
+            if root_name not in group_tensor_names:
+                group_tensor_names[root_name] = tensor_name
+                continue
+            group_tensor_name: str = group_tensor_names[root_name]
+            group_start, group_end, group_size = intermediate_tensor_usage_records[group_tensor_name]
+            start_layer_index, end_layer_index, size = intermediate_tensor_usage_records.pop(tensor_name)
+            intermediate_tensor_usage_records[group_tensor_name] = (min(group_start, start_layer_index), max(group_end, end_layer_index), max(group_size, size))
+            merged_tensor_names[tensor_name] = group_tensor_name
+        return merged_tensor_names
+
+    @staticmethod
+    def _allocated_tensor_offsets(intermediate_tensor_usage_records: dict[str, tuple[int, int, int]], assigned_intermediate_tensor_offsets: dict[str, Optional[int]]) -> _LiveTensorOffsets:
+        live_tensors = _LiveTensorOffsets()
+        for tensor_name, offset in assigned_intermediate_tensor_offsets.items():
+            if offset is not None:
+                start_layer_index, end_layer_index, size = intermediate_tensor_usage_records[tensor_name]
+                live_tensors.allocate(offset, size, start_layer_index, end_layer_index)
+        return live_tensors
+
     def _generate_intermediate_tensor_usage_records(self) -> dict[str, tuple[int, int, int]]:
         input_tensors: list[str] = [e.operand_name for e in self._dataflow_graph.get_input_edges()]
         tensor_usage_records: dict[str, tuple[Optional[int], Optional[int], int]] = {}
@@ -619,7 +688,16 @@ class _GreedyBySizeMemoryAllocator(_MemoryAllocator):
             assert tensor_usage_record[1] is not None
 
         return tensor_usage_records
- 
+
+    @staticmethod
+    def layer_live_sizes(intermediate_tensor_usage_records: dict[str, tuple[int, int, int]]) -> dict[int, int]:
+        # Total size of the tensors live at each layer
+        live_sizes: dict[int, int] = defaultdict(int)
+        for start_layer_index, end_layer_index, size in intermediate_tensor_usage_records.values():
+            for layer_index in range(start_layer_index, end_layer_index + 1):
+                live_sizes[layer_index] += size
+        return live_sizes
+
     @staticmethod
     def plot_memory_allocation(intermediate_tensor_usage_records: dict[str, tuple[int, int, int]], assigned_intermediate_tensor_offsets: dict[str, int]) -> None:
         import matplotlib.pyplot as plt
@@ -668,6 +746,96 @@ class _GreedyBySizeMemoryAllocator(_MemoryAllocator):
         plt.show()
 
 
+# Greedy algorithms for DNN intermediate tensor allocation taken from "EFFICIENT MEMORY MANAGEMENT FOR DEEP NEURAL NET INFERENCE"
+class _GreedyBySizeMemoryAllocator(_MemoryAllocator):
+    def _allocate_intermediate_tensors(self, intermediate_tensor_usage_records: dict[str, tuple[int, int, int]], assigned_intermediate_tensor_offsets: dict[str, Optional[int]]) -> None:
+        live_tensors = self._allocated_tensor_offsets(intermediate_tensor_usage_records, assigned_intermediate_tensor_offsets)
+        for tensor_name, (start_layer_index, end_layer_index, size) in sorted(intermediate_tensor_usage_records.items(), key=lambda x: x[1][2], reverse=True):
+            if assigned_intermediate_tensor_offsets[tensor_name] is not None:
+                continue
+            best_offset: int = live_tensors.best_fit_offset(size, start_layer_index, end_layer_index)
+            assigned_intermediate_tensor_offsets[tensor_name] = best_offset
+            live_tensors.allocate(best_offset, size, start_layer_index, end_layer_index)
+
+
+class _GreedyByBreadthMemoryAllocator(_MemoryAllocator):
+    def _allocate_intermediate_tensors(self, intermediate_tensor_usage_records: dict[str, tuple[int, int, int]], assigned_intermediate_tensor_offsets: dict[str, Optional[int]]) -> None:
+        # Layers are visited in decreasing order of the total size of their live tensors, allocating the largest
+        # unallocated tensors of each layer first
+        live_tensors = self._allocated_tensor_offsets(intermediate_tensor_usage_records, assigned_intermediate_tensor_offsets)
+        live_sizes: dict[int, int] = self.layer_live_sizes(intermediate_tensor_usage_records)
+        layer_tensor_names: dict[int, list[str]] = defaultdict(list)
+        for tensor_name, (start_layer_index, end_layer_index, _) in intermediate_tensor_usage_records.items():
+            for layer_index in range(start_layer_index, end_layer_index + 1):
+                layer_tensor_names[layer_index].append(tensor_name)
+
+        for layer_index in sorted(live_sizes.keys(), key=lambda l: live_sizes[l], reverse=True):
+            for tensor_name in sorted(layer_tensor_names[layer_index], key=lambda n: intermediate_tensor_usage_records[n][2], reverse=True):
+                if assigned_intermediate_tensor_offsets[tensor_name] is not None:
+                    continue
+                start_layer_index, end_layer_index, size = intermediate_tensor_usage_records[tensor_name]
+                best_offset: int = live_tensors.best_fit_offset(size, start_layer_index, end_layer_index)
+                assigned_intermediate_tensor_offsets[tensor_name] = best_offset
+                live_tensors.allocate(best_offset, size, start_layer_index, end_layer_index)
+
+
+class _ExhaustiveMemoryAllocator(_GreedyBySizeMemoryAllocator):
+    # Larger graphs are allocated with greedy-by-size, which is also used as the initial bound for the search
+    MAX_TENSORS: int = 8
+
+    def _allocate_intermediate_tensors(self, intermediate_tensor_usage_records: dict[str, tuple[int, int, int]], assigned_intermediate_tensor_offsets: dict[str, Optional[int]]) -> None:
+        fixed_offsets: dict[str, Optional[int]] = assigned_intermediate_tensor_offsets.copy()
+        super()._allocate_intermediate_tensors(intermediate_tensor_usage_records, assigned_intermediate_tensor_offsets)
+        unallocated: list[str] = [k for k, v in fixed_offsets.items() if v is None]
+        if len(unallocated) > self.MAX_TENSORS:
+            return
+
+        def total_size(offsets: dict[str, int]) -> int:
+            return max([v + intermediate_tensor_usage_records[k][2] for k, v in offsets.items()], default=0)
+
+        def overlaps(a: str, b: str) -> bool:
+            return max(intermediate_tensor_usage_records[a][0], intermediate_tensor_usage_records[b][0]) <= \
+                min(intermediate_tensor_usage_records[a][1], intermediate_tensor_usage_records[b][1])
+
+        best: dict[str, int] = dict(assigned_intermediate_tensor_offsets)
+        best_size: int = total_size(best)
+        lower_bound: int = max(self.layer_live_sizes(intermediate_tensor_usage_records).values(), default=0)
+
+        # Some optimal allocation has every tensor at offset 0 or at the end of a lifetime-overlapping tensor with a
+        # lower offset, so tensors are placed in increasing offset order at those offsets
+        def search(placed: dict[str, int], remaining: list[str], last_placement: tuple[int, int], current_size: int) -> None:
+            nonlocal best, best_size
+            if current_size >= best_size or best_size == lower_bound:
+                return
+            if len(remaining) == 0:
+                best, best_size = dict(placed), current_size
+                return
+            for tensor_idx, tensor_name in enumerate(remaining):
+                size: int = intermediate_tensor_usage_records[tensor_name][2]
+                overlapping: list[str] = [p for p in placed if overlaps(p, tensor_name)]
+                candidates: set[int] = {0} | {placed[p] + intermediate_tensor_usage_records[p][2] for p in overlapping}
+                for offset in sorted(candidates):
+                    if (offset, unallocated.index(tensor_name)) < last_placement:
+                        continue
+                    if any(offset < placed[p] + intermediate_tensor_usage_records[p][2] and placed[p] < offset + size for p in overlapping):
+                        continue
+                    placed[tensor_name] = offset
+                    search(placed, remaining[:tensor_idx] + remaining[tensor_idx + 1:], (offset, unallocated.index(tensor_name)), max(current_size, offset + size))
+                    del placed[tensor_name]
+
+        placed: dict[str, int] = {k: v for k, v in fixed_offsets.items() if v is not None}
+        search(placed, unallocated, (0, -1), total_size(placed))
+        assigned_intermediate_tensor_offsets.update(best)
+
+
+DRAM_ALLOCATORS: dict[str, type] = {
+    "greedy_by_size": _GreedyBySizeMemoryAllocator,
+    "greedy_by_breadth": _GreedyByBreadthMemoryAllocator,
+    "exhaustive": _ExhaustiveMemoryAllocator,
+}
+DEFAULT_DRAM_ALLOCATOR: Final[str] = "greedy_by_size"
+
+
 class EndToEndRelocationTable(RelocationTable):
     MEM_NS_MAPPING: dict[str, str] = {'VMEM1': 'ACTIVATION', 'VMEM2': 'ACTIVATION', 'IBUF': 'ACTIVATION', 'WBUF': 'WEIGHT_AND_BIAS',
                       'BBUF': 'WEIGHT_AND_BIAS', 'OBUF': 'ACTIVATION', 'INSTR_MEM': 'INSTR_MEM'}
@@ -677,11 +845,60 @@ class EndToEndRelocationTable(RelocationTable):
     _operand_name_to_operand_map: dict[str, Operand]
     _operand_to_operand_location_map: dict[int, str]
 
-    def __init__(self, storage_node: StorageNode, mem_layout: Optional[list[str]] = None, offsets=None, addr_alignment=1) -> None:
+    def __init__(self, storage_node: StorageNode, mem_layout: Optional[list[str]] = None, offsets=None, addr_alignment=1, allocator: str = DEFAULT_DRAM_ALLOCATOR) -> None:
         super().__init__(storage_node, mem_layout or EndToEndRelocationTable.MEM_LAYOUT, EndToEndRelocationTable.MEM_NS_MAPPING, addr_alignment=addr_alignment)
+        if allocator not in DRAM_ALLOCATORS:
+            raise KeyError(f"Invalid DRAM allocator {allocator}:\n"
+                           f"Possible allocators: {list(DRAM_ALLOCATORS.keys())}")
+        self._allocator_name = allocator
         self._dataflow_graph = _DataflowGraph()
         self._operand_name_to_operand_map = {}
         self._operand_to_operand_location_map = {}
+        self._activation_usage_records = {}
+        self._tensor_aliases = {}
+        self._weight_storage_names = {}
+        self._weight_layouts = {}
+
+    @property
+    def allocator_name(self) -> str:
+        return self._allocator_name
+
+    @property
+    def tensor_aliases(self) -> dict[str, str]:
+        return self._tensor_aliases
+
+    def add_tensor_alias(self, alias_name: str, source_name: str) -> None:
+        # The alias is stored in the same activation buffer as the source, or as the tensor the source aliases
+        root_name: str = self._tensor_aliases.get(source_name, source_name)
+        if alias_name == root_name:
+            raise RuntimeError(f"Tensor {alias_name} cannot alias itself")
+        if alias_name in self._tensor_aliases.values():
+            raise RuntimeError(f"Unable to alias {alias_name} to {source_name}:\n"
+                               f"Other tensors already alias {alias_name}")
+        if self._tensor_aliases.get(alias_name, root_name) != root_name:
+            raise RuntimeError(f"Unable to alias {alias_name} to {source_name}:\n"
+                               f"Tensor already aliases {self._tensor_aliases[alias_name]}")
+        self._tensor_aliases[alias_name] = root_name
+
+    @property
+    def weight_storage_names(self) -> dict[str, str]:
+        return self._weight_storage_names
+
+    def add_weight_duplicate(self, weight_name: str, storage_name: str) -> None:
+        # Weights with the same storage name hold identical data, and share a fragment when their DRAM layouts match
+        self._weight_storage_names[weight_name] = storage_name
+
+    @property
+    def weight_layouts(self) -> dict[str, tuple]:
+        return self._weight_layouts
+
+    @staticmethod
+    def weight_layout(cdlt: Codelet, operand: Operand) -> tuple:
+        # Weights are stored in DRAM in the layout used by the codelet reading them, which depends on the codelet's
+        # DRAM (level 1) tiling and loop order, in addition to the operand's format in the codelet
+        dram_tiling: dict[str, int] = cdlt.param_tiling.get(1, {})
+        return (cdlt.op_name, operand.name, tuple(operand.shape), str(operand.dtype),
+                tuple(sorted(dram_tiling.items())), tuple(cdlt.get_loop_order()))
     
     def print_layout(self) -> None:
         print("====================================================")
@@ -714,6 +931,29 @@ class EndToEndRelocationTable(RelocationTable):
             max_end = max(max_end, last_fragment.end)
         return max_end // 8
     
+    def memory_footprint(self) -> dict[str, Union[str, int, float]]:
+        # Sizes are in bytes. Fragmentation is the fraction of the activation namespace which is not needed by the
+        # largest set of simultaneously live activations.
+        ns_extents: dict[str, int] = {ns: self.get_namespace_size(ns) - self.get_namespace_start(ns) for ns in self.mem_layout}
+        live_sizes: dict[int, int] = _MemoryAllocator.layer_live_sizes(self._activation_usage_records)
+        peak_live_activations: int = max(live_sizes.values(), default=0)
+        return {
+            "allocator": self.allocator_name,
+            "total": max([self.get_namespace_size(ns) for ns in self.mem_layout], default=0) // 8,
+            "activation": ns_extents['ACTIVATION'] // 8,
+            "weight_and_bias": ns_extents['WEIGHT_AND_BIAS'] // 8,
+            "instruction": ns_extents['INSTR_MEM'] // 8,
+            "peak_live_activation": peak_live_activations // 8,
+            "fragmentation": 1 - peak_live_activations / ns_extents['ACTIVATION'] if ns_extents['ACTIVATION'] > 0 else 0.0,
+        }
+
+    def print_memory_footprint(self) -> None:
+        footprint = self.memory_footprint()
+        print(f"DRAM footprint ({footprint['allocator']}):")
+        for name in ["total", "activation", "weight_and_bias", "instruction", "peak_live_activation"]:
+            print(f"\t{name}: {footprint[name]} bytes")
+        print(f"\tfragmentation: {footprint['fragmentation']:.2%}")
+
     def get_operand_namespace(self, operand: Operand) -> str:
         return self._operand_to_operand_location_map[id(operand)]
     
@@ -736,6 +976,8 @@ class EndToEndRelocationTable(RelocationTable):
         for node_input, cdlt_input in zip(node.inputs, cdlt.inputs):
             self.add_operand_to_operand_namespace_mapping(node_input, cdlt_input)
             self._operand_name_to_operand_map[node_input.name] = cdlt_input
+            if isinstance(node_input, pm.state):
+                self._weight_layouts.setdefault(node_input.name, self.weight_layout(cdlt, cdlt_input))
         for node_output, cdlt_output in zip(node.outputs, cdlt.outputs):
             self.add_operand_to_operand_namespace_mapping(node_output, cdlt_output)
             self._operand_name_to_operand_map[node_output.name] = cdlt_output
@@ -744,8 +986,9 @@ class EndToEndRelocationTable(RelocationTable):
     def _update_relocations(self) -> None: 
         self.reset_reloctables()
 
-        allocator = _GreedyBySizeMemoryAllocator(self._dataflow_graph, self._operand_name_to_operand_map, self.get_operand_namespace, self.get_aligned_sized)
+        allocator = DRAM_ALLOCATORS[self.allocator_name](self._dataflow_graph, self._operand_name_to_operand_map, self.get_operand_namespace, self.get_aligned_sized, tensor_aliases=self._tensor_aliases)
         assigned_intermediate_tensor_offsets: dict[str, int] = allocator.generate_tensor_offsets()
+        self._activation_usage_records = allocator.usage_records
         
         for tensor_name, offset in assigned_intermediate_tensor_offsets.items():
             tensor_operand: Operand = self._operand_name_to_operand_map[tensor_name]
@@ -755,6 +998,9 @@ class EndToEndRelocationTable(RelocationTable):
         self._update_weight_and_bias_relocation_offsets()
     
     def _update_weight_and_bias_relocation_offsets(self) -> None:
+        relocatable: Relocation = self.relocatables["WEIGHT_AND_BIAS"]
+        # The first weight placed for each storage name and DRAM layout holds the data for all of its duplicates
+        placed_weight_names: dict[tuple[str, Optional[tuple]], str] = {}
         operands_stored_at_each_layer: dict[_DataflowGraphNode, list[str]] = self._dataflow_graph._get_operands_stored_at_each_layer()
         for node in self._dataflow_graph.topological_sort():
             operands_stored_at_node_layer: list[str] = operands_stored_at_each_layer[node]
@@ -762,7 +1008,16 @@ class EndToEndRelocationTable(RelocationTable):
                 operand: Operand = self._operand_name_to_operand_map[operand_name]
                 operand_location: str = self.get_operand_namespace(operand)
                 if operand_location == "WEIGHT_AND_BIAS":
-                    self.update_relocation_offset("WEIGHT_AND_BIAS", operand_name, np.prod(operand.shape) * operand.dtype.bits()) 
+                    size: int = np.prod(operand.shape) * operand.dtype.bits()
+                    storage_name: str = self._weight_storage_names.get(operand_name, operand_name)
+                    storage_key: tuple[str, Optional[tuple]] = (storage_name, self._weight_layouts.get(operand_name))
+                    placed_weight_name: str = placed_weight_names.setdefault(storage_key, operand_name)
+                    placed_fragment: Optional[Fragment] = relocatable.bases.get(placed_weight_name)
+                    if placed_weight_name != operand_name and placed_fragment is not None and placed_fragment.size == size:
+                        if operand_name not in relocatable.bases:
+                            relocatable.bases[operand_name] = Fragment(operand_name, size, placed_fragment.start, placed_fragment.end)
+                    else:
+                        self.update_relocation_offset("WEIGHT_AND_BIAS", operand_name, size)
     
     def update_relocation_offset(self, offset_type: str, offset_id: Union[int, str], size: int, **kwargs: Any) -> None:
         aligned_size: int = self.get_aligned_sized(size, as_bytes=False)
@@ -250,7 +250,7 @@ NS_IDX_BITWIDTH = 3
 
 
 from .genesys import define_genesys, compile_genesys, compile_genesys_layer, get_transformed_srdfg, \
-    compile_extracted_genesys_layer, get_arch, load_fusion_op_info
+    compile_extracted_genesys_layer, get_arch, load_fusion_op_info, load_onnx_initializers
 from .config_loader import load_config
 from .data_generator import DataGen
 from .genesys_network_sim import compile_full_model
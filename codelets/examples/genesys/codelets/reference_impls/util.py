@@ -2,12 +2,9 @@ import fxpmath
 import numpy as np
 from fxpmath import Fxp
 from codelets.examples.genesys import FXP_CONFIGS
+from codelets.examples.genesys.data_files import save_array
 from typing import List, Tuple, Optional
 
-def save_array(path, data):
-    with open(path, 'w') as f:
-        f.write('\n'.join([str(i) for i in data.flatten().tolist()]))
-
 def compute_range(fxp_dtype, scale=1):
     cfg = FXP_CONFIGS[fxp_dtype]
     upper_val = (1 << (np.int32(cfg['n_word']//scale) - 1)) - 1
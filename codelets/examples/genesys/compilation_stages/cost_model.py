@@ -0,0 +1,117 @@
+from typing import TYPE_CHECKING, Tuple
+from dataclasses import dataclass
+from functools import partial
+import numpy as np
+from sympy import Basic
+
+if TYPE_CHECKING:
+    from codelets.adl import ArchitectureNode
+    from codelets.codelet_impl import Codelet
+    from .stage_structures import TilingInfo
+
+
+@dataclass(frozen=True)
+class TilingCost:
+    cycles: int
+    dram_bytes: int
+
+
+# Loop dimensions mapped onto each dimension of a compute node, in the order of the node's `dimensions`: input
+# channels are accumulated across the ARRAY_N rows of the systolic array, and output channels across its ARRAY_M
+# columns. Compute nodes which are not listed map their dimensions to the innermost loops of each compute operation.
+SPATIAL_DIMS = {"pe_array": [("IC", "N"), ("OC", "P")]}
+
+
+class TilingCostModel(object):
+    """
+    Analytical estimate of the runtime of a tiling permutation, for use as the `heuristic_fn` of the tile stage.
+    Transfers are assumed to overlap with compute, so the estimated cycles are the larger of the two
+    plus a fixed overhead for each tile.
+    """
+
+    def __init__(self, tile_overhead_cycles=8, simd_iter_cycles=1):
+        self.tile_overhead_cycles = tile_overhead_cycles
+        self.simd_iter_cycles = simd_iter_cycles
+
+    def __repr__(self):
+        # Used in the tiling database key, so it must not depend on the object's address
+        return f"{type(self).__name__}(tile_overhead_cycles={self.tile_overhead_cycles}, " \
+               f"simd_iter_cycles={self.simd_iter_cycles})"
+
+    def bind(self, cdlt: 'Codelet', hag: 'ArchitectureNode', tile_info: 'TilingInfo', level: int):
+        # Returns a heuristic function with the same signature as `n_tiles_heuristic`
+        return partial(self.permutation_cycles, cdlt, hag, tile_info, level)
+
+    def permutation_cycles(self, cdlt, hag, tile_info, level, perm: Tuple[int]) -> int:
+        return self.estimate(cdlt, hag, tile_info, level, perm).cycles
+
+    def estimate(self, cdlt: 'Codelet', hag: 'ArchitectureNode', tile_info: 'TilingInfo', level: int,
+                 perm: Tuple[int]) -> TilingCost:
+        perm_map = tile_info.get_permutation_map(perm)
+        loop_order = [o.op_str for o in cdlt.ops if o.op_type == "loop" and o.op_str in perm_map]
+
+        transfer_cycles = 0
+        dram_bytes = 0
+        checked_accesses = []
+        for access in tile_info.accesses[level]:
+            key = (access.src_node, access.dst_node, access.operand_name)
+            if key in checked_accesses:
+                continue
+            checked_accesses.append(key)
+
+            sizes = access.get_size_from_splits(cdlt, perm_map)
+            tile_bits = cdlt.get_operand(access.operand_name).dtype.bits()*np.prod(list(sizes.values()))
+            n_transfers = self.transfer_count(access, loop_order, perm_map)
+            edge = hag.get_subgraph_edge(access.src_node, access.dst_node)
+            transfer_cycles += n_transfers*int(np.ceil(tile_bits / max(edge.bandwidth, 1)))
+
+            if cdlt.get_tile_level(access.src_node) == 0 or cdlt.get_tile_level(access.dst_node) == 0:
+                dram_bytes += n_transfers*int(np.ceil(tile_bits / 8))
+
+        n_tiles = int(np.prod(list(perm_map.values())))
+        cycles = max(self.compute_cycles(cdlt, hag, perm_map), transfer_cycles) + n_tiles*self.tile_overhead_cycles
+        return TilingCost(int(cycles), int(dram_bytes))
+
+    def transfer_count(self, access, loop_order, perm_map) -> int:
+        # Transfers are hoisted out of the tile loops which do not index the operand, so a tile is only
+        # transferred once for each iteration of the loops enclosing the innermost loop it depends on
+        access_loops = []
+        for o in access.offset_map.values():
+            if isinstance(o, Basic):
+                access_loops += [access.get_symbol_str(i) for i in access.get_symbol_atoms(o)]
+        innermost = max([loop_order.index(l) for l in access_loops if l in loop_order], default=-1)
+        return int(np.prod([perm_map[l] for l in loop_order[:innermost + 1]]))
+
+    def compute_cycles(self, cdlt: 'Codelet', hag: 'ArchitectureNode', perm_map) -> int:
+        # Each tile is computed separately, so a tile dimension which is not a multiple of the compute node's
+        # dimension leaves part of the node idle for its last pass, e.g., a 24 x 16 tile on a 16 x 16 systolic array
+        # takes two passes. Vector units also pay a loop cost for every iteration they issue.
+        cycles = 0
+        for o in cdlt.ops:
+            if o.op_type != "compute":
+                continue
+            loops = [d for d in o.dependencies if d in cdlt.op_map and cdlt.op_map[d].op_type == "loop"]
+            splits = {l: perm_map.get(l, 1) for l in loops}
+            tile_sizes = {l: int(np.ceil(cdlt.op_map[l].iter_count / splits[l])) for l in loops}
+            node = hag.get_subgraph_node(o.target)
+
+            spatial_loops = self.spatial_loops(cdlt, o.target, loops, len(node.dimensions))
+            tile_iters = 1
+            for l in loops:
+                if l in spatial_loops:
+                    tile_iters *= int(np.ceil(tile_sizes[l] / node.dimensions[spatial_loops.index(l)]))
+                else:
+                    tile_iters *= tile_sizes[l]
+            iter_cycles = 1 + (self.simd_iter_cycles if len(node.dimensions) == 1 else 0)
+            cycles += int(np.prod(list(splits.values())))*tile_iters*iter_cycles
+        return cycles
+
+    def spatial_loops(self, cdlt: 'Codelet', target: str, loops, n_dims):
+        if target not in SPATIAL_DIMS:
+            return loops[max(len(loops) - n_dims, 0):]
+        spatial = []
+        for dim_names in SPATIAL_DIMS[target]:
+            # Names are in order of preference, since a convolution's batch dimension is also named "N"
+            dim_loops = [l for name in dim_names for l in loops if cdlt.loop_param_map.get(l) == name]
+            spatial.append(dim_loops[0] if len(dim_loops) > 0 else None)
+        return spatial
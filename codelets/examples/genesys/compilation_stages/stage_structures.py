@@ -179,6 +179,84 @@ class TilingInfo:
         self.print_debug = False
         return valid_splits
 
+    def evaluate_constraint_batch(self, key: Tuple[str, str], total_sizes: np.ndarray, valid: np.ndarray):
+        # Constraints are arbitrary expressions, so they are evaluated once per unique size instead of per permutation
+        constraint_sat = np.zeros(total_sizes.shape[0], dtype=bool)
+        unique_sizes, inverse = np.unique(total_sizes[valid], return_inverse=True)
+        unique_sat = np.array([bool(self.constraint_fps[key].evaluate_fn(s)) for s in unique_sizes], dtype=bool)
+        constraint_sat[valid] = unique_sat[inverse.reshape(-1)]
+        return constraint_sat
+
+    def validate_splits_batch(self, cdlt, perms: np.ndarray, level, hag) -> np.ndarray:
+        # Equivalent to `validate_splits` applied to each row of `perms`, returning a mask of valid permutations
+        n_perms = perms.shape[0]
+        valid = np.ones(n_perms, dtype=bool)
+
+        perm_map = self.get_permutation_map(perms.T)
+        size_map = {}
+        checked_accesses = []
+        loc_sizes = defaultdict(int)
+        op_loc_set = []
+        for level_access in self.accesses[level]:
+            key = (level_access.src_node, level_access.dst_node)
+            if (key, level_access.operand_name) in checked_accesses:
+                continue
+            checked_accesses.append((key, level_access.operand_name))
+            size, valid_sizes = level_access.get_size_from_splits_batch(cdlt, perm_map, n_perms)
+            valid &= valid_sizes
+            for k, v in size.items():
+                if k in size_map:
+                    valid &= (v == size_map[k])
+                else:
+                    size_map[k] = v
+
+            operand = cdlt.get_operand(level_access.operand_name)
+            dtype_size = operand.dtype.bits()
+            if (key[1], level_access.operand_name) not in op_loc_set:
+                operand_size = np.ones(n_perms, dtype=np.int64)
+                for s in operand.shape_symbols:
+                    operand_size = operand_size * size[s]
+                loc_sizes[key[1]] = loc_sizes[key[1]] + dtype_size*operand_size
+                op_loc_set.append((key[1], level_access.operand_name))
+
+            total_sizes = np.ones(n_perms, dtype=np.int64)
+            for v in size.values():
+                total_sizes = total_sizes * v
+            valid &= self.evaluate_constraint_batch(key, total_sizes * dtype_size, valid)
+
+        for node_name, val in loc_sizes.items():
+            node = hag.get_subgraph_node(node_name)
+            if node.node_type == "storage":
+                valid &= val <= node.size
+
+        self.print_debug = False
+        return valid
+
+    def fits_storage_batch(self, cdlt, perms: np.ndarray, level, hag) -> np.ndarray:
+        # Only checks the storage footprint of each permutation, which is used to bound partial permutations
+        n_perms = perms.shape[0]
+        perm_map = self.get_permutation_map(perms.T)
+        loc_sizes = defaultdict(int)
+        op_loc_set = []
+        for level_access in self.accesses[level]:
+            key = (level_access.src_node, level_access.dst_node)
+            if (key[1], level_access.operand_name) in op_loc_set:
+                continue
+            op_loc_set.append((key[1], level_access.operand_name))
+            size, _ = level_access.get_size_from_splits_batch(cdlt, perm_map, n_perms)
+            operand = cdlt.get_operand(level_access.operand_name)
+            operand_size = np.ones(n_perms, dtype=np.int64)
+            for s in operand.shape_symbols:
+                operand_size = operand_size * size[s]
+            loc_sizes[key[1]] = loc_sizes[key[1]] + operand.dtype.bits()*operand_size
+
+        fits = np.ones(n_perms, dtype=bool)
+        for node_name, val in loc_sizes.items():
+            node = hag.get_subgraph_node(node_name)
+            if node.node_type == "storage":
+                fits &= val <= node.size
+        return fits
+
     def validate_derived_splits(self, cdlt, perm, level, hag):
         valid_splits = perm
 
@@ -238,7 +316,11 @@ class TilingInfo:
 
     def get_tile_permutations(self, level, perm_stack, cdlt):
         if level in cdlt.domain_tiling:
-            perms = [tuple(cdlt.domain_tiling[level][ld] for ld in self.dims)]
+            # Preset tilings are keyed by loop name, as they are stored in `load_tiling` and the tiling database
+            dim_loops = {}
+            for l in self.loop_dependencies:
+                dim_loops.setdefault(self.loop_dim_map[l], l)
+            perms = [tuple(cdlt.domain_tiling[level][dim_loops[d]] for d in self.dims)]
         else:
             perms = perm_stack[level - 1]
 
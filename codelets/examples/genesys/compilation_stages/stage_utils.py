@@ -1,6 +1,4 @@
 from typing import TYPE_CHECKING
-from pathlib import Path
-import json
 if TYPE_CHECKING:
     from codelets.adl import ArchitectureNode
     from codelets.codelet_impl import Codelet
@@ -63,20 +61,6 @@ def find_tiling(cdlt, level, perm_stack):
     assert perms is not None
     valid_splits = None
 
-def store_tile_checkpoint(cdlt, checkpoint_path):
-    abs_path = Path(checkpoint_path).absolute()
-    if abs_path.exists():
-        with open(f'{abs_path}') as f:
-            tiling = json.load(f)
-    else:
-        tiling = {}
-    tile_key = f"{cdlt.op_name}{cdlt.instance_id}"
-    tiling[tile_key] = cdlt.domain_tiling
-
-    with open(f'{abs_path}', "w") as outfile:
-        json.dump(tiling, outfile, indent=4)
-
-
 def find_node_key(node, mapping):
     node_dfgs = node.name.split("/")
     if len(node_dfgs) > 1:
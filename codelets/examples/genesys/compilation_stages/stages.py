@@ -9,8 +9,8 @@ from codelets.compiler.program import CodeletProgram
 
 import numpy as np
 from .tiling_utils import set_codelet_tiling
-from codelets.examples.genesys.compilation_stages.stage_utils import default_tile_heuristic, \
-    store_tile_checkpoint
+from codelets.examples.genesys.compilation_stages.stage_utils import default_tile_heuristic
+from .tiling_db import get_tiling_db, tiling_search_key
 from . import CUSTOM_TILE_OPS
 
 CUSTOM_PAD_OPS = CUSTOM_TILE_OPS + ["conv_bias", "conv_bias_add", "conv_bias_clip"]
@@ -485,10 +485,24 @@ def propagate_offsets(cdlt: 'Codelet', hag: 'ArchitectureNode') -> 'Codelet':
     return cdlt
 
 def tile(program: 'CodeletProgram', node: pm.Node, cdlt: 'Codelet', factor_fn_name='default', heuristic_fn=None,
-         checkpoint_file=None, stopping_condition=None, selection_metric=None) -> 'Codelet':
+         tiling_db=None, stopping_condition=None, selection_metric=None, search_algorithm=None,
+         search_workers=1) -> 'Codelet':
     hag = program.hag
-    cdlt.set_tile_levels()
     heuristic_fn = heuristic_fn or default_tile_heuristic
+    stored_tiling = None
+    if tiling_db is not None:
+        tiling_db = get_tiling_db(tiling_db)
+        # The key is computed before any modifications are made to the codelet by tiling
+        db_key = tiling_db.key(cdlt, hag, tiling_search_key(factor_fn_name, stopping_condition,
+                                                            selection_metric, heuristic_fn))
+        stored_tiling = tiling_db.get(db_key)
+
+    cdlt.set_tile_levels()
+    if stored_tiling is not None:
+        # Presetting the tiling restricts the search to the stored permutation at each level
+        for level, splits in stored_tiling.items():
+            if level > 0:
+                cdlt._domain_tiling[level] = splits
 
     cdlt = propagate_offsets(cdlt, program.hag)
 
@@ -505,7 +519,8 @@ def tile(program: 'CodeletProgram', node: pm.Node, cdlt: 'Codelet', factor_fn_na
             else:
                 loop_splits[l] = max_level
     bands = cdlt.extract_bands()
-    cdlt = set_codelet_tiling(cdlt, hag, factor_fn_name, stopping_condition, selection_metric, heuristic_fn)
+    cdlt = set_codelet_tiling(cdlt, hag, factor_fn_name, stopping_condition, selection_metric, heuristic_fn,
+                              search_algorithm=search_algorithm, search_workers=search_workers)
 
     loop_replacement_map = {}
     start_end_ops = [(cdlt.ops[s], cdlt.ops[e]) for s, e in bands]
@@ -682,8 +697,8 @@ def tile(program: 'CodeletProgram', node: pm.Node, cdlt: 'Codelet', factor_fn_na
 
     cdlt = update_temporary_data_moves(cdlt)
 
-    if checkpoint_file is not None:
-        store_tile_checkpoint(cdlt, checkpoint_file)
+    if tiling_db is not None and stored_tiling is None:
+        tiling_db.put(db_key, cdlt)
 
     return cdlt
 
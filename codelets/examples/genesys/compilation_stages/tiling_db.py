@@ -0,0 +1,76 @@
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict
+from codelets.compiler.compilation_cache import arch_config_hash, codelet_signature
+
+if TYPE_CHECKING:
+    from codelets.adl import ArchitectureNode
+    from codelets.codelet_impl import Codelet
+
+# Seconds a writer waits on a locked database, e.g. when several benchmark processes finish tiling at once
+DB_TIMEOUT = 60
+
+_TILING_DBS = {}
+
+
+class TilingDatabase(object):
+
+    def __init__(self, db_path: str):
+        self._db_path = str(Path(db_path).absolute())
+        Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            # WAL lets readers proceed while another process is writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS tilings ("
+                         "signature TEXT NOT NULL, "
+                         "arch_hash TEXT NOT NULL, "
+                         "search TEXT NOT NULL, "
+                         "op_name TEXT NOT NULL, "
+                         "tiling TEXT NOT NULL, "
+                         "PRIMARY KEY (signature, arch_hash, search))")
+
+    def __repr__(self):
+        return f"TilingDatabase({self._db_path})"
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM tilings").fetchone()[0]
+
+    @property
+    def db_path(self) -> str:
+        return self._db_path
+
+    def _connect(self):
+        # Connections are opened per access so the database can be shared with forked worker processes
+        return sqlite3.connect(self._db_path, timeout=DB_TIMEOUT)
+
+    def key(self, cdlt: 'Codelet', hag: 'ArchitectureNode', search: str):
+        arch_hash = arch_config_hash(hag)
+        return (codelet_signature(cdlt, arch_hash), arch_hash, search)
+
+    def get(self, key) -> Dict[int, Dict[str, int]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT tiling FROM tilings WHERE signature=? AND arch_hash=? AND search=?",
+                               key).fetchone()
+        if row is None:
+            return None
+        return {int(level): splits for level, splits in json.loads(row[0]).items()}
+
+    def put(self, key, cdlt: 'Codelet'):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO tilings VALUES (?, ?, ?, ?, ?)",
+                         key + (cdlt.op_name, json.dumps(cdlt.domain_tiling, sort_keys=True, default=int)))
+
+
+def get_tiling_db(db_path: str) -> TilingDatabase:
+    if db_path not in _TILING_DBS:
+        _TILING_DBS[db_path] = TilingDatabase(db_path)
+    return _TILING_DBS[db_path]
+
+
+def tiling_search_key(factor_fn_name, stopping_condition, selection_metric, heuristic_fn) -> str:
+    # Different search settings can select different tilings for the same codelet
+    fns = [stopping_condition, selection_metric, heuristic_fn]
+    return ":".join([factor_fn_name] + [getattr(fn, "__name__", str(fn)) for fn in fns])
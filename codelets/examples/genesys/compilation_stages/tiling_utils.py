@@ -1,6 +1,8 @@
 from typing import TYPE_CHECKING, List
 from collections import defaultdict, deque
-from itertools import product, tee
+from itertools import product, tee, islice, chain
+import multiprocessing as mp
+import numpy as np
 from pytools import memoize
 from sympy import Basic, Idx, symbols, Integer, lambdify
 
@@ -10,6 +12,7 @@ if TYPE_CHECKING:
     from codelets.codelet_impl import Codelet
 
 from .stage_structures import TilingInfo
+from .cost_model import TilingCostModel
 from . import CUSTOM_TILE_OPS
 from codelets.compiler.transformations import factors, factors_rand_sort, \
     factors_reversed, level_factors
@@ -20,6 +23,226 @@ FACTOR_FN_MAP = {'default': factors, 'random': factors_rand_sort, 'reversed': fa
                  'level': level_factors
                  }
 
+# Permutations are validated in batches which grow up to the maximum size, so that searches which stop at
+# one of the first permutations do not evaluate the entire search space
+MIN_PERM_BATCH = 64
+MAX_PERM_BATCH = 8192
+# When disabled, serial searches validate one permutation at a time with TilingInfo.validate_splits
+BATCH_VALIDATION = True
+
+def permutation_batches(perms, batched=True):
+    batch_size = MIN_PERM_BATCH if batched else 1
+    perms = iter(perms)
+    while True:
+        batch = list(islice(perms, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+        if batched:
+            batch_size = min(batch_size*2, MAX_PERM_BATCH)
+
+
+def validate_permutation_batch(cdlt, hag, tile_info: TilingInfo, level, batch, batched=True):
+    if batched:
+        return tile_info.validate_splits_batch(cdlt, np.asarray(batch, dtype=np.int64), level, hag)
+    return [tile_info.validate_splits(cdlt, p, level, hag) is not None for p in batch]
+
+SEARCH_ALGORITHMS = [None, 'branch_and_bound']
+
+
+def get_level_heuristic(heuristic_fn, cdlt, hag, tile_info: TilingInfo, level):
+    # Cost models need the codelet and level being tiled, while other heuristics only use the permutation
+    if isinstance(heuristic_fn, TilingCostModel):
+        return heuristic_fn.bind(cdlt, hag, tile_info, level)
+    return heuristic_fn
+
+
+def branch_and_bound_search(cdlt, hag, tile_info: TilingInfo, level, loop_dims_fixed, loop_deps_fixed, fixed_shapes,
+                            invalid_permutations):
+    # Finds the valid permutation with the fewest tiles, which is the same permutation selected by an exhaustive search
+    # using the number of tiles as the heuristic. Dimensions are assigned in order, and the subtrees of each partial
+    # permutation are pruned if they cannot fit in storage or cannot have fewer tiles than the best permutation so far.
+    dim_factors = [list(tile_info.level_factors[level - 1][d]) for d in tile_info.dims]
+    n_dims = len(dim_factors)
+
+    # Lower bounds for the unassigned dimensions: Tile counts are smallest with the smallest factors, and buffer
+    # footprints are smallest with the largest factors, since tile sizes do not increase with the number of splits
+    min_tail = [1]*(n_dims + 1)
+    leaf_counts = [1]*(n_dims + 1)
+    for d in reversed(range(n_dims)):
+        min_tail[d] = min_tail[d + 1]*min(dim_factors[d])
+        leaf_counts[d] = leaf_counts[d + 1]*len(dim_factors[d])
+    max_tail = [tuple(max(f) for f in dim_factors[d:]) for d in range(n_dims + 1)]
+
+    best_perm = None
+    best_tiles = None
+    visited = 0
+    pruned = 0
+    # Children are pushed in reverse so that permutations are visited in the same order as `product`,
+    # which keeps tie-breaking between permutations with the same number of tiles identical
+    stack = [()]
+    while len(stack) > 0:
+        prefix = stack.pop()
+        # Codelets without tiled dimensions have a single, empty permutation
+        depth = min(len(prefix) + 1, n_dims)
+        children = [prefix + (f,) for f in dim_factors[depth - 1]] if n_dims > 0 else [()]
+        tile_bounds = np.asarray([n_tiles(c) for c in children], dtype=np.int64)*min_tail[depth]
+        keep = np.ones(len(children), dtype=bool)
+        if best_tiles is not None:
+            keep &= tile_bounds < best_tiles
+
+        if depth < n_dims:
+            bounded = np.asarray([c + max_tail[depth] for c in children], dtype=np.int64)
+            keep &= tile_info.fits_storage_batch(cdlt, bounded, level, hag)
+            pruned += int((~keep).sum())*leaf_counts[depth]
+            stack.extend([c for c, k in zip(children, keep) if k][::-1])
+            continue
+
+        pruned += int((~keep).sum())
+        candidates = [c for c, k in zip(children, keep) if k and c not in invalid_permutations]
+        if len(candidates) == 0:
+            continue
+        valid_mask = tile_info.validate_splits_batch(cdlt, np.asarray(candidates, dtype=np.int64), level, hag)
+        for p, is_valid in zip(candidates, valid_mask):
+            visited += 1
+            if not is_valid:
+                continue
+            perm_shapes = get_sizes_from_splits(loop_dims_fixed, fixed_shapes, p)
+            if not tile_info.check_tile_hints(level, loop_deps_fixed, perm_shapes, p):
+                continue
+            p_tiles = n_tiles(p)
+            if best_tiles is None or p_tiles < best_tiles:
+                best_perm = p
+                best_tiles = p_tiles
+    return best_perm, visited, pruned
+
+
+def n_tiles(perm):
+    tiles = 1
+    for p in perm:
+        tiles *= p
+    return tiles
+
+
+# Level-1 searches with fewer permutations than this are not worth the cost of starting worker processes
+PARALLEL_SEARCH_MIN_PERMS = 20000
+MIN_SEARCH_CHUNK = 2048
+
+# Populated immediately before the search pool is forked so that workers inherit the codelet and tiling state
+_SEARCH_STATE = {}
+
+
+def use_parallel_search(cdlt, tile_info: TilingInfo, level, search_workers):
+    if search_workers <= 1 or level != 1 or level in cdlt.domain_tiling:
+        return False
+    if "fork" not in mp.get_all_start_methods():
+        raise RuntimeError(f"Parallel tiling search requires the 'fork' start method, which is not available"
+                           f" on this platform. Compile with search_workers=1 instead.")
+    # Workers for codelet-parallel compilation are daemonic, and cannot start their own pool
+    if mp.current_process().daemon:
+        return False
+    return n_tiles([len(f) for f in tile_info.level_factors[level - 1].values()]) >= PARALLEL_SEARCH_MIN_PERMS
+
+
+def _search_chunk_worker(bounds):
+    cdlt, hag, tile_info = _SEARCH_STATE['cdlt'], _SEARCH_STATE['hag'], _SEARCH_STATE['tile_info']
+    level = _SEARCH_STATE['level']
+    loop_dims_fixed, loop_deps_fixed = _SEARCH_STATE['loop_dims_fixed'], _SEARCH_STATE['loop_deps_fixed']
+    fixed_shapes = _SEARCH_STATE['fixed_shapes']
+    invalid_permutations = _SEARCH_STATE['invalid_permutations']
+    heuristic_fn = _SEARCH_STATE['heuristic_fn']
+
+    # Permutations are generated from their index in the product of the factors for each dimension
+    factor_lists = list(tile_info.level_factors[level - 1].values())
+    factor_idx = np.unravel_index(np.arange(*bounds), [len(f) for f in factor_lists])
+    perm_matrix = np.stack([np.asarray(f, dtype=np.int64)[i] for f, i in zip(factor_lists, factor_idx)], axis=1)
+    perms = [tuple(p) for p in perm_matrix.tolist()]
+    if not _SEARCH_STATE['derived']:
+        valid_mask = tile_info.validate_splits_batch(cdlt, perm_matrix, level, hag)
+
+    counted = 0
+    last_evaluated = None
+    results = []
+    for idx, raw_perm in enumerate(perms):
+        if raw_perm in invalid_permutations:
+            continue
+        counted += 1
+        last_evaluated = raw_perm
+        perm_shapes = get_sizes_from_splits(loop_dims_fixed, fixed_shapes, raw_perm)
+        if _SEARCH_STATE['derived']:
+            perm_shapes, p = tile_info.evaluate_derived_param(level, loop_deps_fixed, perm_shapes, raw_perm)
+            if not tile_info.check_tile_hints(level, loop_deps_fixed, perm_shapes, p):
+                continue
+            if tile_info.validate_derived_splits(cdlt, p, level, hag) is None:
+                continue
+        else:
+            p = raw_perm
+            if not valid_mask[idx] or not tile_info.check_tile_hints(level, loop_deps_fixed, perm_shapes, p):
+                continue
+        results.append((bounds[0] + idx, raw_perm, p, heuristic_fn(p)))
+    return counted, last_evaluated, results
+
+
+def parallel_level_search(cdlt, hag, tile_info: TilingInfo, level, loop_dims_fixed, loop_deps_fixed, fixed_shapes,
+                          invalid_permutations, heuristic_fn, stopping_condition, selection_metric, search_workers,
+                          start=0, derived=False):
+    # Chunks of the level's permutations are evaluated in parallel, but the results are consumed in order so that
+    # the stopping condition and selection metric see the same sequence of permutations as a serial search
+    n_perms = n_tiles([len(f) for f in tile_info.level_factors[level - 1].values()])
+    chunk_size = max(MIN_SEARCH_CHUNK, -(-(n_perms - start) // (search_workers*4)))
+    chunks = [(c, min(c + chunk_size, n_perms)) for c in range(start, n_perms, chunk_size)]
+
+    search_space = {}
+    stop_search = False
+    last_valid_permutation = None
+    last_evaluated = None
+    selected_permutation = None
+    next_start = 0
+    counted = 0
+    _SEARCH_STATE.update({'cdlt': cdlt, 'hag': hag, 'tile_info': tile_info, 'level': level,
+                          'loop_dims_fixed': loop_dims_fixed, 'loop_deps_fixed': loop_deps_fixed,
+                          'fixed_shapes': fixed_shapes, 'invalid_permutations': invalid_permutations,
+                          'heuristic_fn': heuristic_fn, 'derived': derived})
+    n_workers = min(search_workers, max(len(chunks), 1))
+    try:
+        with mp.get_context("fork").Pool(n_workers) as pool:
+            # Chunks are submitted as results are consumed, so that only the chunks already in flight are evaluated
+            # after the search stops
+            remaining = iter(chunks)
+            pending = deque(pool.apply_async(_search_chunk_worker, (c,)) for c in islice(remaining, n_workers*2))
+            while len(pending) > 0:
+                chunk_counted, chunk_last, results = pending.popleft().get()
+                next_chunk = next(remaining, None)
+                if next_chunk is not None:
+                    pending.append(pool.apply_async(_search_chunk_worker, (next_chunk,)))
+                counted += chunk_counted
+                last_evaluated = chunk_last or last_evaluated
+                for perm_idx, raw_perm, p, heuristic_value in results:
+                    last_valid_permutation = p
+                    search_space[p] = heuristic_value
+                    stop_search = stopping_condition(search_space)
+                    if stop_search:
+                        selected_permutation = selection_metric(search_space, p)
+                        last_evaluated = raw_perm
+                        # A search which returns to this level resumes after the selected permutation
+                        next_start = perm_idx + 1
+                        break
+                if stop_search:
+                    pool.terminate()
+                    break
+    finally:
+        _SEARCH_STATE.clear()
+
+    if not stop_search:
+        selected_permutation = selection_metric(search_space, last_valid_permutation)
+
+    if derived and last_evaluated is not None:
+        # Derived parameters keep the values of the last evaluated permutation, as they would after a serial search
+        perm_shapes = get_sizes_from_splits(loop_dims_fixed, fixed_shapes, last_evaluated)
+        tile_info.evaluate_derived_param(level, loop_deps_fixed, perm_shapes, last_evaluated)
+    return selected_permutation, next_start, counted
+
+
 # @memoize
 def get_sizes_from_splits(loops, shapes, splits):
     out_shapes = []
@@ -166,14 +389,20 @@ def set_codelet_tiling(cdlt: 'Codelet',
                        factor_fn_name,
                        stopping_condition,
                        selection_metric,
-                       heuristic_fn):
+                       heuristic_fn,
+                       search_algorithm=None,
+                       search_workers=1):
 
     if stopping_condition is None:
         RuntimeError("Stopping condition for codelet tiling is not specified")
     if selection_metric is None:
         RuntimeError("Selection metric for codelet tiling is not specified")
+    if search_algorithm not in SEARCH_ALGORITHMS:
+        raise RuntimeError(f"Invalid tiling search algorithm {search_algorithm}. "
+                           f"Supported algorithms: {SEARCH_ALGORITHMS}")
     if cdlt.op_name in CUSTOM_TILE_OPS:
-        return set_dw_conv_tiling(cdlt, hag, factor_fn_name, stopping_condition, selection_metric, heuristic_fn)
+        return set_dw_conv_tiling(cdlt, hag, factor_fn_name, stopping_condition, selection_metric, heuristic_fn,
+                                  search_workers=search_workers)
     # TODO: Try to look ahead and see if all paths lead to node, in which case
     # we can add additional constraints to the first level
     tile_info = get_tile_info(cdlt, hag, factor_fn_name)
@@ -188,6 +417,8 @@ def set_codelet_tiling(cdlt: 'Codelet',
     perm_stack.append(first_perm)
     level = 1
     level_counter = defaultdict(int)
+    pruned_counter = defaultdict(int)
+    level1_start = 0
     loop_deps_fixed = tuple(tile_info.loop_dependencies)
     loop_dims_fixed = tuple(tile_info.dims)
     parent_perms = deque()
@@ -211,41 +442,64 @@ def set_codelet_tiling(cdlt: 'Codelet',
 
     while tile_info.levels > level > 0:
         prev_level = level - 1
-        perms = tile_info.get_tile_permutations(level, perm_stack, cdlt)
-        perms, perms_copy = tee(perms)
-        assert perms is not None
         fixed_shapes = tuple([tile_info.shapes[prev_level][l] for l in tile_info.dims])
-        search_space = {}
-        stop_search = False
-        last_valid_permutation = None
-        selected_permutation = None
-        for p in perms:
-            if p in invalid_permutations:
-                continue
-            level_counter[level] += 1
-
-            perm_shapes = get_sizes_from_splits(loop_dims_fixed, fixed_shapes, p)
-
-            passes_hint = tile_info.check_tile_hints(level, loop_deps_fixed, perm_shapes, p)
-            if not passes_hint:
-                print_info(level, p, "tile hints")
-                continue
-            valid_splits = tile_info.validate_splits(cdlt, p, level, hag)
-            if valid_splits is None:
-                print_info(level, p, "valid splits")
-                continue
-            last_valid_permutation = p
-            search_space[p] = heuristic_fn(p)
-            stop_search = stopping_condition(search_space)
-
-            if stop_search:
-                selected_permutation = selection_metric(search_space, p)
-                break
-        # Explored all permutations
-        if not stop_search:
-            selected_permutation = selection_metric(search_space, last_valid_permutation)
-            # Need to reset permutation generator to restart search if return to this level
-            perm_stack[level-1] = perms_copy
+        if search_algorithm == 'branch_and_bound' and level not in cdlt.domain_tiling:
+            selected_permutation, visited, pruned = branch_and_bound_search(cdlt, hag, tile_info, level,
+                                                                            loop_dims_fixed, loop_deps_fixed,
+                                                                            fixed_shapes, invalid_permutations)
+            level_counter[level] += visited
+            pruned_counter[level] += pruned
+        elif use_parallel_search(cdlt, tile_info, level, search_workers):
+            level_heuristic = get_level_heuristic(heuristic_fn, cdlt, hag, tile_info, level)
+            selected_permutation, level1_start, visited = parallel_level_search(cdlt, hag, tile_info, level,
+                                                                               loop_dims_fixed, loop_deps_fixed,
+                                                                               fixed_shapes, invalid_permutations,
+                                                                               level_heuristic, stopping_condition,
+                                                                               selection_metric, search_workers,
+                                                                               start=level1_start)
+            level_counter[level] += visited
+        else:
+            perms = tile_info.get_tile_permutations(level, perm_stack, cdlt)
+            perms, perms_copy = tee(perms)
+            assert perms is not None
+            level_heuristic = get_level_heuristic(heuristic_fn, cdlt, hag, tile_info, level)
+            search_space = {}
+            stop_search = False
+            last_valid_permutation = None
+            selected_permutation = None
+            for batch in permutation_batches(perms, batched=BATCH_VALIDATION):
+                # Capacity constraints are checked for the whole batch at once, hints only for the remaining candidates
+                valid_mask = validate_permutation_batch(cdlt, hag, tile_info, level, batch, batched=BATCH_VALIDATION)
+                for idx, (p, is_valid) in enumerate(zip(batch, valid_mask)):
+                    if p in invalid_permutations:
+                        continue
+                    level_counter[level] += 1
+                    if not is_valid:
+                        print_info(level, p, "valid splits")
+                        continue
+
+                    perm_shapes = get_sizes_from_splits(loop_dims_fixed, fixed_shapes, p)
+                    passes_hint = tile_info.check_tile_hints(level, loop_deps_fixed, perm_shapes, p)
+                    if not passes_hint:
+                        print_info(level, p, "tile hints")
+                        continue
+                    last_valid_permutation = p
+                    search_space[p] = level_heuristic(p)
+                    stop_search = stopping_condition(search_space)
+
+                    if stop_search:
+                        selected_permutation = selection_metric(search_space, p)
+                        break
+                if stop_search:
+                    # Permutations after the selected one were read as part of the batch, but still need to be
+                    # searched if the search returns to this level
+                    perm_stack[level - 1] = chain(batch[idx + 1:], perms)
+                    break
+            # Explored all permutations
+            if not stop_search:
+                selected_permutation = selection_metric(search_space, last_valid_permutation)
+                # Need to reset permutation generator to restart search if return to this level
+                perm_stack[level-1] = perms_copy
         # If no split available, move up a level and restart search.
         # Else store current permutation and move down a level.
         if selected_permutation is None:
@@ -276,6 +530,7 @@ def set_codelet_tiling(cdlt: 'Codelet',
                            f"Dimensions: {cdlt.operand_dim_mapping()}\n"
                            f"Operands: {[f'{o.name}: {o.shape}' for o in cdlt.operands]}\n"
                            f"Times per level: {level_counter}\n"
+                           f"Pruned per level: {pruned_counter}\n"
                            f"Op: {cdlt.op_name}{cdlt.instance_id}\n"
                            f"Constraints:{[(k, t.fn_body_str) for k, t in tile_info.constraint_fps.items()]}\n\n"
                            f"Level Hints: {hint_str}\n"
@@ -305,6 +560,7 @@ def set_codelet_tiling(cdlt: 'Codelet',
         for ld in tile_info.loop_dependencies:
             cdlt._domain_tiling[l][ld] = dim_splits[tile_info.loop_dim_map[ld]]
             cdlt._domain_loop_map[l][ld] = tile_info.shapes[l][tile_info.loop_dim_map[ld]]
+    cdlt._tiling_search_stats = {'visited': sum(level_counter.values()), 'pruned': sum(pruned_counter.values())}
     return cdlt
 
 
@@ -314,7 +570,8 @@ def set_dw_conv_tiling(cdlt: 'Codelet',
                        factor_fn_name,
                        stopping_condition,
                        selection_metric,
-                       heuristic_fn):
+                       heuristic_fn,
+                       search_workers=1):
 
     if stopping_condition is None:
         RuntimeError("Stopping condition for codelet tiling is not specified")
@@ -337,6 +594,7 @@ def set_dw_conv_tiling(cdlt: 'Codelet',
     perm_stack.append(first_perm)
     level = 1
     level_counter = defaultdict(int)
+    level1_start = 0
     loop_deps_fixed = tuple(tile_info.loop_dependencies)
     loop_dims_fixed = tuple(tile_info.dims)
     parent_perms = deque()
@@ -353,37 +611,47 @@ def set_dw_conv_tiling(cdlt: 'Codelet',
 
     while tile_info.levels > level > 0:
         prev_level = level - 1
-        perms = tile_info.get_tile_permutations(level, perm_stack, cdlt)
-        perms, perms_copy = tee(perms)
-        assert perms is not None
         fixed_shapes = tuple([tile_info.shapes[prev_level][l] for l in tile_info.dims])
-        search_space = {}
-        stop_search = False
-        last_valid_permutation = None
-        selected_permutation = None
-        for p in perms:
-            if p in invalid_permutations:
-                continue
-            level_counter[level] += 1
-            perm_shapes = get_sizes_from_splits(loop_dims_fixed, fixed_shapes, p)
-            perm_shapes, p = tile_info.evaluate_derived_param(level, loop_deps_fixed, perm_shapes, p)
-            passes_hint = tile_info.check_tile_hints(level, loop_deps_fixed, perm_shapes, p)
-            if not passes_hint:
-                continue
-            valid_splits = tile_info.validate_derived_splits(cdlt, p, level, hag)
-            if valid_splits is None:
-                continue
-            last_valid_permutation = p
-            search_space[p] = heuristic_fn(p)
-            stop_search = stopping_condition(search_space)
-            if stop_search:
-                selected_permutation = selection_metric(search_space, p)
-                break
-        # Explored all permutations
-        if not stop_search:
-            selected_permutation = selection_metric(search_space, last_valid_permutation)
-            # Need to reset permutation generator to restart search if return to this level
-            perm_stack[level-1] = perms_copy
+        level_heuristic = get_level_heuristic(heuristic_fn, cdlt, hag, tile_info, level)
+        if use_parallel_search(cdlt, tile_info, level, search_workers):
+            selected_permutation, level1_start, visited = parallel_level_search(cdlt, hag, tile_info, level,
+                                                                               loop_dims_fixed, loop_deps_fixed,
+                                                                               fixed_shapes, invalid_permutations,
+                                                                               level_heuristic, stopping_condition,
+                                                                               selection_metric, search_workers,
+                                                                               start=level1_start, derived=True)
+            level_counter[level] += visited
+        else:
+            perms = tile_info.get_tile_permutations(level, perm_stack, cdlt)
+            perms, perms_copy = tee(perms)
+            assert perms is not None
+            search_space = {}
+            stop_search = False
+            last_valid_permutation = None
+            selected_permutation = None
+            for p in perms:
+                if p in invalid_permutations:
+                    continue
+                level_counter[level] += 1
+                perm_shapes = get_sizes_from_splits(loop_dims_fixed, fixed_shapes, p)
+                perm_shapes, p = tile_info.evaluate_derived_param(level, loop_deps_fixed, perm_shapes, p)
+                passes_hint = tile_info.check_tile_hints(level, loop_deps_fixed, perm_shapes, p)
+                if not passes_hint:
+                    continue
+                valid_splits = tile_info.validate_derived_splits(cdlt, p, level, hag)
+                if valid_splits is None:
+                    continue
+                last_valid_permutation = p
+                search_space[p] = level_heuristic(p)
+                stop_search = stopping_condition(search_space)
+                if stop_search:
+                    selected_permutation = selection_metric(search_space, p)
+                    break
+            # Explored all permutations
+            if not stop_search:
+                selected_permutation = selection_metric(search_space, last_valid_permutation)
+                # Need to reset permutation generator to restart search if return to this level
+                perm_stack[level-1] = perms_copy
         # If no split available, move up a level and restart search.
         # Else store current permutation and move down a level.
         if selected_permutation is None:
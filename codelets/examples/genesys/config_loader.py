@@ -1,6 +1,7 @@
 import json
 
 from codelets import Datatype
+from codelets.compiler.relocation_table import DRAM_ALLOCATORS, DEFAULT_DRAM_ALLOCATOR
 
 OP_DTYPES = [Datatype(type='FXP', bitwidth=8, fractional=4, exp=4),
              Datatype(type='FXP', bitwidth=16, fractional=8, exp=8),
@@ -133,6 +134,11 @@ def set_defaults(cfg):
     if 'DATAGEN' not in cfg:
         cfg['DATAGEN'] = False
 
+    if 'DATAGEN_FORMAT' not in cfg:
+        cfg['DATAGEN_FORMAT'] = "npy"
+    else:
+        assert cfg['DATAGEN_FORMAT'] in ["npy", "text"]
+
     if 'DEBUG_MMUL_COORDS' not in cfg:
         cfg['DEBUG_MMUL_COORDS'] = None
     else:
@@ -208,6 +214,16 @@ def set_defaults(cfg):
     if 'ADDR_ALIGNMENT' not in cfg:
         cfg['ADDR_ALIGNMENT'] = 4096*8
 
+    if 'DRAM_ALLOCATOR' not in cfg:
+        cfg['DRAM_ALLOCATOR'] = DEFAULT_DRAM_ALLOCATOR
+    else:
+        assert cfg['DRAM_ALLOCATOR'] in DRAM_ALLOCATORS.keys()
+
+    if 'ALIAS_ACTIVATIONS' not in cfg:
+        cfg['ALIAS_ACTIVATIONS'] = True
+    else:
+        assert isinstance(cfg['ALIAS_ACTIVATIONS'], bool)
+
     return cfg
 
 def load_config(fpath):
@@ -0,0 +1,57 @@
+from pathlib import Path
+import numpy as np
+
+# "npy" files store raw little-endian arrays behind a fixed-size header, and can be memory-mapped by the loaders.
+# "text" files store one decimal value per line.
+DATA_FILE_EXTS = {"npy": "npy", "text": "txt"}
+DEFAULT_DATA_FORMAT = "npy"
+
+
+def data_file_format(path):
+    return "npy" if str(path).endswith(".npy") else "text"
+
+
+def save_array(path, data):
+    if data_file_format(path) == "npy":
+        data = np.ascontiguousarray(data)
+        np.save(path, data.astype(data.dtype.newbyteorder('<'), copy=False), allow_pickle=False)
+    else:
+        with open(path, 'w') as f:
+            f.write('\n'.join([str(i) for i in data.flatten().tolist()]))
+
+
+def load_array(path, shape=None, dtype=np.int64, mmap=True):
+    if data_file_format(path) == "npy":
+        return np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False)
+    data = np.loadtxt(path, dtype=dtype, ndmin=1)
+    return data.reshape(shape) if shape is not None else data
+
+
+def data_file_index(path):
+    # Location of the array data in a file, so that it can be mapped without parsing the file
+    if data_file_format(path) != "npy":
+        return {"format": "text"}
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        assert not fortran_order
+        return {"format": "npy", "offset": f.tell(), "shape": list(shape), "dtype": dtype.str}
+
+
+def convert_to_text(path, output_path=None):
+    output_path = output_path or f"{str(path)[:-len('.npy')]}.txt"
+    save_array(output_path, load_array(path))
+    return output_path
+
+
+def convert_directory_to_text(data_dir, verbose=False):
+    converted = []
+    for path in sorted(Path(data_dir).rglob("*.npy")):
+        converted.append(convert_to_text(path))
+        if verbose:
+            print(f"Converted {path} --> {converted[-1]}")
+    return converted
+
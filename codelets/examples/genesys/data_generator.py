@@ -1,23 +1,21 @@
 from typing import Dict
-from .codelets.reference_impls.ref_op import OperandData
+from .codelets.reference_impls.ref_op import OperandData, create_operand_data
 from codelets.codelet_impl import Codelet
 from codelets.compiler.program import CodeletProgram
 from collections import defaultdict
+from contextlib import ExitStack
 import numpy as np
 import os
 from pathlib import Path
 import json
 from .genesys import get_arch
+from .data_files import save_array, data_file_index, DATA_FILE_EXTS, DEFAULT_DATA_FORMAT
 import git
 BENCH_BASE_ADDR = {"INSTR": 0, "OBUF": 0, "BBUF": 4096, "WBUF": 24576, "IBUF": 4259840}
 
-
-
-def save_array(path, data):
-    with open(path, 'w') as f:
-        f.write('\n'.join([str(i) for i in data.flatten().tolist()]))
-
-OUTPUT_TYPES = ["arch_cfg", "operations_idx", "json", "string_final", "decimal", "binary"]
+OUTPUT_TYPES = ["arch_cfg", "operations_idx", "json", "string_final", "decimal", "binary", "packed"]
+STREAM_OUTPUT_EXTS = {"operations_idx": "txt", "string_final": "txt", "decimal": "txt", "binary": "txt",
+                      "json": "json", "packed": "bin"}
 OUT_DIR = Path(f"{Path(__file__).parent}/../../tools/compilation_output")
 
 class DataGen(object):
@@ -34,12 +32,15 @@ class DataGen(object):
                  propagate_outputs=False,
                  print_datagen_range=False,
                  out_path=None,
-                 datagen_vrange=None):
+                 datagen_vrange=None,
+                 data_format=None):
         self.print_datagen_range = print_datagen_range
         self.datagen_vrange = datagen_vrange
         self.store_whole_program = store_whole_program
         self.shared_datagen = shared_datagen
         self._storage_info = {}
+        # Generated inputs by weight storage name, so that duplicate weights are given the same data
+        self._unique_inputs: Dict[str, OperandData] = {}
         self._propagate_outputs = propagate_outputs
         self._program = program
         self._inouts = {"inputs": [], "outputs": []}
@@ -63,6 +64,11 @@ class DataGen(object):
             output_dir = f"{output_dir}_{dir_ext}"
         self.output_dir = f"{output_dir}_{identifier}"
         self.arch_cfg = get_arch(None, self.program.hag.meta_cfg, None)
+        self.data_format = data_format or self.program.hag.meta_cfg.get('DATAGEN_FORMAT', DEFAULT_DATA_FORMAT)
+        if self.data_format not in DATA_FILE_EXTS:
+            raise KeyError(f"Invalid data format {self.data_format}:\n"
+                           f"Possible formats: {list(DATA_FILE_EXTS.keys())}")
+        self.data_ext = DATA_FILE_EXTS[self.data_format]
 
         if not Path(self.output_dir).exists():
             try:
@@ -121,6 +127,10 @@ class DataGen(object):
                                                       f"Data: {operand.data.shape}\n" \
                                                       f"Operand: {i.shape}"
                 inouts['inputs'].append(operand)
+            elif self.program.weight_storage_name(i.node_name) in self._unique_inputs:
+                operand = self._unique_inputs[self.program.weight_storage_name(i.node_name)]
+                if operand.data.shape == i.shape and str(operand.idx.dtype) == str(i.dtype):
+                    inouts['inputs'].append(create_operand_data(operand.data, i))
         return inouts
 
 
@@ -147,12 +157,20 @@ class DataGen(object):
                                                    f"UID: {i.node_name}\n" \
                                                    f"Storage keys: {list(self.storage_info.keys())}"
 
-            if Path(f"{base_path}/{node_name}").exists():
-                save_array(f'{base_path}/{node_name}/{node_name}.txt', i.data)
-                self.storage_info[node_name]['path'] = f'{base_path}/{node_name}/'
-            else:
-                save_array(f'{base_path}/{node_name}.txt', i.data)
-                self.storage_info[node_name]['path'] = f'{base_path}/{node_name}.txt'
+            self.store_operand_data(base_path, node_name, i.data)
+
+    def store_operand_data(self, base_path, node_name, data):
+        if Path(f"{base_path}/{node_name}").exists():
+            # Operands with formatted copies are stored in a directory, with the unformatted data in the file
+            # named after the operand
+            path = f'{base_path}/{node_name}/{node_name}.{self.data_ext}'
+            save_array(path, data)
+            self.storage_info[node_name]['path'] = f'{base_path}/{node_name}/'
+        else:
+            path = f'{base_path}/{node_name}.{self.data_ext}'
+            save_array(path, data)
+            self.storage_info[node_name]['path'] = path
+        self.storage_info[node_name]['data'] = data_file_index(path)
 
     def initialize_storage(self, cdlt, inouts):
         formatted = []
@@ -162,6 +180,7 @@ class DataGen(object):
             if i.fmt is None and i.node_name not in self.value_dict['inputs'] and \
                     i.node_name not in self.value_dict['intermediate']:
                 self.value_dict['inputs'][i.node_name] = i
+                self._unique_inputs.setdefault(self.program.weight_storage_name(i.node_name), i)
                 node_name = i.node_name
                 self.storage_info[node_name] = {"cdlt": cdlt.cdlt_uid,
                                                 "path": None,
@@ -179,7 +198,7 @@ class DataGen(object):
                 node_name = f.node_name
                 if not Path(f"{base_path}/{node_name}").exists():
                     os.makedirs(f"{base_path}/{node_name}")
-                save_array(f'{base_path}/{node_name}/{node_name}_{f.fmt}.txt', f.data)
+                save_array(f'{base_path}/{node_name}/{node_name}_{f.fmt}.{self.data_ext}', f.data)
 
     def store_outputs(self, cdlt, inouts, base_path):
 
@@ -209,12 +228,7 @@ class DataGen(object):
                                                    f"UID: {o.node_name}\n" \
                                                    f"Storage keys: {list(self.storage_info.keys())}"
 
-            if Path(f"{base_path}/{node_name}").exists():
-                save_array(f'{base_path}/{node_name}/{node_name}.txt', o.data)
-                self.storage_info[node_name]['path'] = f'{base_path}/{node_name}/'
-            else:
-                save_array(f'{base_path}/{node_name}.txt', o.data)
-                self.storage_info[node_name]['path'] = f'{base_path}/{node_name}.txt'
+            self.store_operand_data(base_path, node_name, o.data)
 
         if 'csv_data' in inouts:
             partials = inouts.pop('csv_data')
@@ -251,6 +265,7 @@ class DataGen(object):
         self._value_dict: Dict[str, Dict[str, OperandData]] = {"inputs": {},
                                                                "intermediate": {},
                                                                "outputs": {}}
+        self._unique_inputs = {}
 
     def generate_codelet_data(self):
         for layer_id, cdlt in enumerate(self.program.codelets):
@@ -267,41 +282,7 @@ class DataGen(object):
                 except OSError as e:
                     raise RuntimeError(f"Creation of directory {output_location} failed:\n {e}")
 
-            if 'operations_idx' in self.output_types:
-                otype = 'operations_idx'
-                ext = 'txt'
-                res = self.program.emit_codelet_as_program(cdlt.instance_id, otype)
-                with open(f"{output_location}/{cdlt.cdlt_uid}_{otype}.{ext}", "w") as outfile:
-                    outfile.write(res)
-
-            if 'string_final' in self.output_types:
-                otype = 'string_final'
-                ext = 'txt'
-                res = self.program.emit_codelet_as_program(cdlt.instance_id, otype)
-                with open(f"{output_location}/{cdlt.cdlt_uid}_{otype}.{ext}", "w") as outfile:
-                    outfile.write(res)
-
-            if 'decimal' in self.output_types:
-                otype = 'decimal'
-                ext = 'txt'
-                res = self.program.emit_codelet_as_program(cdlt.instance_id, otype)
-                with open(f"{output_location}/{cdlt.cdlt_uid}_{otype}.{ext}", "w") as outfile:
-                    outfile.write(res)
-
-            if 'binary' in self.output_types:
-                otype = 'binary'
-                ext = 'txt'
-                res = self.program.emit_codelet_as_program(cdlt.instance_id, otype)
-                with open(f"{output_location}/{cdlt.cdlt_uid}_{otype}.{ext}", "w") as outfile:
-                    outfile.write(res)
-
-            if 'json' in self.output_types:
-                otype = 'json'
-                ext = 'json'
-                res = self.program.emit_codelet_as_program(cdlt.instance_id, otype)
-                res = json.dumps(res, indent=2)
-                with open(f"{output_location}/{cdlt.cdlt_uid}_{otype}.{ext}", "w") as outfile:
-                    outfile.write(res)
+            self.store_emitted_outputs(f"{output_location}/{cdlt.cdlt_uid}", cdlt_id=cdlt.instance_id)
 
             if self.generate_data:
                 base_path = f"{output_location}/data"
@@ -318,6 +299,17 @@ class DataGen(object):
 
 
 
+    def store_emitted_outputs(self, base_path, cdlt_id=None):
+        # All output types are written in a single traversal of the program
+        with ExitStack() as stack:
+            streams = {}
+            for otype in self.output_types:
+                if otype in STREAM_OUTPUT_EXTS:
+                    ext = STREAM_OUTPUT_EXTS[otype]
+                    path = f"{base_path}.{ext}" if otype == "packed" else f"{base_path}_{otype}.{ext}"
+                    streams[otype] = stack.enter_context(open(path, "wb" if otype == "packed" else "w"))
+            self.program.emit_to_streams(streams, cdlt_id=cdlt_id)
+
     def store_program(self):
         if self.verbose:
             print(f"Storing program {self.program.name}")
@@ -328,41 +320,7 @@ class DataGen(object):
             except OSError as e:
                 raise RuntimeError(f"Creation of directory {output_location} failed:\n {e}")
 
-        if 'operations_idx' in self.output_types:
-            otype = 'operations_idx'
-            ext = 'txt'
-            res = self.program.emit(otype)
-            with open(f"{output_location}/{self.program.name}_{otype}.{ext}", "w") as outfile:
-                outfile.write(res)
-
-        if 'string_final' in self.output_types:
-            otype = 'string_final'
-            ext = 'txt'
-            res = self.program.emit(otype)
-            with open(f"{output_location}/{self.program.name}_{otype}.{ext}", "w") as outfile:
-                outfile.write(res)
-
-        if 'decimal' in self.output_types:
-            otype = 'decimal'
-            ext = 'txt'
-            res = self.program.emit(otype)
-            with open(f"{output_location}/{self.program.name}_{otype}.{ext}", "w") as outfile:
-                outfile.write(res)
-
-        if 'binary' in self.output_types:
-            otype = 'binary'
-            ext = 'txt'
-            res = self.program.emit(otype)
-            with open(f"{output_location}/{self.program.name}_{otype}.{ext}", "w") as outfile:
-                outfile.write(res)
-
-        if 'json' in self.output_types:
-            otype = 'json'
-            ext = 'json'
-            res = self.program.emit(otype)
-            res = json.dumps(res, indent=2)
-            with open(f"{output_location}/{self.program.name}_{otype}.{ext}", "w") as outfile:
-                outfile.write(res)
+        self.store_emitted_outputs(f"{output_location}/{self.program.name}")
 
         if self.generate_data and self.shared_datagen:
             base_path = f"{output_location}/data"
@@ -385,10 +343,10 @@ class DataGen(object):
         is_shuffled = False
         if Path(f"{path}/").exists():
             assert Path(f"{path}/").is_dir()
-            path = path + f"/{operand.node_name}_shuffled.txt"
+            path = path + f"/{operand.node_name}_shuffled.{self.data_ext}"
             is_shuffled = True
-        elif Path(f"{path}.txt").exists():
-            path = f"{path}.txt"
+        elif Path(f"{path}.{self.data_ext}").exists():
+            path = f"{path}.{self.data_ext}"
         else:
             raise RuntimeError(f"Path for codelet {cdlt.cdlt_uid}, {operand_type} {operand.node_name} ({operand.name}) does not exist:\n"
                                f"path: {path}")
@@ -410,7 +368,8 @@ class DataGen(object):
             "offset": offset,
             "shape": dram_shape,
             "size_in_bytes": operand_size,
-            "buffer": buffer
+            "buffer": buffer,
+            "data": data_file_index(path)
         }
         return info_blob
 
@@ -419,7 +378,8 @@ class DataGen(object):
         input_offset = self.program.get_instr_mem_end()
 
         output_offset = 0
-        info_map = {"inputs": {}, "outputs": {}, "instructions": {}}
+        info_map = {"inputs": {}, "outputs": {}, "instructions": {}, "shared_inputs": {}}
+        stored_weights = {}
 
         def check_operand_info(prev_info, new_info, operand_type):
             pretty_prev = json.dumps(prev_info, indent=2, cls=NPEncoder)
@@ -455,6 +415,15 @@ class DataGen(object):
                 input_path = f"{cdlt_path}{i.node_name}"
                 # offset = self.program.
                 inp_offset = self.program.get_input_operand_offset(i)
+                if self.program.relocatables.get_operand_namespace(i) == "WEIGHT_AND_BIAS":
+                    # Duplicate weights with the same DRAM layout share a single fragment, and only the first of
+                    # them is stored
+                    storage_key = (self.program.weight_storage_name(i.node_name), inp_offset)
+                    if storage_key in stored_weights:
+                        if stored_weights[storage_key] != i.node_name:
+                            info_map['shared_inputs'][i.node_name] = stored_weights[storage_key]
+                        continue
+                    stored_weights[storage_key] = i.node_name
                 info_blob = self.generate_operand_storage_info(cdlt, i, "input", inp_offset, input_path)
 
                 if i.node_name in info_map['inputs']:
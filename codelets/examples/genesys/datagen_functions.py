@@ -3,6 +3,7 @@ from fxpmath import Fxp
 from collections import namedtuple
 from collections.abc import Iterable
 from . import FXP_CONFIGS
+from .data_files import save_array
 # from . import GENESYS_CFG
 import torch.nn.functional as F
 import torch
@@ -11,11 +12,6 @@ from torch import nn
 OperandData = namedtuple('OperandData', ['data', 'node_name', 'opname', 'idx', 'fmt'], defaults=[None])
 
 
-
-def save_array(path, data):
-    with open(path, 'w') as f:
-        f.write('\n'.join([str(i) for i in data.flatten().tolist()]))
-
 def compute_range(fxp_dtype, scale=1):
     cfg = FXP_CONFIGS[fxp_dtype]
     upper_val = (1 << (np.int32(cfg['n_word']//scale) - 1)) - 1
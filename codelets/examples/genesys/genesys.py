@@ -2,6 +2,7 @@ from codelets.adl.graph import ComputeNode, StorageNode
 from codelets import initialize_program
 from .compilation_stages.stages import tile, hoist, remove_unused_variables, update_operand_dtypes, \
     add_simd_typecast, template_layout_pass, template_pad_pass, separate_simd_sa_ops, quantize_codelet
+from .compilation_stages.cost_model import TilingCostModel
 from .genesys_instructions import GENESYS_INSTRUCTIONS
 from .instruction_templates.genesys_templates import GENESYS_TEMPLATES
 # from .genesys_inference_codelets import GENESYS_CODELETS
@@ -288,9 +289,16 @@ def compile_genesys(model_name,
                     tiling_search_algorithm='valid_split',
                     do_compile=True,
                     graph=None,
-                    do_srdfg_passes=True
+                    do_srdfg_passes=True,
+                    workers=1,
+                    cache_codelets=False,
+                    tiling_db=None,
+                    tile_search_workers=1,
+                    initializers=None,
+                    deduplicate_weights=False
                     ):
     MODEL_DIR = f"{benchmark_path}/models/srdfg"
+    ONNX_MODEL_PATH = f"{benchmark_path}/models/{model_name}.onnx"
     OUT_DIR = f"{benchmark_path}/compiler_outputs"
 
     TILING_DIR = f"{benchmark_path}/tiling_info"
@@ -327,10 +335,11 @@ def compile_genesys(model_name,
     metadata = {'GENESYS_IMPLS': impls, 'GENESYS_CODELETS': cdlts,
                 'FUSION_OP_INFO': load_fusion_op_info(def_cfg)}
     program = initialize_program(graph, genesys, metadata=metadata, mode=mode)
-    program.add_compilation_step("template_layout_pass", template_layout_pass, template=True)
+    program.add_compilation_step("template_layout_pass", template_layout_pass, template=True,
+                                 storage_dependent=False)
 
     program.add_compilation_step("template_pad_pass", template_pad_pass, template=True,
-                                 )
+                                 storage_dependent=False)
 
     program.add_compilation_step("update_operand_dtypes", update_operand_dtypes, preproc=True,
                                  stage_kwargs={'dtype_map': dtypes})
@@ -343,6 +352,22 @@ def compile_genesys(model_name,
                         'selection_metric': min_tiles_selection_metric,
                        'heuristic_fn': n_tiles_heuristic
                        }
+    elif tiling_search_algorithm == 'min_cycles':
+        tile_kwargs = {
+                'factor_fn_name': factor_fn,
+                       'stopping_condition': exhaustive_search_stopping_condition,
+                        'selection_metric': min_cost_selection_metric,
+                       'heuristic_fn': TilingCostModel()
+                       }
+    elif tiling_search_algorithm == 'branch_and_bound':
+        # Selects the same tiling as 'min_tiles', which is still used for codelets with derived tilings
+        tile_kwargs = {
+                'factor_fn_name': factor_fn,
+                       'stopping_condition': exhaustive_search_stopping_condition,
+                        'selection_metric': min_tiles_selection_metric,
+                       'heuristic_fn': n_tiles_heuristic,
+                       'search_algorithm': 'branch_and_bound'
+                       }
     else:
         tile_kwargs = {
             'factor_fn_name': factor_fn,
@@ -351,17 +376,22 @@ def compile_genesys(model_name,
                        'heuristic_fn': n_tiles_heuristic
                        }
 
-    if store_tiling:
-        tile_kwargs['checkpoint_file'] = str(Path(f"{TILING_DIR}/{graph.name}_tiling_info_checkpoint.json").absolute())
+    if store_tiling and tiling_db is None:
+        tiling_db = f"{TILING_DIR}/tiling_info.db"
+    if tiling_db is not None:
+        tile_kwargs['tiling_db'] = str(Path(tiling_db).absolute())
+    if tile_search_workers > 1:
+        # Only used when codelets are tiled serially, as stage workers cannot start their own pool
+        tile_kwargs['search_workers'] = tile_search_workers
     finalize_instructions = True
     if do_tile_stage:
-        program.add_compilation_step("tile", tile, stage_kwargs=tile_kwargs)
-        program.add_compilation_step("separate_ops", separate_simd_sa_ops)
+        program.add_compilation_step("tile", tile, stage_kwargs=tile_kwargs, parallel=True)
+        program.add_compilation_step("separate_ops", separate_simd_sa_ops, parallel=True)
     else:
         finalize_instructions = False
 
     if do_hoist_stage:
-        program.add_compilation_step("hoist", hoist, dependencies=["tile"])
+        program.add_compilation_step("hoist", hoist, dependencies=["tile"], parallel=True)
         program.add_compilation_step("simd_typecast", add_simd_typecast, dependencies=["hoist"],
                                  stage_kwargs={"dtype_map": {}, "codelet_output_map": {}},
                                  skip_noops=False)
@@ -371,23 +401,30 @@ def compile_genesys(model_name,
     if relocation_offsets:
         program.set_relocation_ns_offsets(relocation_offsets)
 
+    if deduplicate_weights and initializers is None:
+        # ONNX initializers are named after the state nodes of the graph, which name the weight operands
+        initializers = load_onnx_initializers(ONNX_MODEL_PATH)
+    if initializers:
+        program.deduplicate_weights(initializers)
+
     if do_compile:
         if tiling_path is not None:
             program.compile(tiling_path=f"{TILING_DIR}/{tiling_path}", verbose=verbose,
-                            finalize_instructions=finalize_instructions)
+                            finalize_instructions=finalize_instructions, workers=workers,
+                            cache_codelets=cache_codelets)
         else:
-            program.compile(verbose=verbose, finalize_instructions=finalize_instructions)
+            program.compile(verbose=verbose, finalize_instructions=finalize_instructions, workers=workers,
+                            cache_codelets=cache_codelets)
 
         if store_tiling:
             program.store_tiling(f"{TILING_DIR}")
 
         if store_json_output:
             out_type = "json" if store_ops else "json_no_ops"
-            res = program.emit(out_type)
 
             if json_output_filename is not None:
                 with open(json_output_filename, "w") as outfile:
-                    json.dump(res, outfile, indent=4)
+                    program.emit_json(outfile, out_type, indent=4)
             else:
                 store_dir = f"{OUT_DIR}/{model_name}_compiled"
                 p = Path(f"{store_dir}.json")
@@ -396,12 +433,18 @@ def compile_genesys(model_name,
                     while Path(f"{store_dir}{count}.json").exists():
                         count += 1
                     with open(f"{store_dir}{count}.json", "w") as outfile:
-                        json.dump(res, outfile, indent=4)
+                        program.emit_json(outfile, out_type, indent=4)
                 else:
                     with open(f"{store_dir}.json", "w") as outfile:
-                        json.dump(res, outfile, indent=4)
+                        program.emit_json(outfile, out_type, indent=4)
     return program
 
+def load_onnx_initializers(model_path):
+    import onnx
+    from onnx import numpy_helper
+    model = onnx.load(model_path)
+    return {init.name: numpy_helper.to_array(init) for init in model.graph.initializer}
+
 def valid_split_stopping_condition(search_space):
     return True
 
@@ -424,6 +467,12 @@ def min_tiles_selection_metric(search_space, permutation):
     else:
         return None
 
+def min_cost_selection_metric(search_space, permutation):
+    # Get valid permutation with the lowest heuristic value, e.g., estimated cycles
+    if len(search_space) == 0:
+        return None
+    return min(search_space, key=search_space.get)
+
 # Number of tiles as tiling heuristc
 def n_tiles_heuristic(permutation):
     n_tiles = 1
@@ -454,7 +503,11 @@ def compile_genesys_layer(layer_file,
                           load_genesys_filename=None,
                           relocation_offsets=None,
                           tiling_search_algorithm='valid_split',
-                          do_compile=True):
+                          do_compile=True,
+                          workers=1,
+                          cache_codelets=False,
+                          tiling_db=None,
+                          tile_search_workers=1):
     LAYER_DIR = f"{benchmark_path}/layers/srdfg"
     OUT_DIR = f"{benchmark_path}/compiler_outputs"
 
@@ -489,10 +542,11 @@ def compile_genesys_layer(layer_file,
         pprint(sizes_cfg)
     mode = "inference"
     program = initialize_program(graph, genesys, mode=mode)
-    program.add_compilation_step("template_layout_pass", template_layout_pass, template=True)
+    program.add_compilation_step("template_layout_pass", template_layout_pass, template=True,
+                                 storage_dependent=False)
 
     program.add_compilation_step("template_pad_pass", template_pad_pass, template=True,
-                                 )
+                                 storage_dependent=False)
 
 
     program.add_compilation_step("update_operand_dtypes", update_operand_dtypes, preproc=True,
@@ -501,22 +555,34 @@ def compile_genesys_layer(layer_file,
     if tiling_search_algorithm == 'min_tiles':
         tile_kwargs = {'factor_fn_name': factor_fn, 'stopping_condition': exhaustive_search_stopping_condition,
                         'selection_metric': min_tiles_selection_metric, 'heuristic_fn': n_tiles_heuristic}
+    elif tiling_search_algorithm == 'min_cycles':
+        tile_kwargs = {'factor_fn_name': factor_fn, 'stopping_condition': exhaustive_search_stopping_condition,
+                        'selection_metric': min_cost_selection_metric, 'heuristic_fn': TilingCostModel()}
+    elif tiling_search_algorithm == 'branch_and_bound':
+        tile_kwargs = {'factor_fn_name': factor_fn, 'stopping_condition': exhaustive_search_stopping_condition,
+                        'selection_metric': min_tiles_selection_metric, 'heuristic_fn': n_tiles_heuristic,
+                       'search_algorithm': 'branch_and_bound'}
     else:
         tile_kwargs = {'factor_fn_name': factor_fn, 'stopping_condition': valid_split_stopping_condition,
                         'selection_metric': current_permutation_selection_metric, 'heuristic_fn': n_tiles_heuristic}
 
-    if store_tiling and store_checkpoint:
-        tile_kwargs['checkpoint_file'] = str(Path(f"{TILING_DIR}/{graph.name}_tiling_info_checkpoint.json").absolute())
+    if store_tiling and store_checkpoint and tiling_db is None:
+        tiling_db = f"{TILING_DIR}/tiling_info.db"
+    if tiling_db is not None:
+        tile_kwargs['tiling_db'] = str(Path(tiling_db).absolute())
+    if tile_search_workers > 1:
+        # Only used when codelets are tiled serially, as stage workers cannot start their own pool
+        tile_kwargs['search_workers'] = tile_search_workers
 
     finalize_instructions = True
     if do_tile_stage:
-        program.add_compilation_step("tile", tile, stage_kwargs=tile_kwargs)
-        program.add_compilation_step("separate_ops", separate_simd_sa_ops)
+        program.add_compilation_step("tile", tile, stage_kwargs=tile_kwargs, parallel=True)
+        program.add_compilation_step("separate_ops", separate_simd_sa_ops, parallel=True)
     else:
         finalize_instructions = False
 
     if do_hoist_stage:
-        program.add_compilation_step("hoist", hoist, dependencies=["tile"])
+        program.add_compilation_step("hoist", hoist, dependencies=["tile"], parallel=True)
         program.add_compilation_step("simd_typecast", add_simd_typecast, dependencies=["hoist"],
                                      stage_kwargs={"dtype_map": {}, "codelet_output_map": {}}, skip_noops=False)
     else:
@@ -528,20 +594,21 @@ def compile_genesys_layer(layer_file,
     if do_compile:
         if tiling_path is not None:
             program.compile(tiling_path=f"{TILING_DIR}/{tiling_path}", verbose=verbose,
-                            finalize_instructions=finalize_instructions)
+                            finalize_instructions=finalize_instructions, workers=workers,
+                            cache_codelets=cache_codelets)
         else:
-            program.compile(verbose=verbose, finalize=finalize_instructions)
+            program.compile(verbose=verbose, finalize=finalize_instructions, workers=workers,
+                            cache_codelets=cache_codelets)
 
         if store_tiling:
             program.store_tiling(f"{TILING_DIR}")
 
         if store_json_output:
             out_type = "json" if store_ops else "json_no_ops"
-            res = program.emit(out_type)
 
             if json_output_filename is not None:
                 with open(json_output_filename, "w") as outfile:
-                    json.dump(res, outfile, indent=4)
+                    program.emit_json(outfile, out_type, indent=4)
             else:
                 store_dir = f"{OUT_DIR}/{layer_file}_compiled"
                 p = Path(f"{store_dir}.json")
@@ -550,10 +617,10 @@ def compile_genesys_layer(layer_file,
                     while Path(f"{store_dir}{count}.json").exists():
                         count += 1
                     with open(f"{store_dir}{count}.json", "w") as outfile:
-                        json.dump(res, outfile, indent=4)
+                        program.emit_json(outfile, out_type, indent=4)
                 else:
                     with open(f"{store_dir}.json", "w") as outfile:
-                        json.dump(res, outfile, indent=4)
+                        program.emit_json(outfile, out_type, indent=4)
     return program
 
 
@@ -610,17 +677,18 @@ def compile_extracted_genesys_layer(model_name,
                 'FUSION_OP_INFO': load_fusion_op_info(def_cfg)}
     program = initialize_program(graph, genesys, metadata=metadata, mode=mode)
     program.add_compilation_step("template_pad_pass", template_pad_pass, template=True,
-                                 dependencies=["template_layout_pass"])
-    program.add_compilation_step("template_layout_pass", template_layout_pass, template=True)
+                                 dependencies=["template_layout_pass"], storage_dependent=False)
+    program.add_compilation_step("template_layout_pass", template_layout_pass, template=True,
+                                 storage_dependent=False)
 
     program.add_compilation_step("update_operand_dtypes", update_operand_dtypes, preproc=True,
                                  stage_kwargs={'dtype_map': dtypes})
     program.add_compilation_step("remove_unused_variables", remove_unused_variables, preproc=True, stage_kwargs={'shaped_nodes': {}})
     tile_kwargs = {'factor_fn_name': factor_fn, 'stopping_condition': valid_split_stopping_condition,
                    'selection_metric': current_permutation_selection_metric, 'heuristic_fn': n_tiles_heuristic}
-    program.add_compilation_step("tile", tile, stage_kwargs=tile_kwargs)
-    program.add_compilation_step("separate_ops", separate_simd_sa_ops)
-    program.add_compilation_step("hoist", hoist, dependencies=["tile"])
+    program.add_compilation_step("tile", tile, stage_kwargs=tile_kwargs, parallel=True)
+    program.add_compilation_step("separate_ops", separate_simd_sa_ops, parallel=True)
+    program.add_compilation_step("hoist", hoist, dependencies=["tile"], parallel=True)
     if relocation_offsets:
         program.set_relocation_ns_offsets(relocation_offsets)
     program.compile(verbose=verbose, sequence_algorithm='filtered', filtered_layers=[layer_name])
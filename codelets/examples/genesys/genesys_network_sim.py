@@ -305,7 +305,9 @@ def compile_full_model(model_name,
                        generate_data=True,
                        tile_method=None,
                        batch_size=1,
-                       graph=None
+                       graph=None,
+                       tiling_db=None,
+                       deduplicate_weights=False
                        ):
 
 
@@ -336,7 +338,9 @@ def compile_full_model(model_name,
                             tiling_search_algorithm=tile_method,
                                     do_compile=False,
                               fuse_layers=fuse_layers,
-                              graph=graph
+                              graph=graph,
+                              tiling_db=tiling_db,
+                              deduplicate_weights=deduplicate_weights
                               )
     if store_compile:
 
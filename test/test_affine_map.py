@@ -0,0 +1,55 @@
+from codelets.adl.operation.operand import AffineIndexMap, DataMovement
+from sympy import Idx, Integer, symbols
+import numpy as np
+import pytest
+
+
+I, J = Idx("i"), Idx("j")
+STRIDE, PAD = symbols("stride pad")
+
+@pytest.mark.parametrize('expr',[
+    3*I + 1,
+    STRIDE*I + J - PAD,
+    2*I + 5*J + 7,
+    Integer(5),
+])
+def test_affine_index_map(expr):
+    values = {I: 3, J: 2, STRIDE: 2, PAD: 1}
+    indices = list(expr.atoms(Idx))
+    params = {p: values[p] for p in expr.free_symbols if p not in indices}
+    affine = AffineIndexMap.from_expr(expr, indices, params)
+    assert affine is not None
+    assert affine.evaluate(values) == expr.subs(values)
+
+    batch_values = {**values, **{i: np.arange(4) for i in indices}}
+    batch_res = np.broadcast_to(affine.evaluate(batch_values), (4,))
+    assert batch_res.tolist() == [expr.subs({**values, **{i: n for i in indices}}) for n in range(4)]
+
+
+@pytest.mark.parametrize('expr',[
+    I*J,
+    I**2 + 1,
+    I/2,
+    STRIDE*I,
+])
+def test_non_affine_index_map(expr):
+    # Products of indices, fractional coefficients and unresolved parameters are left to sympy
+    assert AffineIndexMap.from_expr(expr, list(expr.atoms(Idx)), {}) is None
+
+
+def test_affine_index_map_fallback():
+    dm = DataMovement("DRAM", "IBUF", "data", ["N"], None, {"N": 8}, offset_map={"N": I*J})
+    assert dm.resolve_offset(I*J, {I: 3, J: 2}) == 6
+    assert dm.affine_maps == {(I*J, ()): None}
+
+
+def test_affine_index_map_cache():
+    dm = DataMovement("DRAM", "IBUF", "data", ["N"], None, {"N": 8}, offset_map={"N": STRIDE*I})
+    assert dm.resolve_offset(STRIDE*I, {I: 3, STRIDE: 2}) == 6
+    assert dm.resolve_offset(STRIDE*I, {I: 3, STRIDE: 4}) == 12
+    assert len(dm.affine_maps) == 2
+
+    dm.update_offset_map("N", STRIDE*I - PAD)
+    assert len(dm.affine_maps) == 0
+    assert set(dm.get_symbol_params(STRIDE*I - PAD)) == {STRIDE, PAD}
+    assert dm.resolve_offset(STRIDE*I - PAD, {I: 3, STRIDE: 2, PAD: 1}) == 5
@@ -0,0 +1,506 @@
+from codelets.examples.genesys import compile_genesys, load_config, load_onnx_initializers, DataGen
+from codelets.examples.genesys.data_files import load_array, data_file_index, convert_directory_to_text
+from codelets.examples.genesys.compilation_stages.tiling_db import get_tiling_db
+from codelets.examples.genesys.compilation_stages import tiling_utils
+from codelets.examples.genesys.compilation_stages.cost_model import TilingCostModel
+from codelets.compiler.relocation_table import _GreedyBySizeMemoryAllocator
+from codelets.compiler.program import StreamingJSONWriter
+from codelets.adl.flex_template import flex_template, instruction_buffer
+from codelets.adl import flex_param
+from codelets.adl.flex_param import clear_fn_cache, fn_cache_info
+from tools.benchmark_instructions import run_benchmarks
+from pathlib import Path
+from types import SimpleNamespace
+import polymath as pm
+import pytest
+import numpy as np
+import json
+import io
+
+CWD = Path(f"{__file__}").parent
+BENCH_DIR = Path(f"{CWD}/../benchmarks").absolute()
+MODEL_DIR = f"{BENCH_DIR}/models"
+CFG_PATH = f"{CWD}/../codelets/examples/genesys/configs"
+
+
+def compile_model(model_name, cfg_name="benchmark_16x16.json", cfg_updates=None, **compile_kwargs):
+    arch_config = load_config(f"{CFG_PATH}/{cfg_name}")
+    arch_config.update(cfg_updates or {})
+    graph = pm.from_onnx(f"{MODEL_DIR}/{model_name}.onnx")
+    program = compile_genesys(model_name,
+                              arch_config,
+                              update_cfg_dtypes=False,
+                              tiling_path=None,
+                              store_tiling=False,
+                              store_json_output=False,
+                              verbose=False,
+                              benchmark_path=BENCH_DIR,
+                              factor_fn='default',
+                              print_config=False,
+                              batch_size=arch_config['BATCH_SIZE'],
+                              fuse_layers=arch_config['FUSE_LAYERS'],
+                              graph=graph,
+                              **compile_kwargs)
+    return program
+
+
+@pytest.fixture(scope="module")
+def default_program():
+    # Tests which only read a program compiled with the default options share a single compilation of each model
+    programs = {}
+    def get_program(model_name):
+        if model_name not in programs:
+            programs[model_name] = compile_model(model_name)
+        return programs[model_name]
+    return get_program
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_parallel_compilation(model_name, default_program):
+    serial = default_program(model_name)
+    parallel = compile_model(model_name, workers=4)
+    assert [c.cdlt_uid for c in serial.codelets] == [c.cdlt_uid for c in parallel.codelets]
+    assert serial.emit("operations_idx") == parallel.emit("operations_idx")
+    assert serial.emit("string_final") == parallel.emit("string_final")
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_compilation_cache(model_name, default_program):
+    uncached = default_program(model_name)
+    cached = compile_model(model_name, cache_codelets=True)
+    assert cached.compilation_cache.hits > 0
+    assert uncached.emit("operations_idx") == cached.emit("operations_idx")
+    assert uncached.emit("string_final") == cached.emit("string_final")
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_tiling_db(model_name, tmp_path):
+    db_path = f"{tmp_path}/tiling_info.db"
+    searched = compile_model(model_name, tiling_db=db_path)
+    assert len(get_tiling_db(db_path)) > 0
+    stored = compile_model(model_name, tiling_db=db_path)
+    assert [c.domain_tiling for c in searched.codelets] == [c.domain_tiling for c in stored.codelets]
+    assert searched.emit("string_final") == stored.emit("string_final")
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_batch_split_validation(model_name, monkeypatch):
+    # The level heuristic is evaluated once for every accepted permutation, in search order
+    get_level_heuristic = tiling_utils.get_level_heuristic
+    def compile_recording_accepted(batched):
+        accepted = []
+        def recording_level_heuristic(heuristic_fn, cdlt, hag, tile_info, level):
+            level_heuristic = get_level_heuristic(heuristic_fn, cdlt, hag, tile_info, level)
+            def record(p):
+                accepted.append((cdlt.cdlt_uid, level, p))
+                return level_heuristic(p)
+            return record
+        monkeypatch.setattr(tiling_utils, "get_level_heuristic", recording_level_heuristic)
+        monkeypatch.setattr(tiling_utils, "BATCH_VALIDATION", batched)
+        return compile_model(model_name), accepted
+
+    serial, serial_accepted = compile_recording_accepted(False)
+    batched, batched_accepted = compile_recording_accepted(True)
+    assert len(serial_accepted) > 0
+    assert serial_accepted == batched_accepted
+    assert [c.domain_tiling for c in serial.codelets] == [c.domain_tiling for c in batched.codelets]
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_branch_and_bound_tiling(model_name):
+    exhaustive = compile_model(model_name, tiling_search_algorithm='min_tiles')
+    bnb = compile_model(model_name, tiling_search_algorithm='branch_and_bound')
+    assert [c.domain_tiling for c in exhaustive.codelets] == [c.domain_tiling for c in bnb.codelets]
+    assert sum(c.tiling_search_stats['pruned'] for c in bnb.codelets if not c.is_noop()) > 0
+
+
+def test_tiling_cost_model():
+    # A 48 x 32 x 8 GEMM on a 16 x 16 systolic array, with the loops of the `gemm` codelet
+    loops = {"loop0": ("P", 32), "loop1": ("N", 48), "loop2": ("M", 8)}
+    cdlt = SimpleNamespace(
+        ops=[SimpleNamespace(op_type="compute", target="pe_array", dependencies=list(loops))],
+        op_map={l: SimpleNamespace(op_type="loop", op_str=l, iter_count=n) for l, (_, n) in loops.items()},
+        loop_param_map={l: name for l, (name, _) in loops.items()},
+    )
+    hag = SimpleNamespace(get_subgraph_node=lambda name: SimpleNamespace(dimensions=[16, 16]))
+    tile_info = SimpleNamespace(accesses={1: []}, get_permutation_map=lambda perm: dict(zip(loops, perm)))
+
+    cost_model = TilingCostModel(tile_overhead_cycles=0)
+    # Splitting N in three gives 16-wide tiles, splitting it in two gives 24-wide tiles which need two array passes
+    aligned = cost_model.estimate(cdlt, hag, tile_info, 1, (2, 3, 1))
+    misaligned = cost_model.estimate(cdlt, hag, tile_info, 1, (2, 2, 1))
+    assert aligned.cycles == 2*3*(1*1*8)
+    assert misaligned.cycles == 2*2*(1*2*8)
+    assert misaligned.cycles > aligned.cycles
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+@pytest.mark.parametrize('tiling_search_algorithm',[
+    "valid_split",
+    "min_tiles",
+])
+def test_parallel_tiling_search(model_name, tiling_search_algorithm, monkeypatch):
+    monkeypatch.setattr(tiling_utils, "PARALLEL_SEARCH_MIN_PERMS", 0)
+    serial = compile_model(model_name, tiling_search_algorithm=tiling_search_algorithm)
+    parallel = compile_model(model_name, tiling_search_algorithm=tiling_search_algorithm, tile_search_workers=4)
+    assert [c.domain_tiling for c in serial.codelets] == [c.domain_tiling for c in parallel.codelets]
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_incremental_compilation(model_name):
+    program = compile_model(model_name, cache_codelets=True)
+    obuf = program.hag.get_subgraph_node("OBUF")
+    obuf.depth = obuf.depth // 2
+    program.compile(incremental=True)
+    assert program.compilation_cache.hits > 0
+
+    reference = compile_model(model_name, do_compile=False)
+    reference.hag.get_subgraph_node("OBUF").depth = obuf.depth
+    reference.compile()
+    assert program.emit("string_final") == reference.emit("string_final")
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_compilation_profile(model_name, tmp_path):
+    program = compile_model(model_name, do_compile=False)
+    program.compile(profile=True)
+    totals = program.profiler.stage_totals()
+    assert totals[("stage", "tile")]["permutations"] > 0
+    assert totals[("phase", "finalize_instructions")]["flex_param_evals"] > 0
+
+    trace_path = f"{tmp_path}/trace.json"
+    program.profiler.save_chrome_trace(trace_path)
+    with open(trace_path, "r") as f:
+        trace = json.load(f)
+    assert len([e for e in trace["traceEvents"] if e["ph"] == "X"]) == len(program.profiler)
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_compiled_templates(model_name, monkeypatch, default_program):
+    compiled = default_program(model_name)
+    monkeypatch.setattr(flex_template, "COMPILE_TEMPLATES", False)
+    interpreted = compile_model(model_name)
+    assert compiled.emit("string_final") == interpreted.emit("string_final")
+    assert compiled.emit("decimal") == interpreted.emit("decimal")
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_instruction_buffer(model_name, default_program):
+    program = default_program(model_name)
+    for cdlt in program.codelets:
+        for o in cdlt.ops:
+            for ft in o.instructions:
+                assert len(ft.instructions) == len(list(ft.instructions))
+                assert ft.emit("string_final") == [i.emit("string_final") for i in ft.instructions]
+                assert ft.emit("binary") == [i.emit("binary") for i in ft.instructions]
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_packed_program(model_name, tmp_path, default_program):
+    program = default_program(model_name)
+    words, _ = program.packed_program()
+    assert "\n".join([str(w) for w in words.tolist()]) == program.emit("decimal")
+
+    bin_path = f"{tmp_path}/{model_name}.bin"
+    program.save_packed_program(bin_path)
+    assert np.fromfile(bin_path, dtype="<u4").tolist() == words.tolist()
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_single_pass_emission(model_name, default_program):
+    program = default_program(model_name)
+    output_types = ["operations_idx", "string_final", "decimal", "binary", "json"]
+    streams = {o: io.StringIO() for o in output_types}
+    program.emit_to_streams(streams)
+    for o in output_types[:-1]:
+        assert streams[o].getvalue() == program.emit(o)
+    assert json.loads(streams["json"].getvalue()) == program.emit("json")
+
+    cdlt = [c for c in program.codelets if not c.is_noop()][0]
+    streams = {o: io.StringIO() for o in output_types[:-1]}
+    program.emit_to_streams(streams, cdlt_id=cdlt.instance_id)
+    for o in output_types[:-1]:
+        assert streams[o].getvalue() == program.emit_codelet_as_program(cdlt.instance_id, o)
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+@pytest.mark.parametrize('indent',[None, 4])
+def test_streaming_json(model_name, indent, default_program):
+    program = default_program(model_name)
+    for output_type in ["json", "json_no_ops"]:
+        stream = io.StringIO()
+        program.emit_json(stream, output_type, indent=indent)
+        assert stream.getvalue() == json.dumps(program.emit(output_type), indent=indent)
+
+
+@pytest.mark.parametrize('indent',[None, 2, 4])
+@pytest.mark.parametrize('items',[
+    [],
+    [{"operation": "conv", "instructions": ["SET 0,\n1", "NOP"], "params": {}, "shape": [1, [2, 3]]}],
+    [{"operation": "relu", "instructions": []}, [], {"nested": {"empty": {}, "list": [None, True, 1.5]}}],
+])
+def test_streaming_json_writer(indent, items):
+    stream = io.StringIO()
+    writer = StreamingJSONWriter(stream, "program", indent=indent)
+    for item in items:
+        writer.write(item)
+    writer.close()
+    assert stream.getvalue() == json.dumps({"mode": "program", "program": items}, indent=indent)
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_flex_param_fn_cache(model_name):
+    clear_fn_cache()
+    compile_model(model_name)
+    cache_info = fn_cache_info()
+    assert cache_info["hits"] > cache_info["misses"]
+    assert cache_info["size"] <= flex_param.FN_CACHE_SIZE
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_predicted_instruction_counts(model_name, default_program):
+    predicted = compile_model(model_name, do_compile=False)
+    predicted.compile(predict_instr_counts=True)
+    reference = default_program(model_name)
+    for cdlt in predicted.codelets:
+        if not cdlt.is_noop():
+            assert predicted.predict_cdlt_num_instr(cdlt) == predicted.cdlt_num_instr(cdlt)
+    assert predicted.emit("string_final") == reference.emit("string_final")
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_lazy_field_evaluation(model_name, default_program):
+    program = default_program(model_name)
+    num_lazy_fields = 0
+    for cdlt in program.codelets:
+        for ft, _ in program.codelet_flex_templates(cdlt):
+            for row, f_idx, _ in ft.instructions.lazy_fields:
+                assert ft.instructions.field_values(f_idx)[row] != instruction_buffer.UNSET_VALUE
+            num_lazy_fields += len(ft.instructions.lazy_fields)
+    assert num_lazy_fields > 0
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_program_relocation(model_name, default_program):
+    program = default_program(model_name)
+    assert len(program.relocation_patches()) > 0
+    reloc = program.relocatables
+    layout = {ns: reloc.get_namespace_start(ns) for ns in reloc.mem_layout}
+    original = program.emit("decimal")
+
+    shift = reloc.get_aligned_sized(reloc.get_namespace_size("ACTIVATION"), as_bytes=False)
+    program.relocate({ns: start + shift for ns, start in layout.items()}, offset_type="bits")
+    assert program.emit("decimal") != original
+
+    program.relocate(layout, offset_type="bits")
+    assert program.emit("decimal") == original
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_instruction_benchmarks(model_name, default_program):
+    program = default_program(model_name)
+    reference = program.emit("string_final")
+    results = run_benchmarks(program, rounds=1)
+    assert any([name.startswith("FlexTemplate.evaluate") for name in results])
+    assert any([name.startswith("FlexTemplate.lazy_evaluate") for name in results])
+    assert all([r.min_time > 0 for r in results.values()])
+    assert program.emit("string_final") == reference
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_activation_allocation(model_name, default_program):
+    program = default_program(model_name)
+    reloc = program.relocatables
+    allocator = _GreedyBySizeMemoryAllocator(reloc._dataflow_graph, reloc._operand_name_to_operand_map,
+                                             reloc.get_operand_namespace, reloc.get_aligned_sized)
+    records = allocator._generate_intermediate_tensor_usage_records()
+    offsets = allocator.generate_tensor_offsets()
+    names = list(records.keys())
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            if max(records[a][0], records[b][0]) <= min(records[a][1], records[b][1]):
+                assert offsets[a] + records[a][2] <= offsets[b] or offsets[b] + records[b][2] <= offsets[a]
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+@pytest.mark.parametrize('allocator',[
+    "greedy_by_size",
+    "greedy_by_breadth",
+    "exhaustive",
+])
+def test_dram_allocators(model_name, allocator):
+    program = compile_model(model_name, cfg_updates={"DRAM_ALLOCATOR": allocator})
+    footprint = program.relocatables.memory_footprint()
+    assert footprint["allocator"] == allocator
+    assert footprint["activation"] >= footprint["peak_live_activation"] > 0
+    assert footprint["total"] >= footprint["activation"] + footprint["weight_and_bias"]
+    assert 0 <= footprint["fragmentation"] < 1
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_activation_aliasing(model_name, default_program):
+    program = default_program(model_name)
+    reloc = program.relocatables
+    assert len(reloc.tensor_aliases) > 0
+    activations = reloc.relocatables['ACTIVATION'].bases
+    for alias_name, root_name in reloc.tensor_aliases.items():
+        if alias_name in activations:
+            assert activations[alias_name].start == activations[root_name].start
+
+    unaliased = compile_model(model_name, cfg_updates={"ALIAS_ACTIVATIONS": False})
+    assert len(unaliased.relocatables.tensor_aliases) == 0
+    assert reloc.memory_footprint()["activation"] <= unaliased.relocatables.memory_footprint()["activation"]
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_weight_deduplication(model_name, default_program):
+    program = default_program(model_name)
+    weights = program.relocatables.relocatables['WEIGHT_AND_BIAS'].bases
+    # Weights of the same size are given identical initializers, so each size has a single storage name
+    initializers = {name: np.zeros(fragment.size // 8, dtype=np.int8) for name, fragment in weights.items()}
+
+    deduplicated = compile_model(model_name, initializers=initializers)
+    reloc = deduplicated.relocatables
+    shared_weights = reloc.relocatables['WEIGHT_AND_BIAS'].bases
+    assert set(shared_weights.keys()) == set(weights.keys())
+    layouts = {}
+    for cdlt in deduplicated.codelets:
+        for operand in cdlt.inputs:
+            if operand.node_name in shared_weights:
+                layouts.setdefault(operand.node_name, reloc.weight_layout(cdlt, operand))
+    assert all(reloc.weight_layouts[name] == layout for name, layout in layouts.items())
+
+    # Duplicates share a fragment only when the codelets reading them store them in the same DRAM layout
+    storage_starts = {}
+    start_layouts = {}
+    for name, fragment in shared_weights.items():
+        key = (deduplicated.weight_storage_name(name), layouts[name])
+        assert storage_starts.setdefault(key, fragment.start) == fragment.start
+        assert start_layouts.setdefault(fragment.start, layouts[name]) == layouts[name]
+    assert len(storage_starts) < len(weights)
+    assert reloc.memory_footprint()["weight_and_bias"] < program.relocatables.memory_footprint()["weight_and_bias"]
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_onnx_weight_deduplication(model_name, default_program):
+    initializers = load_onnx_initializers(f"{MODEL_DIR}/{model_name}.onnx")
+    program = default_program(model_name)
+    weights = program.relocatables.relocatables['WEIGHT_AND_BIAS'].bases
+    # Duplicates are found by initializer name, so every weight operand must be named after its initializer
+    assert len(weights) > 0
+    assert set(weights.keys()) <= set(initializers.keys())
+
+    deduplicated = compile_model(model_name, deduplicate_weights=True)
+    for name, data in initializers.items():
+        storage_name = deduplicated.weight_storage_name(name)
+        assert np.array_equal(data, initializers[storage_name]) and data.dtype == initializers[storage_name].dtype
+    shared_weights = deduplicated.relocatables.relocatables['WEIGHT_AND_BIAS'].bases
+    layouts = deduplicated.relocatables.weight_layouts
+    storage_starts = {}
+    for name, fragment in shared_weights.items():
+        storage_name = deduplicated.weight_storage_name(name)
+        if storage_starts.setdefault((storage_name, layouts[name]), fragment.start) != fragment.start:
+            pytest.fail(f"Weight {name} is not stored with its duplicates in {storage_name}")
+    assert deduplicated.relocatables.memory_footprint()["weight_and_bias"] <= \
+           program.relocatables.memory_footprint()["weight_and_bias"]
+
+
+@pytest.mark.parametrize('model_name',[
+    "resnet18",
+    # "resnet50",
+])
+def test_binary_datagen(model_name, tmp_path, default_program):
+    program = default_program(model_name)
+    dgen = DataGen(program, single_codelets=True, generate_data=True, output_types=["string_final"],
+                   out_path=str(tmp_path), identifier="npy", data_format="npy")
+    dgen.generate()
+    data_files = sorted(tmp_path.rglob("*.npy"))
+    assert len(data_files) > 0
+    assert len(list(tmp_path.rglob("data/*.txt"))) == 0
+    for path in data_files:
+        index = data_file_index(path)
+        data = load_array(path)
+        assert isinstance(data, np.memmap)
+        assert list(data.shape) == index["shape"] and data.dtype.str == index["dtype"]
+        raw = np.memmap(path, dtype=index["dtype"], mode='r', offset=index["offset"], shape=tuple(index["shape"]))
+        assert np.array_equal(raw, data)
+
+    # Operands stored in a directory are indexed by the unformatted file named after the operand
+    for locations_path in tmp_path.rglob("data_locations.json"):
+        with open(locations_path, "r") as f:
+            locations = json.load(f)
+        for node_name, info in locations.items():
+            path = f"{info['path']}{node_name}.npy" if info['path'].endswith("/") else info['path']
+            assert info['data'] == data_file_index(path)
+
+    for path in convert_directory_to_text(tmp_path):
+        assert np.array_equal(load_array(path).flatten(), load_array(f"{path[:-len('.txt')]}.npy").flatten())
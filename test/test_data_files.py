@@ -0,0 +1,39 @@
+from codelets.examples.genesys.data_files import save_array, load_array, data_file_index, convert_to_text
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('dtype',[np.int8, np.int32, np.dtype('>i4')])
+def test_npy_data_file(dtype, tmp_path):
+    data = np.arange(-12, 12).reshape(2, 3, 4).astype(dtype)
+    path = f"{tmp_path}/data.npy"
+    save_array(path, data)
+
+    loaded = load_array(path)
+    assert isinstance(loaded, np.memmap)
+    assert np.array_equal(loaded, data)
+    assert loaded.dtype.byteorder in ['<', '|', '=']
+
+    # The index locates the raw array data without parsing the file header
+    index = data_file_index(path)
+    assert index["format"] == "npy" and index["shape"] == [2, 3, 4]
+    raw = np.memmap(path, dtype=index["dtype"], mode='r', offset=index["offset"], shape=tuple(index["shape"]))
+    assert np.array_equal(raw, data)
+
+
+def test_text_data_file(tmp_path):
+    data = np.arange(-6, 6).reshape(3, 4)
+    path = f"{tmp_path}/data.txt"
+    save_array(path, data)
+    assert data_file_index(path) == {"format": "text"}
+    assert np.array_equal(load_array(path, shape=(3, 4)), data)
+    assert load_array(path).shape == (12,)
+
+
+def test_convert_to_text(tmp_path):
+    data = np.arange(10, dtype=np.int16).reshape(2, 5)
+    path = f"{tmp_path}/data.npy"
+    save_array(path, data)
+    text_path = convert_to_text(path)
+    assert text_path == f"{tmp_path}/data.txt"
+    assert np.array_equal(load_array(text_path, shape=(2, 5)), data)
@@ -0,0 +1,115 @@
+from codelets.adl.flex_template import FlexTemplate, Instruction, Field
+from codelets.adl.flex_template import flex_template
+from codelets.adl.flex_template.instruction_buffer import InstructionBuffer, format_words
+from codelets.adl.flex_template.template_compiler import get_compiled_template
+from codelets.adl import flex_param
+from codelets.adl.flex_param import FlexParam, clear_fn_cache, fn_cache_info
+from types import SimpleNamespace
+import pytest
+
+PROGRAM = SimpleNamespace(relocatables=None)
+
+
+def program_template(param_fn):
+    instr = Instruction("NOP", 0, 4, [Field("A", 8)])
+    instr.set_field_flex_param("A", param_fn, "program")
+    return FlexTemplate(instr, template_type="program")
+
+
+def test_compiled_template_error():
+    template = program_template("1 // 0")
+    assert get_compiled_template(template) is not None
+    # The interpreted evaluation reports the failing FlexParam
+    with pytest.raises(RuntimeError, match="1 // 0"):
+        template.evaluate(PROGRAM, None, -1, -1)
+
+
+def test_compiled_template_mismatch(monkeypatch):
+    # A compiled template which fails where the interpreter succeeds is reported instead of falling back
+    def failing_template(fn_args):
+        raise ValueError("Invalid compiled template")
+    monkeypatch.setattr(flex_template, "get_compiled_template", lambda template: failing_template)
+    template = program_template("3 + 4")
+    with pytest.raises(RuntimeError) as excinfo:
+        template.evaluate(PROGRAM, None, -1, -1)
+    assert isinstance(excinfo.value.__cause__, ValueError)
+
+
+def test_uncompiled_template(monkeypatch):
+    monkeypatch.setattr(flex_template, "get_compiled_template", lambda template: None)
+    template = program_template("3 + 4")
+    template.evaluate(PROGRAM, None, -1, -1)
+    assert template.emit("string_final") == ["NOP 7"]
+
+
+def base_instructions():
+    load = Instruction("LD", 3, 4, [Field("BUF", 2, value_names={"IBUF": 0, "WBUF": 1, "OBUF": 2}), Field("ADDR", 10)])
+    store = Instruction("ST", 5, 4, [Field("ADDR", 12)])
+    return [load, store]
+
+
+def evaluated_instructions(base):
+    instructions = []
+    for base_idx, values in [(0, ("WBUF", 17)), (1, (1000,)), (0, ("OBUF", 1023)), (1, (0,))]:
+        instr = base[base_idx].instruction_copy()
+        for f, v in zip(instr.fields, values):
+            if isinstance(v, str):
+                f.set_value_by_string(v)
+            else:
+                f.value = v
+        instr.set_tabs(base_idx)
+        instructions.append((base_idx, instr))
+    return instructions
+
+
+def test_instruction_buffer():
+    base = base_instructions()
+    instructions = evaluated_instructions(base)
+    buffer = InstructionBuffer(base)
+    for base_idx, instr in instructions:
+        buffer.append(base_idx, instr)
+
+    assert len(buffer) == len(instructions)
+    assert buffer[-1].emit("string_final") == instructions[-1][1].emit("string_final")
+    for output_type in ["string_final", "binary", "decimal"]:
+        expected = [instr.emit(output_type) for _, instr in instructions]
+        assert [instr.emit(output_type) for instr in buffer] == expected
+        assert buffer.emit(output_type) == expected
+
+
+def test_instruction_buffer_words():
+    base = base_instructions()
+    instructions = evaluated_instructions(base)
+    buffer = InstructionBuffer(base)
+    for base_idx, instr in instructions:
+        buffer.append(base_idx, instr)
+
+    words = buffer.words()
+    assert words.tolist() == [int(instr.emit("binary"), 2) for _, instr in instructions]
+    for output_type in ["binary", "decimal"]:
+        assert format_words(words, buffer.instr_lengths(), output_type) == \
+               [instr.emit(output_type) for _, instr in instructions]
+
+    unset = base[1].instruction_copy()
+    unset.set_tabs(0)
+    buffer.append(1, unset)
+    with pytest.raises(RuntimeError):
+        buffer.words()
+
+
+def test_flex_param_fn_cache(monkeypatch):
+    clear_fn_cache()
+    first = FlexParam("first", ["size"], "size*2")
+    second = FlexParam("second", ["size"], "size*2")
+    assert first.fn is second.fn
+    assert second.evaluate_fn(3) == 6
+    assert fn_cache_info()["hits"] == 1 and fn_cache_info()["misses"] == 1
+
+    monkeypatch.setattr(flex_param, "FN_CACHE_SIZE", 2)
+    for i in range(4):
+        FlexParam(f"param{i}", ["size"], f"size + {i}")
+    assert fn_cache_info()["size"] == 2
+    # The least recently used function was evicted, so it is compiled again
+    third = FlexParam("third", ["size"], "size*2")
+    assert third.fn is not first.fn
+    assert fn_cache_info()["misses"] == 6
@@ -0,0 +1,140 @@
+from codelets.compiler.relocation_table import EndToEndRelocationTable, DRAM_ALLOCATORS, _DataflowGraph, \
+    _DataflowGraphNode, _GreedyBySizeMemoryAllocator, _ExhaustiveMemoryAllocator
+from types import SimpleNamespace
+import pytest
+
+
+def relocation_table():
+    reloc = EndToEndRelocationTable(SimpleNamespace(name="DRAM"), addr_alignment=64)
+    reloc.update_relocation_offset("ACTIVATION", "input", 96, offset=0)
+    reloc.update_relocation_offset("ACTIVATION", "output", 64, offset=128)
+    reloc.update_relocation_offset("WEIGHT_AND_BIAS", "weight", 200)
+    reloc.update_relocation_offset("WEIGHT_AND_BIAS", "bias", 32)
+    return reloc
+
+
+def test_relocate_namespace():
+    reloc = relocation_table()
+    reloc.relocate_namespace("WEIGHT_AND_BIAS", 512)
+    weights = reloc.relocatables["WEIGHT_AND_BIAS"].bases
+    assert [(f.start, f.end) for f in weights.values()] == [(512, 768), (768, 832)]
+    assert reloc.get_namespace_start("WEIGHT_AND_BIAS") == 512
+
+    # Moving a namespace back restores the fragments, and activations are not moved
+    reloc.relocate_namespace("WEIGHT_AND_BIAS", 0)
+    assert [(f.start, f.end) for f in weights.values()] == [(0, 256), (256, 320)]
+    assert reloc.get_namespace_start("ACTIVATION") == 0
+    assert reloc.get_relocation("ACTIVATION", "output").start == 128
+
+    with pytest.raises(RuntimeError):
+        reloc.relocate_namespace("ACTIVATION", 100)
+
+
+def test_namespace_overlaps():
+    reloc = relocation_table()
+    with pytest.raises(RuntimeError):
+        reloc.check_namespace_overlaps()
+    reloc.relocate_namespace("WEIGHT_AND_BIAS", 256)
+    reloc.check_namespace_overlaps()
+
+
+def allocate(allocator_cls, usage_records, fixed_offsets=None):
+    allocator = allocator_cls(_DataflowGraph(), {}, None, None)
+    offsets = {name: None for name in usage_records}
+    offsets.update(fixed_offsets or {})
+    allocator._allocate_intermediate_tensors(dict(usage_records), offsets)
+    return offsets
+
+
+def assert_no_overlaps(usage_records, offsets):
+    names = list(usage_records)
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            if max(usage_records[a][0], usage_records[b][0]) <= min(usage_records[a][1], usage_records[b][1]):
+                assert offsets[a] + usage_records[a][2] <= offsets[b] or offsets[b] + usage_records[b][2] <= offsets[a]
+
+
+# Usage records are (first layer, last layer, size). The fixed tensors are allocated in the opposite order of their
+# offsets, leaving a 100 wide gap between them which is only found by comparing neighbours in offset order.
+USAGE_RECORDS = {
+    "input_b": (0, 3, 50),
+    "input_a": (0, 3, 100),
+    "x": (0, 3, 80),
+    "y": (1, 2, 120),
+    "z": (4, 5, 120),
+}
+FIXED_OFFSETS = {"input_b": 200, "input_a": 0}
+
+
+def test_greedy_by_size_allocation():
+    offsets = allocate(_GreedyBySizeMemoryAllocator, USAGE_RECORDS, FIXED_OFFSETS)
+    # y does not fit between the inputs, x does, and z is not live at the same time as any other tensor
+    assert offsets == {"input_b": 200, "input_a": 0, "x": 100, "y": 250, "z": 0}
+    assert_no_overlaps(USAGE_RECORDS, offsets)
+
+
+@pytest.mark.parametrize('allocator',list(DRAM_ALLOCATORS.keys()))
+def test_allocators(allocator):
+    offsets = allocate(DRAM_ALLOCATORS[allocator], USAGE_RECORDS, FIXED_OFFSETS)
+    assert all(offsets[name] == offset for name, offset in FIXED_OFFSETS.items())
+    assert all(offset is not None for offset in offsets.values())
+    assert_no_overlaps(USAGE_RECORDS, offsets)
+
+
+def test_exhaustive_allocation():
+    # Greedy-by-size places t1 and t2 at offset 0, which leaves no room for t3 below t0. The optimum is the peak
+    # size of the live tensors, 8 at layer 1.
+    usage_records = {"t0": (1, 2, 2), "t1": (2, 2, 5), "t2": (1, 1, 4), "t3": (1, 1, 2)}
+    greedy = allocate(_GreedyBySizeMemoryAllocator, usage_records)
+    exhaustive = allocate(_ExhaustiveMemoryAllocator, usage_records)
+    assert max(greedy[n] + usage_records[n][2] for n in usage_records) == 9
+    assert max(exhaustive[n] + usage_records[n][2] for n in usage_records) == 8
+    assert_no_overlaps(usage_records, exhaustive)
+
+
+def test_exhaustive_allocation_limit(monkeypatch):
+    # Graphs with more than MAX_TENSORS unallocated tensors use the greedy-by-size allocation
+    usage_records = {"t0": (1, 2, 2), "t1": (2, 2, 5), "t2": (1, 1, 4), "t3": (1, 1, 2)}
+    monkeypatch.setattr(_ExhaustiveMemoryAllocator, "MAX_TENSORS", 3)
+    assert allocate(_ExhaustiveMemoryAllocator, usage_records) == allocate(_GreedyBySizeMemoryAllocator, usage_records)
+
+
+INT8 = SimpleNamespace(bits=lambda: 8)
+
+
+def codelet(ic_tile, loop_order=("OC", "IC")):
+    return SimpleNamespace(op_name="gemm", param_tiling={1: {"IC": ic_tile, "OC": 16}},
+                           get_loop_order=lambda: list(loop_order))
+
+
+def weight_offsets(weight_codelets, storage_names):
+    # Each layer reads the previous layer's output and a 16x16 weight, stored in the layout of the given codelet
+    reloc = EndToEndRelocationTable(SimpleNamespace(name="DRAM"), addr_alignment=64)
+    for i, (name, cdlt) in enumerate(weight_codelets.items()):
+        activation = SimpleNamespace(name="data", shape=(1, 16), dtype=INT8)
+        weight = SimpleNamespace(name="weight", shape=(16, 16), dtype=INT8)
+        reloc._dataflow_graph.append_node(_DataflowGraphNode(f"layer{i}"),
+                                          [(f"x{i}", activation, i > 0), (name, weight, False)],
+                                          [(f"x{i + 1}", activation)])
+        for operand_name, operand, namespace in [(f"x{i}", activation, "ACTIVATION"), (f"x{i + 1}", activation, "ACTIVATION"),
+                                                 (name, weight, "WEIGHT_AND_BIAS")]:
+            reloc._operand_name_to_operand_map[operand_name] = operand
+            reloc._operand_to_operand_location_map[id(operand)] = namespace
+        reloc.weight_layouts[name] = reloc.weight_layout(cdlt, weight)
+    for name, storage_name in storage_names.items():
+        reloc.add_weight_duplicate(name, storage_name)
+    reloc._update_weight_and_bias_relocation_offsets()
+    return {name: fragment.start for name, fragment in reloc.relocatables["WEIGHT_AND_BIAS"].bases.items()}
+
+
+def test_weight_layout_deduplication():
+    # The same initializer is read by codelets with different DRAM tilings and loop orders, which store it in
+    # different layouts. Only w2 is stored in the same layout as w0.
+    weight_codelets = {"w0": codelet(16), "w1": codelet(8), "w2": codelet(16), "w3": codelet(16, ("IC", "OC"))}
+    duplicates = {"w1": "w0", "w2": "w0", "w3": "w0"}
+    offsets = weight_offsets(weight_codelets, duplicates)
+    assert offsets["w2"] == offsets["w0"]
+    assert len({offsets["w0"], offsets["w1"], offsets["w3"]}) == 3
+
+    # Without duplicates, every weight is stored separately
+    assert len(set(weight_offsets(weight_codelets, {}).values())) == 4
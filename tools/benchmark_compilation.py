@@ -162,7 +162,11 @@ def compile_benchmark(model_name,
                       check_layer_count=False,
                       conv_tile_constraints=None,
                       simd_only=False,
-                      dir_ext=None
+                      dir_ext=None,
+                      workers=1,
+                      cache_codelets=False,
+                      tiling_db=None,
+                      profile_path=None
                       ):
     arch_config = load_config(f"{CWD}/../codelets/examples/genesys/configs/{cfg_name}")
     if dir_ext is None:
@@ -192,7 +196,8 @@ def compile_benchmark(model_name,
                                  fuse_layers=arch_config['FUSE_LAYERS'],
                                  generate_data=False,
                                     graph=graph,
-                                    batch_size=arch_config['BATCH_SIZE'])
+                                    batch_size=arch_config['BATCH_SIZE'],
+                                    tiling_db=tiling_db)
 
     if conv_tile_constraints is not None:
         conv_layers = ["conv_bias", "conv_bias_add_relu", "conv_bias_relu"]
@@ -209,40 +214,44 @@ def compile_benchmark(model_name,
             print(f"Compiling {model_name} without quantization, only systolic layers.")
         assert not arch_config['USE_QUANTIZATION']
         systolic_layers = ["conv_bias", "gemm", "gemm_no_bias", "conv"]
-        program.filtered_compile(verbose=verbose, finalize=True, filter_op_types=systolic_layers)
+        program.filtered_compile(verbose=verbose, finalize=True, workers=workers, cache_codelets=cache_codelets, profile=profile_path is not None, filter_op_types=systolic_layers)
     elif skip_broken_layers:
         if verbose:
             print(f"Compiling {model_name} without broken layers.")
         assert 'fused_skipped' in BENCHMARK_INFO[model_name] and arch_config['FUSE_LAYERS']
         all_layers = [i for i in range(num_layers) if i not in BENCHMARK_INFO[model_name]['fused_skipped']]
-        program.filtered_compile(all_layers, verbose=verbose, finalize=True, filter_op_types=filter_op_types)
+        program.filtered_compile(all_layers, verbose=verbose, finalize=True, workers=workers, cache_codelets=cache_codelets, profile=profile_path is not None, filter_op_types=filter_op_types)
     elif filtered_layers:
         assert skip_layers is None
         assert isinstance(filtered_layers, list)
-        program.filtered_compile(filtered_layers, verbose=verbose, finalize=True, filter_op_types=filter_op_types)
+        program.filtered_compile(filtered_layers, verbose=verbose, finalize=True, workers=workers, cache_codelets=cache_codelets, profile=profile_path is not None, filter_op_types=filter_op_types)
     elif skip_layers:
         assert filtered_layers is None
         skip_layers = [skip_layer if skip_layer >= 0 else num_layers + skip_layer for skip_layer in skip_layers]
         all_layers = [i for i in range(num_layers) if i not in skip_layers]
-        program.filtered_compile(all_layers, verbose=verbose, finalize=True, filter_op_types=filter_op_types)
+        program.filtered_compile(all_layers, verbose=verbose, finalize=True, workers=workers, cache_codelets=cache_codelets, profile=profile_path is not None, filter_op_types=filter_op_types)
     elif filter_op_types:
         if verbose:
             print(f"Performing full compilation of {model_name} for layers {filter_op_types}.")
-        program.filtered_compile(verbose=verbose, finalize=True, filter_op_types=filter_op_types)
+        program.filtered_compile(verbose=verbose, finalize=True, workers=workers, cache_codelets=cache_codelets, profile=profile_path is not None, filter_op_types=filter_op_types)
     elif skip_op_types:
         assert isinstance(skip_op_types, list)
         if verbose:
             print(f"Performing full compilation of {model_name}, skipping layers {skip_op_types}.")
         if simd_only:
             skip_op_types += ["conv_bias", "gemm", "gemm_no_bias", "conv"]
-        program.filtered_compile(verbose=verbose, finalize=True, skip_op_types=skip_op_types)
+        program.filtered_compile(verbose=verbose, finalize=True, workers=workers, cache_codelets=cache_codelets, profile=profile_path is not None, skip_op_types=skip_op_types)
     else:
         if verbose:
             print(f"Performing full compilation of {model_name}.")
-        program.compile(verbose=verbose, finalize=True, stop_stage=stop_stage)
+        program.compile(verbose=verbose, finalize=True, workers=workers, cache_codelets=cache_codelets, profile=profile_path is not None, stop_stage=stop_stage)
         if check_layer_count:
             check_fused_layer_count(model_path, program)
 
+    if profile_path is not None:
+        program.profiler.save_chrome_trace(profile_path)
+        print(f"{model_name} compilation profile, trace stored at {profile_path}:\n{program.profiler.summary()}")
+
     # cdlt = program.codelets[0]
     # for o in cdlt.all_operands:
     #     print(f"{o.name} - {o.data_moves[0].src_node} - {o.data_moves[0].op_name}")
@@ -542,6 +551,9 @@ if __name__ == "__main__":
         argparser.add_argument('-v', '--verbose', action='store_true', help='Use verbose compilation output')
 
         argparser.add_argument('-e', '--extension', type=str, default="0", help="Apply an extension to the compilation output directory name.")
+
+        argparser.add_argument('-p', '--profile', type=str, default=None,
+                               help='Profile compilation, storing a Chrome trace at this path.')
         args = argparser.parse_args()
 
         fname = args.model
@@ -561,7 +573,8 @@ if __name__ == "__main__":
                           skip_op_types=["unsqueeze", "concat5d"],
                           verbose=verbose,
                           skip_broken_layers=False,
-                          identifier=extension)
+                          identifier=extension,
+                          profile_path=args.profile)
     else:
         # run_micro_tutorial_2023_systolic_size_sweep_variable_memory_depth_benchmarks()
         # run_micro_tutorial_2023_systolic_array_size_sweep_fusion_on_off()
@@ -0,0 +1,230 @@
+import argparse
+import json
+import sys
+import tracemalloc
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import polymath as pm
+
+from codelets.examples.genesys import compile_genesys, load_config
+
+CWD = Path(f"{Path(__file__).parent}")
+BENCH_DIR = Path(f"{CWD}/../benchmarks").absolute()
+MODEL_DIR = f"{BENCH_DIR}/models"
+CFG_PATH = f"{CWD}/../codelets/examples/genesys/configs"
+
+INSTRUCTION_OUTPUT_TYPES = ["string_final", "string_placeholders", "decimal", "binary"]
+PROGRAM_OUTPUT_TYPES = ["operations_idx", "string_final", "decimal", "binary", "json"]
+DEFAULT_ROUNDS = 5
+# Slowdown relative to a baseline which is reported as a regression
+DEFAULT_TOLERANCE = 0.2
+
+
+@dataclass
+class BenchmarkCase:
+    name: str
+    fn: Callable
+    # Number of items (e.g., instructions or templates) processed by each call
+    num_items: int
+    setup: Callable = field(default=None)
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    num_items: int
+    min_time: float
+    mean_time: float
+    peak_kib: float
+    allocated_blocks: int
+
+    @property
+    def ops_per_sec(self) -> float:
+        return self.num_items / self.min_time if self.min_time > 0 else float("inf")
+
+    def to_json(self) -> Dict:
+        return {"num_items": self.num_items, "min_time": self.min_time, "mean_time": self.mean_time,
+                "ops_per_sec": self.ops_per_sec, "peak_kib": self.peak_kib,
+                "allocated_blocks": self.allocated_blocks}
+
+
+def compile_benchmark_program(model_name, cfg_name="benchmark_16x16.json"):
+    arch_config = load_config(f"{CFG_PATH}/{cfg_name}")
+    graph = pm.from_onnx(f"{MODEL_DIR}/{model_name}.onnx")
+    program = compile_genesys(model_name,
+                              arch_config,
+                              update_cfg_dtypes=False,
+                              tiling_path=None,
+                              store_tiling=False,
+                              store_json_output=False,
+                              verbose=False,
+                              benchmark_path=BENCH_DIR,
+                              factor_fn='default',
+                              print_config=False,
+                              batch_size=arch_config['BATCH_SIZE'],
+                              fuse_layers=arch_config['FUSE_LAYERS'],
+                              graph=graph)
+    return program
+
+
+def template_group(op) -> str:
+    # Name of the instruction_templates module which generates the templates for an operation
+    if op.op_type == "compute":
+        return "simd_compute" if op.target == "SIMD" else "sa_compute"
+    elif op.op_type == "transfer":
+        return "simd_transfers" if any(["VMEM" in p for p in op.path]) else "sa_transfers"
+    elif op.op_type in ["loop", "loop_end"]:
+        return "loops"
+    return "config"
+
+
+def collect_templates(program):
+    # Finalized op templates of all codelets, grouped by template module, with their evaluation arguments
+    groups = defaultdict(list)
+    for cdlt in program.codelets:
+        if cdlt.is_noop():
+            continue
+        for o in cdlt.ops:
+            args = (program, program.hag, o.global_op_id, cdlt.instance_id)
+            groups[template_group(o)] += [(ft, args) for ft in o.instructions]
+        groups["start_end"] += [(ft, args) for ft, args in program.codelet_flex_templates(cdlt)
+                                if ft.template_type == "codelet"]
+    return groups
+
+
+def evaluate_case(name, templates) -> BenchmarkCase:
+    copies = []
+
+    def setup():
+        copies.clear()
+        copies.extend([(ft.template_copy(), args) for ft, args in templates])
+
+    def run():
+        for ft, args in copies:
+            ft.evaluate(*args)
+
+    return BenchmarkCase(f"FlexTemplate.evaluate[{name}]", run, sum([len(ft.instructions) for ft, _ in templates]),
+                         setup=setup)
+
+
+def lazy_evaluate_case(name, templates) -> BenchmarkCase:
+    # Lazy fields are overwritten with the same values, so the finalized templates are used directly
+    def run():
+        for ft, args in templates:
+            ft.lazy_evaluate(*args)
+
+    return BenchmarkCase(f"FlexTemplate.lazy_evaluate[{name}]", run,
+                         sum([len(ft.instructions.lazy_fields) for ft, _ in templates]))
+
+
+def instruction_emit_case(output_type, instructions) -> BenchmarkCase:
+    def run():
+        for instr in instructions:
+            instr.emit(output_type)
+
+    return BenchmarkCase(f"Instruction.emit[{output_type}]", run, len(instructions))
+
+
+def program_emit_case(output_type, program, num_instructions) -> BenchmarkCase:
+    return BenchmarkCase(f"CodeletProgram.emit[{output_type}]", lambda: program.emit(output_type), num_instructions)
+
+
+def create_benchmark_cases(program) -> List[BenchmarkCase]:
+    groups = collect_templates(program)
+    cases = []
+    for name, templates in sorted(groups.items()):
+        cases.append(evaluate_case(name, templates))
+        if any([len(ft.instructions.lazy_fields) > 0 for ft, _ in templates]):
+            cases.append(lazy_evaluate_case(name, templates))
+
+    instructions = [instr for templates in groups.values() for ft, _ in templates for instr in ft.instructions]
+    for output_type in INSTRUCTION_OUTPUT_TYPES:
+        cases.append(instruction_emit_case(output_type, instructions))
+
+    for output_type in PROGRAM_OUTPUT_TYPES:
+        cases.append(program_emit_case(output_type, program, len(instructions)))
+    return cases
+
+
+def run_case(case: BenchmarkCase, rounds=DEFAULT_ROUNDS) -> BenchmarkResult:
+    times = []
+    for _ in range(rounds):
+        if case.setup is not None:
+            case.setup()
+        start = perf_counter()
+        case.fn()
+        times.append(perf_counter() - start)
+
+    # Allocations are measured in a separate round, as tracing slows down execution
+    if case.setup is not None:
+        case.setup()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    case.fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated_blocks = sum([s.count_diff for s in after.compare_to(before, "filename")])
+    return BenchmarkResult(case.name, case.num_items, min(times), sum(times) / len(times), peak / 1024,
+                           allocated_blocks)
+
+
+def run_benchmarks(program, rounds=DEFAULT_ROUNDS, name_filter=None, verbose=False) -> Dict[str, BenchmarkResult]:
+    results = {}
+    for case in create_benchmark_cases(program):
+        if name_filter is not None and name_filter not in case.name:
+            continue
+        results[case.name] = run_case(case, rounds=rounds)
+        if verbose:
+            print(format_result(results[case.name]))
+    return results
+
+
+def format_result(result: BenchmarkResult) -> str:
+    return f"{result.name:<48} {result.ops_per_sec:>14.1f} ops/s {result.min_time*1000:>10.3f} ms " \
+           f"{result.peak_kib:>10.1f} KiB {result.allocated_blocks:>8} blocks"
+
+
+def find_regressions(results: Dict[str, BenchmarkResult], baseline: Dict[str, Dict],
+                     tolerance=DEFAULT_TOLERANCE) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base_ops = baseline[name]["ops_per_sec"]
+        if result.ops_per_sec < base_ops * (1 - tolerance):
+            regressions.append(f"{name}: {result.ops_per_sec:.1f} ops/s, baseline {base_ops:.1f} ops/s")
+    return regressions
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='FlexTemplate and Instruction emission benchmarks')
+    argparser.add_argument('-m', '--model', default="resnet18", help='Name of the onnx model to compile.')
+    argparser.add_argument('-c', '--config', default="benchmark_16x16.json",
+                           help='Name of the architecture config file to use.')
+    argparser.add_argument('-r', '--rounds', type=int, default=DEFAULT_ROUNDS, help='Timed rounds for each case.')
+    argparser.add_argument('-k', '--filter', type=str, default=None, help='Only run cases containing this string.')
+    argparser.add_argument('-o', '--output', type=str, default=None, help='Store results as JSON.')
+    argparser.add_argument('-b', '--baseline', type=str, default=None,
+                           help='JSON results to compare against. Regressions exit with a non-zero status.')
+    argparser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                           help='Allowed slowdown relative to the baseline.')
+    args = argparser.parse_args()
+
+    program = compile_benchmark_program(args.model, cfg_name=args.config)
+    results = run_benchmarks(program, rounds=args.rounds, name_filter=args.filter, verbose=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({name: r.to_json() for name, r in results.items()}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = find_regressions(results, json.load(f), tolerance=args.tolerance)
+        if len(regressions) > 0:
+            print(f"Regressions:\n" + "\n".join(regressions))
+            sys.exit(1)
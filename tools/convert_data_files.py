@@ -0,0 +1,10 @@
+import argparse
+
+from codelets.examples.genesys.data_files import convert_directory_to_text
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='Convert binary datagen outputs to one-value-per-line text files')
+    argparser.add_argument('data_dir', type=str, help='Directory containing .npy data files.')
+    argparser.add_argument('-v', '--verbose', action='store_true', help='Print each converted file.')
+    args = argparser.parse_args()
+    convert_directory_to_text(args.data_dir, verbose=args.verbose)